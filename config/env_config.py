@@ -1,5 +1,6 @@
 from functools import lru_cache
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv 
 
@@ -20,6 +21,14 @@ class EnvironmentSettings(BaseSettings):
     DB_PORT: int
     DB_USERNAME: str
     DB_PASSWORD: str
+    DB_POOL_MIN_SIZE: int = 1
+    DB_POOL_MAX_SIZE: int = 20
+    DB_POOL_MAX_LIFETIME: float = 1800.0
+    DB_POOL_TIMEOUT: float = 30.0
+    ENRICHMENT_PROCESSES: int = 0  # 0 = enriquecimiento en los propios hilos de los workers
+    RECURRING_CRAWL: bool = False  # True = el supervisor re-rastrea cada provincia según su ritmo de cambios
+    COORDINATE_CACHE_SIZE: int = 200_000  # Coordenadas distintas memorizadas (distancias a POI y municipio)
+    COORDINATE_CACHE_PATH: Optional[str] = None  # Si se da, la caché de coordenadas persiste entre ejecuciones
 
     model_config = SettingsConfigDict()
 
@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Optional, Union, Tuple, Any
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from database.postgresqldb import PostgreSQLDB, _SCHEMA_QUERY, _schemas, _schemas_lock, _tables_from_rows
+
+logger = logging.getLogger(__name__)
+
+# Un pool asíncrono por cadena de conexión; se abre dentro del bucle de eventos que lo usa
+_async_pools: Dict[str, AsyncConnectionPool] = {}
+_async_pools_lock = asyncio.Lock()
+_cursor_ids = itertools.count()  # Nombres únicos para los cursores de servidor de select_iter
+
+async def _get_async_pool(conninfo: str, min_size: int, max_size: int, max_lifetime: float, timeout: float) -> AsyncConnectionPool:
+    pool = _async_pools.get(conninfo)
+    if pool is None:
+        async with _async_pools_lock:
+            pool = _async_pools.get(conninfo)
+            if pool is None:
+                pool = AsyncConnectionPool(
+                    conninfo,
+                    min_size=min_size,
+                    max_size=max_size,
+                    max_lifetime=max_lifetime,
+                    timeout=timeout,
+                    kwargs={'row_factory': dict_row},
+                    check=AsyncConnectionPool.check_connection,
+                    name=f"async-postgresqldb-{len(_async_pools)}",
+                    open=False
+                )
+                await pool.open()
+                _async_pools[conninfo] = pool
+    return pool
+
+async def close_async_pools() -> None:
+    async with _async_pools_lock:
+        for pool in _async_pools.values():
+            await pool.close()
+        _async_pools.clear()
+
+class AsyncPostgreSQLDB(PostgreSQLDB):
+    """
+    Variante asíncrona de PostgreSQLDB sobre conexiones asíncronas de psycopg y un pool asíncrono.
+    Mantiene la misma API basada en diccionarios y la misma validación (tablas, campos,
+    operadores, alias) y comparte con la versión síncrona los metadatos del esquema y la
+    caché de consultas compiladas.
+    """
+
+    async def _get_async_pool(self) -> AsyncConnectionPool:
+        return await _get_async_pool(self._conninfo(), self._pool_min_size, self._pool_max_size, self._pool_max_lifetime, self._pool_timeout)
+
+    async def get_async_pool_stats(self) -> Dict[str, int]:
+        return (await self._get_async_pool()).get_stats()
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Context manager asíncrono para manejar la conexión a la base de datos.
+        """
+        pool = await self._get_async_pool()
+        async with pool.connection() as conn:
+            try:
+                yield conn
+            except Exception as e:
+                logger.error(f"Error en conexión: {e}")
+                raise
+
+    async def _ensure_schema(self) -> None:
+        """
+        Carga los metadatos del esquema sin bloquear el bucle de eventos (una sola vez por proceso).
+        """
+        key = self._schema_key()
+        if key in _schemas:
+            return
+        async with self.connection() as conn, conn.cursor() as cur:
+            await cur.execute(_SCHEMA_QUERY, (self._schema,))
+            tables = _tables_from_rows(await cur.fetchall())
+        with _schemas_lock:
+            _schemas.setdefault(key, tables)
+
+    async def _execute_query(
+        self,
+        query: str,
+        values: Optional[List[Any]] = None,
+        fetch: bool = False
+    ) -> Union[List[Dict[str, Any]], Tuple[bool, int]]:
+        """
+        Ejecuta una consulta SQL parametrizada.
+        """
+        try:
+            async with self.connection() as client:
+                async with client.cursor() as cursor:
+                    await cursor.execute(query, values or [], prepare=True)
+                    if fetch:
+                        return await cursor.fetchall()
+                    rows_affected = cursor.rowcount
+                    await client.commit()
+                    return True, rows_affected
+        except Exception as e:
+            logger.error(f"Error ejecutando consulta: {e}")
+            return [] if fetch else (False, 0)
+
+    async def _run(self, kind: str, params: Dict[str, Any], fetch: bool):
+        await self._ensure_schema()
+        query, values = self._build_query(kind, params)
+        return await self._execute_query(query, values, fetch=fetch)
+
+    async def select(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await self._run('select', params, fetch=True)
+
+    async def insert(self, params: Dict[str, Any]) -> Tuple[bool, int]:
+        return await self._run('insert', params, fetch=False)
+
+    async def update(self, params: Dict[str, Any]) -> Tuple[bool, int]:
+        return await self._run('update', params, fetch=False)
+
+    async def delete(self, params: Dict[str, Any]) -> Tuple[bool, int]:
+        return await self._run('delete', params, fetch=False)
+
+    async def select_iter(
+        self,
+        params: Dict[str, Any],
+        itersize: int = 2000,
+        batches: bool = False
+    ) -> AsyncIterator[Union[Dict[str, Any], Dict[str, List[Any]]]]:
+        """
+        Versión asíncrona de PostgreSQLDB.select_iter: cursor de servidor leído de itersize
+        en itersize filas, filas o bloques por columnas, y errores propagados.
+        """
+        if not (isinstance(itersize, int) and itersize > 0):
+            raise ValueError("itersize debe ser un entero positivo")
+        await self._ensure_schema()
+        query, values = self._build_query('select', params)
+
+        async with self.connection() as conn, conn.transaction():
+            async with conn.cursor(name=f"select_iter_async_{next(_cursor_ids)}") as cursor:
+                cursor.itersize = itersize
+                await cursor.execute(query, values)
+                if not batches:
+                    async for row in cursor:
+                        yield row
+                    return
+                while rows := await cursor.fetchmany(itersize):
+                    yield {col.name: [row[col.name] for row in rows] for col in cursor.description}
+
+    @staticmethod
+    async def _run_upsert(cur, prepared: Dict[str, Any]) -> Dict[str, int]:
+        """Versión asíncrona de la carga masiva preparada: COPY a la tabla temporal y fusión."""
+        await cur.execute(prepared['create'])
+        async with cur.copy(prepared['copy']) as copy:
+            for row in prepared['rows']:
+                await copy.write_row(row)
+
+        await cur.execute(prepared['merge'])
+        results = await cur.fetchall()
+        await cur.execute(prepared['unique'])
+        unique_rows = (await cur.fetchone())['total']
+
+        inserted = sum(1 for r in results if r['inserted'])
+        return {
+            'inserted': inserted,
+            'updated': len(results) - inserted,
+            'unchanged': unique_rows - len(results),
+            'failed': 0
+        }
+
+    async def bulk_upsert(self, params: Dict[str, Any]) -> Dict[str, int]:
+        """Versión asíncrona de PostgreSQLDB.bulk_upsert (mismos parámetros, incluido "then")."""
+        await self._ensure_schema()
+        prepared = self._prepare_upsert(params)
+        then = [self._build_query('update', u) for u in params.get("then", [])]
+
+        rows = prepared['rows'] = list(prepared['rows'])
+        try:
+            async with self.connection() as conn, conn.transaction(), conn.cursor() as cur:
+                counts = await self._run_upsert(cur, prepared)
+                for query, values in then:
+                    await cur.execute(query, values)
+        except Exception as e:
+            logger.error(f"Error en carga masiva sobre {prepared['table']}: {e}")
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': len(rows)}
+
+        return counts
+
+    async def bulk_upsert_many(self, params_list: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+        """Versión asíncrona de PostgreSQLDB.bulk_upsert_many: todas las cargas en una única transacción."""
+        await self._ensure_schema()
+        prepared = [self._prepare_upsert(params) for params in params_list]
+        for p in prepared:
+            p['rows'] = list(p['rows'])
+
+        counts = {}
+        try:
+            async with self.connection() as conn, conn.transaction(), conn.cursor() as cur:
+                for p in prepared:
+                    counts[p['table']] = await self._run_upsert(cur, p)
+        except Exception as e:
+            logger.error(f"Error en carga masiva sobre {', '.join(p['table'] for p in prepared)}: {e}")
+            return {p['table']: {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': len(p['rows'])} for p in prepared}
+
+        return counts
+
+    def get_pool_stats(self) -> Dict[str, int]:
+        """
+        Métricas del pool asíncrono de esta conexión; vacías si aún no se ha abierto
+        (se abre en la primera consulta, dentro del bucle de eventos).
+        """
+        pool = _async_pools.get(self._conninfo())
+        return pool.get_stats() if pool else {}
+
+# # Ejemplo de uso:
+# async def main():
+#     db = AsyncPostgreSQLDB()
+#     rows = await db.select({'table': 'provinces', 'fields': ['province_id', 'is_fetched']})
+#     await db.update({
+#         'table': 'provinces',
+#         'values': {'fetched_pages': 10},
+#         'filters': {'where': {'field': 'province_id', 'operator': '=', 'value': 29}}
+#     })
+#     await close_async_pools()
+#
+# asyncio.run(main())
@@ -31,6 +31,10 @@ CREATE TABLE provinces (
     fetched_pages INT DEFAULT 0,
     total_pages INT DEFAULT 0,
     is_fetched BOOLEAN DEFAULT FALSE,
+    crawl_started_at TIMESTAMPTZ,
+    last_crawl_started_at TIMESTAMPTZ,
+    churn_per_day REAL,
+    next_crawl_at TIMESTAMPTZ,
     ccaa_id INT NOT NULL,
     FOREIGN KEY (ccaa_id) REFERENCES ccaas(ccaa_id)
 );
@@ -83,10 +87,246 @@ CREATE TABLE ads_data (
     bus_distance INT,
     train_distance INT,
     tram_distance INT,
+    metro_distance INT,
+    school_distance INT,
+    hospital_distance INT,
+    supermarket_distance INT,
+    beach_distance INT,
     city_id INT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     FOREIGN KEY (city_id) REFERENCES cities(city_id)
 );
 
+CREATE TABLE municipality_aliases (
+    ccaa VARCHAR(100) NOT NULL,
+    province VARCHAR(100) NOT NULL,
+    raw_municipality VARCHAR(255) NOT NULL,
+    city_id INT NOT NULL,
+    confidence INT NOT NULL,
+    source VARCHAR(10) NOT NULL CHECK (source IN ('fuzzy', 'spatial')),
+    observations INT NOT NULL DEFAULT 1,
+    conflicting BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (ccaa, province, raw_municipality),
+    FOREIGN KEY (city_id) REFERENCES cities(city_id)
+);
+
+-- Histórico de precios: una instantánea por anuncio y día de rastreo, solo cuando cambia su contenido.
+-- Particionada por mes de rastreo para que las consultas por rango de fechas se limiten a sus particiones.
+CREATE TABLE IF NOT EXISTS ads_snapshots (
+    ad_id INT NOT NULL,
+    crawl_date DATE NOT NULL,
+    province_id INT NOT NULL,
+    city_id INT NOT NULL,
+    content_hash CHAR(32) NOT NULL,
+    price INT NOT NULL,
+    surface INT,
+    rooms INT,
+    bathrooms INT,
+    conservation_status INT,
+    floor_type INT,
+    PRIMARY KEY (ad_id, crawl_date)
+) PARTITION BY RANGE (crawl_date);
+
+CREATE INDEX IF NOT EXISTS ads_snapshots_province_idx ON ads_snapshots (province_id, crawl_date);
+
+-- Huella de los atributos que se historifican; si no cambia no se guarda instantánea
+CREATE OR REPLACE FUNCTION ads_snapshot_hash(a ads_data) RETURNS CHAR(32) AS $$
+    SELECT md5(row(a.price, a.surface, a.rooms, a.bathrooms, a.conservation_status, a.floor_type, a.city_id)::text)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Crea (si falta) la partición mensual que contiene la fecha dada
+CREATE OR REPLACE FUNCTION ensure_ads_snapshot_partition(day DATE) RETURNS VOID AS $$
+DECLARE
+    month_start DATE := date_trunc('month', day)::DATE;
+    partition_name TEXT := 'ads_snapshots_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    -- Varios workers pueden llegar a la vez al primer cambio del mes
+    PERFORM pg_advisory_xact_lock(hashtext('ads_snapshots'));
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF ads_snapshots FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION record_ads_snapshot() RETURNS TRIGGER AS $$
+DECLARE
+    new_hash CHAR(32) := ads_snapshot_hash(NEW);
+BEGIN
+    IF TG_OP = 'UPDATE' AND ads_snapshot_hash(OLD) = new_hash THEN
+        RETURN NULL;
+    END IF;
+    PERFORM ensure_ads_snapshot_partition(CURRENT_DATE);
+    -- Varios cambios en un mismo día se quedan con el último
+    INSERT INTO ads_snapshots AS s (
+        ad_id, crawl_date, province_id, city_id, content_hash,
+        price, surface, rooms, bathrooms, conservation_status, floor_type
+    )
+    SELECT NEW.ad_id, CURRENT_DATE, c.province_id, NEW.city_id, new_hash,
+           NEW.price, NEW.surface, NEW.rooms, NEW.bathrooms, NEW.conservation_status, NEW.floor_type
+    FROM cities AS c
+    WHERE c.city_id = NEW.city_id
+    ON CONFLICT (ad_id, crawl_date) DO UPDATE SET
+        province_id = EXCLUDED.province_id,
+        city_id = EXCLUDED.city_id,
+        content_hash = EXCLUDED.content_hash,
+        price = EXCLUDED.price,
+        surface = EXCLUDED.surface,
+        rooms = EXCLUDED.rooms,
+        bathrooms = EXCLUDED.bathrooms,
+        conservation_status = EXCLUDED.conservation_status,
+        floor_type = EXCLUDED.floor_type;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ads_data_snapshot ON ads_data;
+CREATE TRIGGER ads_data_snapshot
+    AFTER INSERT OR UPDATE ON ads_data
+    FOR EACH ROW EXECUTE FUNCTION record_ads_snapshot();
+
+-- Estado actual de cada anuncio según su histórico: última instantánea, precio anterior y primera aparición
+CREATE OR REPLACE VIEW ads_current_state AS
+SELECT DISTINCT ON (s.ad_id)
+    s.ad_id,
+    s.crawl_date AS last_change_date,
+    s.province_id,
+    s.city_id,
+    s.price,
+    s.surface,
+    s.rooms,
+    s.bathrooms,
+    s.conservation_status,
+    s.floor_type,
+    LAG(s.price) OVER w AS previous_price,
+    MIN(s.crawl_date) OVER w AS first_seen_date,
+    COUNT(*) OVER w AS changes
+FROM ads_snapshots AS s
+WINDOW w AS (PARTITION BY s.ad_id ORDER BY s.crawl_date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+ORDER BY s.ad_id, s.crawl_date DESC;
+
+-- Índices para consultas espaciales (KNN y radio) y por municipio sobre ads_data
+CREATE INDEX IF NOT EXISTS ads_data_location_gist ON ads_data USING GIST (location);
+CREATE INDEX IF NOT EXISTS ads_data_city_idx ON ads_data (city_id);
+
+-- Estadísticas de precio por municipio y provincia. Se mantienen de forma incremental:
+-- los triggers de ads_data marcan los municipios afectados y refresh_ads_stats() solo
+-- recalcula esos (y sus provincias) en lugar de reconstruir todo como un REFRESH MATERIALIZED VIEW.
+CREATE TABLE IF NOT EXISTS city_price_stats (
+    city_id INT PRIMARY KEY,
+    province_id INT NOT NULL,
+    ads INT NOT NULL,
+    avg_price INT,
+    median_price INT,
+    min_price INT,
+    max_price INT,
+    median_price_m2 NUMERIC(10, 2),
+    refreshed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    FOREIGN KEY (city_id) REFERENCES cities(city_id)
+);
+CREATE INDEX IF NOT EXISTS city_price_stats_province_idx ON city_price_stats (province_id);
+
+CREATE TABLE IF NOT EXISTS province_price_stats (
+    province_id INT PRIMARY KEY,
+    ads INT NOT NULL,
+    avg_price INT,
+    median_price INT,
+    min_price INT,
+    max_price INT,
+    median_price_m2 NUMERIC(10, 2),
+    refreshed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    FOREIGN KEY (province_id) REFERENCES provinces(province_id)
+);
+
+-- Municipios con anuncios modificados desde el último refresco
+CREATE TABLE IF NOT EXISTS ads_stats_dirty (
+    city_id INT PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION mark_ads_stats_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO ads_stats_dirty (city_id) SELECT DISTINCT city_id FROM old_rows ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO ads_stats_dirty (city_id) SELECT DISTINCT city_id FROM new_rows ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Triggers por sentencia: una sola inserción en ads_stats_dirty por página, no una por anuncio
+DROP TRIGGER IF EXISTS ads_data_stats_insert ON ads_data;
+CREATE TRIGGER ads_data_stats_insert
+    AFTER INSERT ON ads_data REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_ads_stats_dirty();
+DROP TRIGGER IF EXISTS ads_data_stats_update ON ads_data;
+CREATE TRIGGER ads_data_stats_update
+    AFTER UPDATE ON ads_data REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_ads_stats_dirty();
+DROP TRIGGER IF EXISTS ads_data_stats_delete ON ads_data;
+CREATE TRIGGER ads_data_stats_delete
+    AFTER DELETE ON ads_data REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_ads_stats_dirty();
+
+-- Recalcula las estadísticas de los municipios marcados y de sus provincias; devuelve cuántos municipios se refrescaron
+CREATE OR REPLACE FUNCTION refresh_ads_stats() RETURNS INT AS $$
+DECLARE
+    refreshed INT;
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS refreshing_cities (city_id INT PRIMARY KEY, province_id INT) ON COMMIT DROP;
+    DELETE FROM refreshing_cities;
+
+    WITH taken AS (
+        DELETE FROM ads_stats_dirty RETURNING city_id
+    )
+    INSERT INTO refreshing_cities (city_id, province_id)
+    SELECT t.city_id, c.province_id FROM taken AS t JOIN cities AS c ON c.city_id = t.city_id;
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+    DELETE FROM city_price_stats WHERE city_id IN (SELECT city_id FROM refreshing_cities);
+    INSERT INTO city_price_stats (city_id, province_id, ads, avg_price, median_price, min_price, max_price, median_price_m2)
+    SELECT r.city_id, r.province_id, COUNT(*), AVG(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price), MIN(a.price), MAX(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price::NUMERIC / NULLIF(a.surface, 0))
+    FROM refreshing_cities AS r
+    JOIN ads_data AS a ON a.city_id = r.city_id
+    GROUP BY r.city_id, r.province_id;
+
+    DELETE FROM province_price_stats WHERE province_id IN (SELECT province_id FROM refreshing_cities);
+    INSERT INTO province_price_stats (province_id, ads, avg_price, median_price, min_price, max_price, median_price_m2)
+    SELECT c.province_id, COUNT(*), AVG(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price), MIN(a.price), MAX(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price::NUMERIC / NULLIF(a.surface, 0))
+    FROM cities AS c
+    JOIN ads_data AS a ON a.city_id = c.city_id
+    WHERE c.province_id IN (SELECT province_id FROM refreshing_cities)
+    GROUP BY c.province_id;
+
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Marca de última modificación de cada anuncio, para exportaciones incrementales.
+-- bulk_upsert solo actualiza las filas cuyo contenido cambia, así que el trigger no se dispara en re-rastreos sin cambios.
+CREATE INDEX IF NOT EXISTS ads_data_updated_at_idx ON ads_data (updated_at);
+
+CREATE OR REPLACE FUNCTION touch_ads_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ads_data_touch_updated_at ON ads_data;
+CREATE TRIGGER ads_data_touch_updated_at
+    BEFORE UPDATE ON ads_data
+    FOR EACH ROW EXECUTE FUNCTION touch_ads_updated_at();
+
 -- Otorgar todos los privilegios al nuevo usuario en esta base de datos
 GRANT ALL PRIVILEGES ON ALL TABLES IN SCHEMA public TO geo_user;
 GRANT ALL PRIVILEGES ON ALL SEQUENCES IN SCHEMA public TO geo_user;
@@ -0,0 +1,8 @@
+-- Columnas de distancia para las capas de POI añadidas en modules/poi_layers.py
+-- (bases de datos creadas antes de que existieran estas capas)
+ALTER TABLE ads_data
+    ADD COLUMN IF NOT EXISTS metro_distance INT,
+    ADD COLUMN IF NOT EXISTS school_distance INT,
+    ADD COLUMN IF NOT EXISTS hospital_distance INT,
+    ADD COLUMN IF NOT EXISTS supermarket_distance INT,
+    ADD COLUMN IF NOT EXISTS beach_distance INT;
@@ -0,0 +1,12 @@
+-- Alias aprendidos de municipios: (ccaa, provincia, municipio publicado) -> city_id
+CREATE TABLE IF NOT EXISTS municipality_aliases (
+    ccaa VARCHAR(100) NOT NULL,
+    province VARCHAR(100) NOT NULL,
+    raw_municipality VARCHAR(255) NOT NULL,
+    city_id INT NOT NULL,
+    confidence INT NOT NULL,
+    source VARCHAR(10) NOT NULL CHECK (source IN ('fuzzy', 'spatial')),
+    created_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (ccaa, province, raw_municipality),
+    FOREIGN KEY (city_id) REFERENCES cities(city_id)
+);
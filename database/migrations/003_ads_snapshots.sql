@@ -0,0 +1,97 @@
+-- Histórico de precios: una instantánea por anuncio y día de rastreo, solo cuando cambia su contenido.
+-- Particionada por mes de rastreo para que las consultas por rango de fechas se limiten a sus particiones.
+CREATE TABLE IF NOT EXISTS ads_snapshots (
+    ad_id INT NOT NULL,
+    crawl_date DATE NOT NULL,
+    province_id INT NOT NULL,
+    city_id INT NOT NULL,
+    content_hash CHAR(32) NOT NULL,
+    price INT NOT NULL,
+    surface INT,
+    rooms INT,
+    bathrooms INT,
+    conservation_status INT,
+    floor_type INT,
+    PRIMARY KEY (ad_id, crawl_date)
+) PARTITION BY RANGE (crawl_date);
+
+CREATE INDEX IF NOT EXISTS ads_snapshots_province_idx ON ads_snapshots (province_id, crawl_date);
+
+-- Huella de los atributos que se historifican; si no cambia no se guarda instantánea
+CREATE OR REPLACE FUNCTION ads_snapshot_hash(a ads_data) RETURNS CHAR(32) AS $$
+    SELECT md5(row(a.price, a.surface, a.rooms, a.bathrooms, a.conservation_status, a.floor_type, a.city_id)::text)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Crea (si falta) la partición mensual que contiene la fecha dada
+CREATE OR REPLACE FUNCTION ensure_ads_snapshot_partition(day DATE) RETURNS VOID AS $$
+DECLARE
+    month_start DATE := date_trunc('month', day)::DATE;
+    partition_name TEXT := 'ads_snapshots_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    -- Varios workers pueden llegar a la vez al primer cambio del mes
+    PERFORM pg_advisory_xact_lock(hashtext('ads_snapshots'));
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS %I PARTITION OF ads_snapshots FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, (month_start + INTERVAL '1 month')::DATE
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION record_ads_snapshot() RETURNS TRIGGER AS $$
+DECLARE
+    new_hash CHAR(32) := ads_snapshot_hash(NEW);
+BEGIN
+    IF TG_OP = 'UPDATE' AND ads_snapshot_hash(OLD) = new_hash THEN
+        RETURN NULL;
+    END IF;
+    PERFORM ensure_ads_snapshot_partition(CURRENT_DATE);
+    -- Varios cambios en un mismo día se quedan con el último
+    INSERT INTO ads_snapshots AS s (
+        ad_id, crawl_date, province_id, city_id, content_hash,
+        price, surface, rooms, bathrooms, conservation_status, floor_type
+    )
+    SELECT NEW.ad_id, CURRENT_DATE, c.province_id, NEW.city_id, new_hash,
+           NEW.price, NEW.surface, NEW.rooms, NEW.bathrooms, NEW.conservation_status, NEW.floor_type
+    FROM cities AS c
+    WHERE c.city_id = NEW.city_id
+    ON CONFLICT (ad_id, crawl_date) DO UPDATE SET
+        province_id = EXCLUDED.province_id,
+        city_id = EXCLUDED.city_id,
+        content_hash = EXCLUDED.content_hash,
+        price = EXCLUDED.price,
+        surface = EXCLUDED.surface,
+        rooms = EXCLUDED.rooms,
+        bathrooms = EXCLUDED.bathrooms,
+        conservation_status = EXCLUDED.conservation_status,
+        floor_type = EXCLUDED.floor_type;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ads_data_snapshot ON ads_data;
+CREATE TRIGGER ads_data_snapshot
+    AFTER INSERT OR UPDATE ON ads_data
+    FOR EACH ROW EXECUTE FUNCTION record_ads_snapshot();
+
+-- Estado actual de cada anuncio según su histórico: última instantánea, precio anterior y primera aparición
+CREATE OR REPLACE VIEW ads_current_state AS
+SELECT DISTINCT ON (s.ad_id)
+    s.ad_id,
+    s.crawl_date AS last_change_date,
+    s.province_id,
+    s.city_id,
+    s.price,
+    s.surface,
+    s.rooms,
+    s.bathrooms,
+    s.conservation_status,
+    s.floor_type,
+    LAG(s.price) OVER w AS previous_price,
+    MIN(s.crawl_date) OVER w AS first_seen_date,
+    COUNT(*) OVER w AS changes
+FROM ads_snapshots AS s
+WINDOW w AS (PARTITION BY s.ad_id ORDER BY s.crawl_date ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+ORDER BY s.ad_id, s.crawl_date DESC;
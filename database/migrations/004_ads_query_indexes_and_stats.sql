@@ -0,0 +1,104 @@
+-- Índices para consultas espaciales (KNN y radio) y por municipio sobre ads_data
+CREATE INDEX IF NOT EXISTS ads_data_location_gist ON ads_data USING GIST (location);
+CREATE INDEX IF NOT EXISTS ads_data_city_idx ON ads_data (city_id);
+
+-- Estadísticas de precio por municipio y provincia. Se mantienen de forma incremental:
+-- los triggers de ads_data marcan los municipios afectados y refresh_ads_stats() solo
+-- recalcula esos (y sus provincias) en lugar de reconstruir todo como un REFRESH MATERIALIZED VIEW.
+CREATE TABLE IF NOT EXISTS city_price_stats (
+    city_id INT PRIMARY KEY,
+    province_id INT NOT NULL,
+    ads INT NOT NULL,
+    avg_price INT,
+    median_price INT,
+    min_price INT,
+    max_price INT,
+    median_price_m2 NUMERIC(10, 2),
+    refreshed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    FOREIGN KEY (city_id) REFERENCES cities(city_id)
+);
+CREATE INDEX IF NOT EXISTS city_price_stats_province_idx ON city_price_stats (province_id);
+
+CREATE TABLE IF NOT EXISTS province_price_stats (
+    province_id INT PRIMARY KEY,
+    ads INT NOT NULL,
+    avg_price INT,
+    median_price INT,
+    min_price INT,
+    max_price INT,
+    median_price_m2 NUMERIC(10, 2),
+    refreshed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    FOREIGN KEY (province_id) REFERENCES provinces(province_id)
+);
+
+-- Municipios con anuncios modificados desde el último refresco
+CREATE TABLE IF NOT EXISTS ads_stats_dirty (
+    city_id INT PRIMARY KEY
+);
+
+CREATE OR REPLACE FUNCTION mark_ads_stats_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO ads_stats_dirty (city_id) SELECT DISTINCT city_id FROM old_rows ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO ads_stats_dirty (city_id) SELECT DISTINCT city_id FROM new_rows ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Triggers por sentencia: una sola inserción en ads_stats_dirty por página, no una por anuncio
+DROP TRIGGER IF EXISTS ads_data_stats_insert ON ads_data;
+CREATE TRIGGER ads_data_stats_insert
+    AFTER INSERT ON ads_data REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_ads_stats_dirty();
+DROP TRIGGER IF EXISTS ads_data_stats_update ON ads_data;
+CREATE TRIGGER ads_data_stats_update
+    AFTER UPDATE ON ads_data REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_ads_stats_dirty();
+DROP TRIGGER IF EXISTS ads_data_stats_delete ON ads_data;
+CREATE TRIGGER ads_data_stats_delete
+    AFTER DELETE ON ads_data REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION mark_ads_stats_dirty();
+
+-- Recalcula las estadísticas de los municipios marcados y de sus provincias; devuelve cuántos municipios se refrescaron
+CREATE OR REPLACE FUNCTION refresh_ads_stats() RETURNS INT AS $$
+DECLARE
+    refreshed INT;
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS refreshing_cities (city_id INT PRIMARY KEY, province_id INT) ON COMMIT DROP;
+    DELETE FROM refreshing_cities;
+
+    WITH taken AS (
+        DELETE FROM ads_stats_dirty RETURNING city_id
+    )
+    INSERT INTO refreshing_cities (city_id, province_id)
+    SELECT t.city_id, c.province_id FROM taken AS t JOIN cities AS c ON c.city_id = t.city_id;
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+    DELETE FROM city_price_stats WHERE city_id IN (SELECT city_id FROM refreshing_cities);
+    INSERT INTO city_price_stats (city_id, province_id, ads, avg_price, median_price, min_price, max_price, median_price_m2)
+    SELECT r.city_id, r.province_id, COUNT(*), AVG(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price), MIN(a.price), MAX(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price::NUMERIC / NULLIF(a.surface, 0))
+    FROM refreshing_cities AS r
+    JOIN ads_data AS a ON a.city_id = r.city_id
+    GROUP BY r.city_id, r.province_id;
+
+    DELETE FROM province_price_stats WHERE province_id IN (SELECT province_id FROM refreshing_cities);
+    INSERT INTO province_price_stats (province_id, ads, avg_price, median_price, min_price, max_price, median_price_m2)
+    SELECT c.province_id, COUNT(*), AVG(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price), MIN(a.price), MAX(a.price),
+           percentile_cont(0.5) WITHIN GROUP (ORDER BY a.price::NUMERIC / NULLIF(a.surface, 0))
+    FROM cities AS c
+    JOIN ads_data AS a ON a.city_id = c.city_id
+    WHERE c.province_id IN (SELECT province_id FROM refreshing_cities)
+    GROUP BY c.province_id;
+
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Marca todos los municipios con anuncios para el primer refresco
+INSERT INTO ads_stats_dirty (city_id) SELECT DISTINCT city_id FROM ads_data ON CONFLICT DO NOTHING;
@@ -0,0 +1,16 @@
+-- Marca de última modificación de cada anuncio, para exportaciones incrementales.
+-- bulk_upsert solo actualiza las filas cuyo contenido cambia, así que el trigger no se dispara en re-rastreos sin cambios.
+ALTER TABLE ads_data ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+CREATE INDEX IF NOT EXISTS ads_data_updated_at_idx ON ads_data (updated_at);
+
+CREATE OR REPLACE FUNCTION touch_ads_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS ads_data_touch_updated_at ON ads_data;
+CREATE TRIGGER ads_data_touch_updated_at
+    BEFORE UPDATE ON ads_data
+    FOR EACH ROW EXECUTE FUNCTION touch_ads_updated_at();
@@ -0,0 +1,6 @@
+-- Planificación de re-rastreos por provincia según su ritmo de cambios (modules/refresh_scheduler.py)
+ALTER TABLE provinces
+    ADD COLUMN IF NOT EXISTS crawl_started_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS last_crawl_started_at TIMESTAMPTZ,
+    ADD COLUMN IF NOT EXISTS churn_per_day REAL,
+    ADD COLUMN IF NOT EXISTS next_crawl_at TIMESTAMPTZ;
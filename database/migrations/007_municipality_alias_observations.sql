@@ -0,0 +1,4 @@
+-- Alias espaciales confirmados por varias observaciones coincidentes (modules/municipality_aliases.py)
+ALTER TABLE municipality_aliases
+    ADD COLUMN IF NOT EXISTS observations INT NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS conflicting BOOLEAN NOT NULL DEFAULT FALSE;
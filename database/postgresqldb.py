@@ -1,14 +1,139 @@
+import atexit
+import itertools
 import logging
 import re
-import psycopg
+import threading
+from psycopg.conninfo import make_conninfo
 from psycopg.rows import dict_row
-from typing import List, Dict, Optional, Union, Tuple, Any
+from psycopg_pool import ConnectionPool
+from typing import Iterator, List, Dict, Optional, Union, Tuple, Any
+from collections import OrderedDict
 from contextlib import contextmanager
 from config.env_config import get_environment_variables
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO) 
 
+# Un pool por cadena de conexión y proceso, compartido por todas las instancias de PostgreSQLDB
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def _get_pool(conninfo: str, min_size: int, max_size: int, max_lifetime: float, timeout: float) -> ConnectionPool:
+    pool = _pools.get(conninfo)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(conninfo)
+            if pool is None:
+                pool = ConnectionPool(
+                    conninfo,
+                    min_size=min_size,
+                    max_size=max_size,
+                    max_lifetime=max_lifetime,
+                    timeout=timeout,
+                    kwargs={'row_factory': dict_row},
+                    check=ConnectionPool.check_connection,  # Health check antes de entregar cada conexión
+                    name=f"postgresqldb-{len(_pools)}",
+                    open=True
+                )
+                _pools[conninfo] = pool
+    return pool
+
+# Metadatos del esquema (tabla -> columnas) compartidos por todas las instancias del proceso
+_schemas: Dict[Tuple[str, str], Dict[str, frozenset]] = {}
+_schemas_lock = threading.Lock()
+
+_SCHEMA_QUERY = """
+    SELECT c.relname AS table_name, a.attname AS column_name
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+    WHERE n.nspname = %s
+    AND c.relkind IN ('r', 'p')
+    AND NOT c.relispartition
+    AND a.attnum > 0
+    AND NOT a.attisdropped;
+"""
+
+def _tables_from_rows(rows: List[Dict[str, Any]]) -> Dict[str, frozenset]:
+    columns: Dict[str, set] = {}
+    for row in rows:
+        columns.setdefault(row['table_name'], set()).add(row['column_name'])
+    return {table: frozenset(cols) for table, cols in columns.items()}
+
+# SQL ya validado y compilado, por forma de la consulta (tabla, campos, operadores, aridad de listas...)
+_COMPILED_CACHE_SIZE = 1024
+_compiled: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+_compiled_lock = threading.Lock()
+
+def _token(value: Any) -> Any:
+    return ('raw', str(value)) if isinstance(value, RawSQL) else value
+
+def _as_list(conditions: Union[Dict, List[Dict]]) -> List[Dict]:
+    return [conditions] if isinstance(conditions, dict) else list(conditions or [])
+
+def _where_shape(conditions: List[Dict]) -> Tuple[Any, ...]:
+    shape = []
+    for cond in conditions:
+        value = cond.get('value')
+        arity = len(value) if isinstance(value, (list, tuple)) else None
+        shape.append((_token(cond['field']), cond['operator'].upper(), arity))
+    return tuple(shape)
+
+def _where_values(conditions: List[Dict]) -> List[Any]:
+    values = []
+    for cond in conditions:
+        operator = cond['operator'].upper()
+        value = cond.get('value')
+        if operator in ('IS NULL', 'IS NOT NULL'):
+            continue
+        if operator in ('IN', 'NOT IN', 'BETWEEN'):
+            values.extend(value)
+        else:
+            values.append(value)
+    return values
+
+def _query_shape(kind: str, params: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Clave estructural de una consulta: todo lo que determina el SQL generado, pero no los valores.
+    """
+    filters = params.get('filters', {})
+    where = _where_shape(_as_list(filters.get('where', [])))
+    if kind == 'select':
+        fields = params.get('fields')
+        return (
+            kind,
+            params['table'],
+            tuple(_token(f) for f in fields) if fields else None,
+            tuple((j['type'], j['table'], j['on']) for j in params.get('joins', [])),
+            where,
+            tuple(filters.get('group_by', [])),
+            tuple((ob['field'], ob['direction']) for ob in filters.get('order_by', [])),
+            filters.get('limit')
+        )
+    if kind == 'insert':
+        return (kind, params['table'], tuple((col, _token(val) if isinstance(val, RawSQL) else None) for col, val in params['values'].items()))
+    if kind == 'update':
+        return (kind, params['table'], tuple(params['values'].keys()), where)
+    return (kind, params['table'], where)
+
+def _query_values(kind: str, params: Dict[str, Any]) -> List[Any]:
+    """
+    Valores parametrizados en el mismo orden en que los añade el constructor de la consulta.
+    """
+    where_values = _where_values(_as_list(params.get('filters', {}).get('where', [])))
+    if kind == 'insert':
+        return [val for val in params['values'].values() if not isinstance(val, RawSQL)]
+    if kind == 'update':
+        return list(params['values'].values()) + where_values
+    return where_values
+
+@atexit.register
+def close_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
 class RawSQL:
     def __init__(self, sql_expression: str):
         self.sql_expression = sql_expression
@@ -20,6 +145,14 @@ class PostgreSQLDB:
 
     __ALLOWED_OPERATORS = {"=", "<", "<=", ">", ">=", "!=", "IN", "NOT IN", "BETWEEN", "IS NULL", "IS NOT NULL", "LIKE", "ILIKE"}
     __ALLOWED_ORDER = {"ASC", "DESC"}
+    __ALIAS_PATTERN = re.compile(r'^[A-Za-z0-9_]+$')
+    __cursor_ids = itertools.count()  # Nombres únicos para los cursores de servidor de select_iter
+    # Operadores más largos primero para que '<=' no se interprete como '<'
+    __JOIN_ON_PATTERN = re.compile(
+        r'^\s*([A-Za-z0-9_]+\.[A-Za-z0-9_]+)\s*('
+        + '|'.join(map(re.escape, sorted(__ALLOWED_OPERATORS, key=len, reverse=True)))
+        + r')\s*([A-Za-z0-9_]+\.[A-Za-z0-9_]+)\s*$'
+    )
 
     def __init__(self) -> None:
         """
@@ -32,9 +165,11 @@ class PostgreSQLDB:
         self._port = env.DB_PORT
         self._username = env.DB_USERNAME
         self._password = env.DB_PASSWORD
-        self.__allowed_tables = set()
-        self.__allowed_fields = set()
-        self.__load_allowed_tables_and_fields()
+        self._pool_min_size = env.DB_POOL_MIN_SIZE
+        self._pool_max_size = env.DB_POOL_MAX_SIZE
+        self._pool_max_lifetime = env.DB_POOL_MAX_LIFETIME
+        self._pool_timeout = env.DB_POOL_TIMEOUT
+        self._schema = "public"
 
     def get_ip(self) -> str:
         return self._ip
@@ -66,72 +201,130 @@ class PostgreSQLDB:
     def set_db_name(self, db_name: str) -> None:
         self._db_name = db_name
 
-    def __load_allowed_tables_and_fields(self, schema: str = "public") -> None:
+    def _schema_key(self) -> Tuple[str, str]:
+        return (f"{self.get_ip()}:{self.get_port()}/{self.get_db_name()}", self._schema)
+
+    def __get_allowed_tables(self) -> Dict[str, frozenset]:
+        """
+        Devuelve las tablas permitidas y sus columnas. Se cargan una sola vez por proceso
+        (y base de datos) con una única consulta al catálogo.
         """
-        Carga en memoria las tablas y campos permitidos desde la base de datos.
+        key = self._schema_key()
+        tables = _schemas.get(key)
+        if tables is None:
+            with _schemas_lock:
+                tables = _schemas.get(key)
+                if tables is None:
+                    tables = self.__load_allowed_tables_and_fields()
+                    _schemas[key] = tables
+        return tables
+
+    def __load_allowed_tables_and_fields(self) -> Dict[str, frozenset]:
+        """
+        Carga en memoria las tablas y campos permitidos desde el catálogo de PostgreSQL.
         """
         with self.connection() as conn, conn.cursor() as cur:
-            cur.execute("""
-                SELECT table_name
-                FROM information_schema.tables
-                WHERE table_schema = %s
-                AND table_type = 'BASE TABLE';
-            """, (schema,))
-            tables = [row['table_name'] for row in cur.fetchall()]
-            self.__allowed_tables = set(tables)
-
-            fields = set()
-            for table in tables:
-                cur.execute("""
-                    SELECT column_name
-                    FROM information_schema.columns
-                    WHERE table_schema = %s
-                    AND table_name = %s;
-                """, (schema, table))
-                cols = [row['column_name'] for row in cur.fetchall()]
-                fields.update(cols)
-            self.__allowed_fields = fields
+            cur.execute(_SCHEMA_QUERY, (self._schema,))
+            return _tables_from_rows(cur.fetchall())
 
-    @contextmanager
-    def connection(self):
+    def refresh_schema(self) -> None:
         """
-        Context manager para manejar la conexión a la base de datos.
+        Descarta los metadatos cargados (p. ej. tras aplicar una migración).
+        """
+        with _schemas_lock:
+            _schemas.pop(self._schema_key(), None)
+        with _compiled_lock:
+            _compiled.clear()
+
+    def _build_query(self, kind: str, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """
+        SQL validado y valores de una consulta 'select', 'insert', 'update' o 'delete'
+        (compartido con la variante asíncrona).
         """
-        conn = psycopg.connect(
+        builders = {
+            'select': self.__build_select,
+            'insert': self.__build_insert,
+            'update': self.__build_update,
+            'delete': self.__build_delete
+        }
+        return self.__compile(kind, params, builders[kind])
+
+    def __compile(self, kind: str, params: Dict[str, Any], builder) -> Tuple[str, List[Any]]:
+        """
+        Devuelve el SQL y los valores de una consulta. Las consultas con la misma forma
+        reutilizan el SQL ya validado y compilado; solo se extraen los valores.
+        """
+        key = (self._schema_key(), _query_shape(kind, params))
+        with _compiled_lock:
+            query = _compiled.get(key)
+            if query is not None:
+                _compiled.move_to_end(key)
+        if query is not None:
+            return query, _query_values(kind, params)
+
+        query, values = builder(params)
+        with _compiled_lock:
+            _compiled[key] = query
+            while len(_compiled) > _COMPILED_CACHE_SIZE:
+                _compiled.popitem(last=False)
+        return query, values
+
+    def _conninfo(self) -> str:
+        return make_conninfo(
             user=self.get_username(),
             password=self.get_password(),
             host=self.get_ip(),
             port=self.get_port(),
-            dbname=self.get_db_name(),
-            row_factory=dict_row
+            dbname=self.get_db_name()
         )
-        try:
-            yield conn
-        except Exception as e:
-            logger.error(f"Error en conexión: {e}")
-            raise
-        finally:
-            conn.close()
 
-    def __validate_table(self, table_name: str) -> None:
+    def _get_pool(self) -> ConnectionPool:
+        return _get_pool(self._conninfo(), self._pool_min_size, self._pool_max_size, self._pool_max_lifetime, self._pool_timeout)
+
+    def get_pool_stats(self) -> Dict[str, int]:
+        """
+        Métricas del pool (tamaño, conexiones disponibles, peticiones en espera, errores...).
+        """
+        return self._get_pool().get_stats()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager para manejar la conexión a la base de datos.
+        La conexión se toma de un pool compartido y se devuelve al salir; si no hubo
+        errores se confirma la transacción y, si los hubo, se deshace.
+        """
+        with self._get_pool().connection() as conn:
+            try:
+                yield conn
+            except Exception as e:
+                logger.error(f"Error en conexión: {e}")
+                raise
+
+    def __validate_table(self, table_name: str) -> Dict[str, frozenset]:
         """
         Valida que la tabla esté en la lista de tablas permitidas.
         Permite alias en la forma 'table AS t' o 'table t'.
+        Devuelve el ámbito de campos visibles: {nombre o alias de la tabla: columnas}.
         """
         parts = table_name.strip().split()
         base_table = parts[0]
         
-        if base_table not in self.__allowed_tables:
+        allowed_tables = self.__get_allowed_tables()
+        if base_table not in allowed_tables:
             raise ValueError(f"Tabla no permitida: {base_table}")
-            
+
+        scope = {base_table: allowed_tables[base_table]}
         if len(parts) > 1:
             alias = parts[-1] if len(parts) == 2 else parts[2] if len(parts) == 3 and parts[1].upper() == "AS" else None
             if alias:
                 self.__validate_alias_name(alias)
+                scope[alias] = allowed_tables[base_table]
+        return scope
 
-    def __validate_field(self, field: str) -> None:
+    def __validate_field(self, field: str, scope: Dict[str, frozenset]) -> None:
         """
-        Valida que un campo esté permitido.
+        Valida que un campo pertenezca a alguna de las tablas de la consulta.
         Soporta campos con alias tipo 'alias.field'.
         """
         if isinstance(field, RawSQL):
@@ -141,13 +334,18 @@ class PostgreSQLDB:
         
         if len(parts) > 1:  # Tiene alias
             self.__validate_alias_name(parts[0])
-            
-        if base_field not in self.__allowed_fields:
+            if parts[0] not in scope:
+                raise ValueError(f"Alias no presente en la consulta: {parts[0]}")
+            allowed = base_field in scope[parts[0]]
+        else:
+            allowed = any(base_field in cols for cols in scope.values())
+
+        if not allowed:
             raise ValueError(f"Campo no permitido: {base_field}")
 
-    def __validate_fields(self, fields: List[str]) -> None:
+    def __validate_fields(self, fields: List[str], scope: Dict[str, frozenset]) -> None:
         for f in fields:
-            self.__validate_field(f)
+            self.__validate_field(f, scope)
 
     def __validate_operator(self, operator: str) -> None:
         if operator.upper() not in self.__ALLOWED_OPERATORS:
@@ -161,23 +359,20 @@ class PostgreSQLDB:
         """
         Valida que el alias sea seguro: solo letras, números y _ permitidos.
         """
-        if not re.match(r'^[A-Za-z0-9_]+$', alias):
+        if not self.__ALIAS_PATTERN.match(alias):
             raise ValueError(f"Alias no válido o potencialmente peligroso: {alias}")
 
-    def __validate_join_on(self, on_clause: str) -> None:
+    def __validate_join_on(self, on_clause: str, scope: Dict[str, frozenset]) -> None:
         """
         Valida la cláusula ON de un JOIN para evitar inyección.
         Ahora soporta múltiples operadores.
         """
-        operators_pattern = '|'.join(map(re.escape, self.__ALLOWED_OPERATORS))
-        pattern = rf'^\s*([A-Za-z0-9_]+\.[A-Za-z0-9_]+)\s*({operators_pattern})\s*([A-Za-z0-9_]+\.[A-Za-z0-9_]+)\s*$'
-        if not re.match(pattern, on_clause):
+        match = self.__JOIN_ON_PATTERN.match(on_clause)
+        if not match:
             raise ValueError(f"Cláusula ON no permitida o insegura: {on_clause}")
         
-        parts = re.split(rf'\s*({operators_pattern})\s*', on_clause)
-        for part in [parts[0], parts[2]]:
-            alias = part.split('.')[0]
-            self.__validate_alias_name(alias)
+        for part in [match.group(1), match.group(3)]:
+            self.__validate_field(part, scope)
 
     def __execute_query(
         self,
@@ -191,7 +386,8 @@ class PostgreSQLDB:
         try:
             with self.connection() as client:
                 with client.cursor() as cursor:
-                    cursor.execute(query, values or [])
+                    # Sentencia preparada en el servidor: el plan se reutiliza en la misma conexión
+                    cursor.execute(query, values or [], prepare=True)
                     if fetch:
                         results = cursor.fetchall()
                         return results
@@ -199,10 +395,10 @@ class PostgreSQLDB:
                     client.commit()
                     return True, rows_affected
         except Exception as e:
-            # logger.error(f"Error ejecutando consulta: {e}")
-            return False, 0 if not fetch else []
+            logger.error(f"Error ejecutando consulta: {e}")
+            return [] if fetch else (False, 0)
 
-    def __build_where_clause(self, conditions: List[Dict], values: list) -> str:
+    def __build_where_clause(self, conditions: List[Dict], values: list, scope: Dict[str, frozenset]) -> str:
         """
         Construye la cláusula WHERE con soporte para múltiples operadores.
         """
@@ -212,7 +408,7 @@ class PostgreSQLDB:
             operator = cond['operator'].upper()
             value = cond.get('value')
             
-            self.__validate_field(field)
+            self.__validate_field(field, scope)
             self.__validate_operator(operator)
             
             if operator in ('IS NULL', 'IS NOT NULL'):
@@ -235,20 +431,53 @@ class PostgreSQLDB:
         return " AND ".join(where_clauses)
 
     def select(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
-        self.__validate_table(params["table"])
+        query, values = self._build_query('select', params)
+        return self.__execute_query(query, values, fetch=True)
+
+    def select_iter(
+        self,
+        params: Dict[str, Any],
+        itersize: int = 2000,
+        batches: bool = False
+    ) -> Iterator[Union[Dict[str, Any], Dict[str, List[Any]]]]:
+        """
+        Igual que select, pero lee el resultado con un cursor con nombre (del lado del servidor)
+        de itersize en itersize filas, así que la memoria no depende del tamaño del resultado.
+        Con batches=True devuelve cada bloque como columnas ({campo: [valores]}) en lugar de fila a fila.
+        A diferencia de select, los errores se propagan en lugar de devolver una lista vacía.
+        La conexión queda ocupada hasta que se agota o se cierra el generador.
+        """
+        if not (isinstance(itersize, int) and itersize > 0):
+            raise ValueError("itersize debe ser un entero positivo")
+        query, values = self._build_query('select', params)
+
+        with self.connection() as conn, conn.transaction():
+            with conn.cursor(name=f"select_iter_{next(self.__cursor_ids)}") as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, values)
+                if not batches:
+                    yield from cursor
+                    return
+                while rows := cursor.fetchmany(itersize):
+                    yield {col.name: [row[col.name] for row in rows] for col in cursor.description}
+
+    def __build_select(self, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        scope = self.__validate_table(params["table"])
+        joins = params.get('joins', [])
+        for join in joins:
+            scope.update(self.__validate_table(join['table']))
 
         fields = params.get("fields")
         fields_clause = "*"
         if fields:
-            self.__validate_fields(fields)
+            self.__validate_fields(fields, scope)
             fields_clause = ", ".join(str(f) if isinstance(f, RawSQL) else f for f in fields)
 
         query = f"SELECT {fields_clause} FROM {params['table']}"
         values = []
 
-        for join in params.get('joins', []):
-            self.__validate_table(join['table'])
-            self.__validate_join_on(join['on'])
+        for join in joins:
+            self.__validate_join_on(join['on'], scope)
             query += f" {join['type']} JOIN {join['table']} ON {join['on']}"
 
         where_conditions = params.get('filters', {}).get('where', [])
@@ -256,19 +485,19 @@ class PostgreSQLDB:
             if isinstance(where_conditions, dict):
                 where_conditions = [where_conditions]
                 
-            where_clause = self.__build_where_clause(where_conditions, values)
+            where_clause = self.__build_where_clause(where_conditions, values, scope)
             query += f" WHERE {where_clause}"
 
         group_by = params.get('filters', {}).get('group_by', [])
         if group_by:
-            self.__validate_fields(group_by)
+            self.__validate_fields(group_by, scope)
             query += " GROUP BY " + ", ".join(group_by)
 
         order_by = params.get('filters', {}).get('order_by', [])
         if order_by:
             order_clauses = []
             for ob in order_by:
-                self.__validate_field(ob['field'])
+                self.__validate_field(ob['field'], scope)
                 self.__validate_order_direction(ob['direction'])
                 order_clauses.append(f"{ob['field']} {ob['direction'].upper()}")
             query += " ORDER BY " + ", ".join(order_clauses)
@@ -279,11 +508,15 @@ class PostgreSQLDB:
                 raise ValueError("LIMIT debe ser un entero positivo")
             query += f" LIMIT {limit}"
 
-        return self.__execute_query(query, values, fetch=True)
+        return query, values
 
     def insert(self, params: Dict[str, Any]) -> Tuple[bool, int]:
-        self.__validate_table(params["table"])
-        self.__validate_fields(list(params["values"].keys()))
+        query, values = self._build_query('insert', params)
+        return self.__execute_query(query, values, fetch=False)
+
+    def __build_insert(self, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        scope = self.__validate_table(params["table"])
+        self.__validate_fields(list(params["values"].keys()), scope)
 
         table = params["table"]
         values_dict = params["values"]
@@ -301,11 +534,15 @@ class PostgreSQLDB:
                 values.append(val)
 
         query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"
-        return self.__execute_query(query, values, fetch=False)
+        return query, values
 
     def update(self, params: Dict[str, Any]) -> Tuple[bool, int]:
-        self.__validate_table(params["table"])
-        self.__validate_fields(list(params["values"].keys()))
+        query, values = self._build_query('update', params)
+        return self.__execute_query(query, values, fetch=False)
+
+    def __build_update(self, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        scope = self.__validate_table(params["table"])
+        self.__validate_fields(list(params["values"].keys()), scope)
 
         table = params["table"]
         set_values = params["values"]
@@ -319,13 +556,17 @@ class PostgreSQLDB:
         if filters:
             if isinstance(filters, dict):
                 filters = [filters]
-            where_clause = " WHERE " + self.__build_where_clause(filters, where_values)
+            where_clause = " WHERE " + self.__build_where_clause(filters, where_values, scope)
 
         query = f"UPDATE {table} SET {set_clause}{where_clause}"
-        return self.__execute_query(query, set_values_list + where_values, fetch=False)
+        return query, set_values_list + where_values
 
     def delete(self, params: Dict[str, Any]) -> Tuple[bool, int]:
-        self.__validate_table(params["table"])
+        query, values = self._build_query('delete', params)
+        return self.__execute_query(query, values, fetch=False)
+
+    def __build_delete(self, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        scope = self.__validate_table(params["table"])
 
         filters = params.get("filters", {}).get("where", [])
 
@@ -334,10 +575,122 @@ class PostgreSQLDB:
         if filters:
             if isinstance(filters, dict):
                 filters = [filters]
-            where_clause = " WHERE " + self.__build_where_clause(filters, where_values)
+            where_clause = " WHERE " + self.__build_where_clause(filters, where_values, scope)
 
         query = f"DELETE FROM {params['table']}{where_clause}"
-        return self.__execute_query(query, where_values, fetch=False)
+        return query, where_values
+
+    def _prepare_upsert(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Valida los parámetros de una carga masiva y genera sus sentencias."""
+        table = params["table"]
+        columns = list(params["columns"])
+        conflict = list(params["conflict"])
+        update = list(params.get("update") or [c for c in columns if c not in conflict])
+
+        scope = self.__validate_table(table)
+        if len(table.split()) > 1:
+            raise ValueError(f"bulk_upsert no admite alias de tabla: {table}")
+        self.__validate_fields(columns + conflict + update, scope)
+        if not set(conflict) <= set(columns) or not set(update) <= set(columns):
+            raise ValueError("Las columnas de conflicto y actualización deben estar en columns")
+
+        staging = f"staging_{table}"
+        cols = ", ".join(columns)
+        conflict_cols = ", ".join(conflict)
+
+        if update:
+            set_clause = ", ".join(f"{c} = EXCLUDED.{c}" for c in update)
+            changed = f"({', '.join(f't.{c}' for c in update)}) IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in update)})"
+            on_conflict = f"DO UPDATE SET {set_clause} WHERE {changed}"
+        else:
+            on_conflict = "DO NOTHING"
+
+        return {
+            'table': table,
+            'rows': params["rows"],
+            'create': f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP",
+            'copy': f"COPY {staging} ({cols}) FROM STDIN",
+            'merge': f"""
+                    INSERT INTO {table} AS t ({cols})
+                    SELECT DISTINCT ON ({conflict_cols}) {cols} FROM {staging}
+                    ON CONFLICT ({conflict_cols}) {on_conflict}
+                    RETURNING (xmax = 0) AS inserted
+                """,
+            'unique': f"SELECT COUNT(*) AS total FROM (SELECT DISTINCT {conflict_cols} FROM {staging}) AS s",
+        }
+
+    @staticmethod
+    def __run_upsert(cur, prepared: Dict[str, Any]) -> Dict[str, int]:
+        """Ejecuta una carga masiva ya preparada sobre el cursor de una transacción abierta."""
+        cur.execute(prepared['create'])
+        with cur.copy(prepared['copy']) as copy:
+            for row in prepared['rows']:
+                copy.write_row(row)
+
+        cur.execute(prepared['merge'])
+        results = cur.fetchall()
+        cur.execute(prepared['unique'])
+        unique_rows = cur.fetchone()['total']
+
+        inserted = sum(1 for r in results if r['inserted'])
+        return {
+            'inserted': inserted,
+            'updated': len(results) - inserted,
+            'unchanged': unique_rows - len(results),
+            'failed': 0
+        }
+
+    def bulk_upsert(self, params: Dict[str, Any]) -> Dict[str, int]:
+        """
+        Carga masiva: vuelca las filas con COPY en una tabla temporal y las fusiona con
+        INSERT ... ON CONFLICT DO UPDATE en una única transacción. Solo se actualizan las filas
+        cuyo contenido ha cambiado. Devuelve cuántas se insertaron, actualizaron o no cambiaron.
+
+        params = {
+            "table": "ads_data",
+            "columns": ["ad_id", "price", ...],
+            "rows": [(1, 100000, ...), ...],      # mismo orden que columns, una fila por clave
+            "conflict": ["ad_id"],
+            "update": ["price", ...],             # opcional, por defecto el resto de columnas
+            "then": [{"table": ..., "values": ..., "filters": ...}]   # opcional, UPDATEs en la misma transacción
+        }
+        """
+        prepared = self._prepare_upsert(params)
+        # Actualizaciones que deben confirmarse junto con las filas (p. ej. el progreso de la provincia)
+        then = [self._build_query('update', u) for u in params.get("then", [])]
+
+        rows = prepared['rows'] = list(prepared['rows'])
+        try:
+            with self.connection() as conn, conn.transaction(), conn.cursor() as cur:
+                counts = self.__run_upsert(cur, prepared)
+                for query, values in then:
+                    cur.execute(query, values)
+        except Exception as e:
+            logger.error(f"Error en carga masiva sobre {prepared['table']}: {e}")
+            return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': len(rows)}
+
+        return counts
+
+    def bulk_upsert_many(self, params_list: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+        """
+        Aplica varias cargas masivas (mismo formato que bulk_upsert, sin "then") en una única
+        transacción y en el orden dado, de modo que las claves foráneas entre ellas se respeten.
+        Si alguna falla no se confirma ninguna. Devuelve los recuentos por tabla.
+        """
+        prepared = [self._prepare_upsert(params) for params in params_list]
+        for p in prepared:
+            p['rows'] = list(p['rows'])
+
+        counts = {}
+        try:
+            with self.connection() as conn, conn.transaction(), conn.cursor() as cur:
+                for p in prepared:
+                    counts[p['table']] = self.__run_upsert(cur, p)
+        except Exception as e:
+            logger.error(f"Error en carga masiva sobre {', '.join(p['table'] for p in prepared)}: {e}")
+            return {p['table']: {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': len(p['rows'])} for p in prepared}
+
+        return counts
     
 # # Ejemplo de uso:
 # params = {
@@ -1,38 +1,122 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+STARTED_AT = time.perf_counter()  # Antes del resto de imports, para que el informe de arranque los incluya
+import os
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from modules.fotocasa_data_fetcher import FotocasaDataFetcher
 from modules.proxy_tester import ProxyTester
 from modules.proxy_manager import ProxyManager
+from modules.ads_queries import AdsQueries
+from modules.worker_watchdog import WorkerWatchdog, WatchdogGiveUp, JobCancelled
+from modules.liveness_channel import LivenessChannel
+from modules.refresh_scheduler import RefreshScheduler
+from modules.coordinate_cache import get_coordinate_cache
+from modules.startup_report import StartupReport
+from config.env_config import get_environment_variables
 from utils.get_provinces_info import get_provinces_info
-from utils.check_province_status import check_province_status
+from utils.get_crawl_state import get_crawl_state
 
-def fetch_all_provinces(proxy_manager, max_workers=5):
+RESTART_EXIT_CODE = 75  # El supervisor relanza main.py al recibirlo
 
-    remaining_provinces = list(range(1, len(get_provinces_info()) + 1))
+def keep_alive(watchdog):
+    """Latidos del canal de vida durante una llamada larga del bucle de supervisión."""
+    return watchdog.channel.keep_alive() if watchdog.channel else nullcontext()
+
+def fetch_all_provinces(proxy_manager, max_workers=5, watchdog=None, enrichment_pool=None):
 
-    while remaining_provinces:
-        futures = {}
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            for i in remaining_provinces:
-                if not check_province_status(i):
-                    fetcher = FotocasaDataFetcher(proxy_manager=proxy_manager)
-                    future = executor.submit(fetcher.fetch_ads_from_province, i)
-                    futures[future] = i
+    queries = AdsQueries()
+    # Sin re-rastreos recurrentes no hay siguiente rastreo que programar
+    scheduler = RefreshScheduler() if get_environment_variables().RECURRING_CRAWL else None
+    watchdog = watchdog or WorkerWatchdog()
+    remaining_provinces = list(range(1, len(get_provinces_info()) + 1))
 
+    # Hilos extra para que los workers cancelados que aún no han terminado no bloqueen a los reprogramados
+    executor = ThreadPoolExecutor(max_workers=max_workers + watchdog.max_zombies)
+    try:
+        while remaining_provinces:
+            crawl_state = get_crawl_state()  # Una sola consulta por ronda para todas las provincias
+            pending = deque(i for i in remaining_provinces if not crawl_state.get(i, {}).get('is_fetched'))
+            futures = {}
             # Provincias que fallaron en esta ronda
             failed_provinces = []
-            for future in as_completed(futures):
-                i = futures[future]
-                try:
-                    success = future.result()
-                    if not success:
+            watchdog.reset_round()
+
+            while pending or futures:
+                while pending and len(watchdog.active_jobs()) < max_workers:
+                    i = pending.popleft()
+                    job = watchdog.start_job(i)
+                    fetcher = FotocasaDataFetcher(proxy_manager=proxy_manager, enrichment_pool=enrichment_pool, stop_when_unchanged=scheduler is None)
+                    futures[executor.submit(fetcher.fetch_ads_from_province, i, job)] = job
+
+                done, _ = wait(futures, timeout=watchdog.check_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures.pop(future)
+                    watchdog.finish_job(job)
+                    i = job.province_index
+                    try:
+                        success = future.result()
+                        if not success:
+                            failed_provinces.append(i)
+                        elif scheduler:
+                            with keep_alive(watchdog):
+                                scheduler.complete(i)  # Mide los cambios del rastreo y programa el siguiente
+                    except JobCancelled:
+                        pass  # Ya se reprogramó al cancelarla
+                    except Exception as e:
+                        print(f"❌ Error inesperado en provincia {i}: {e}")
                         failed_provinces.append(i)
-                except Exception as e:
-                    print(f"❌ Error inesperado en provincia {i}: {e}")
-                    failed_provinces.append(i)
-        
-        remaining_provinces = failed_provinces
+
+                # Solo se reprograma la provincia atascada; el resto de workers sigue su curso
+                for job in watchdog.cancel_stalled():
+                    if watchdog.should_reschedule(job.province_index):
+                        pending.appendleft(job.province_index)
+                    else:
+                        failed_provinces.append(job.province_index)
+
+                if watchdog.channel:
+                    watchdog.channel.mark_alive()  # El proceso sigue vivo mientras el bucle de supervisión avanza
+
+            # Estadísticas por municipio/provincia al día, recalculando solo lo que cambió en la ronda
+            with keep_alive(watchdog):
+                queries.refresh_stats()
+                get_coordinate_cache().save()  # Solo persiste si COORDINATE_CACHE_PATH está configurado
+            remaining_provinces = list(dict.fromkeys(failed_provinces))
+    finally:
+        # Sin esperar a los workers cancelados que sigan bloqueados
+        executor.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
-    tester = ProxyTester()
-    proxy_manager = ProxyManager(tester)
-    fetch_all_provinces(proxy_manager, max_workers=10)
+    startup = StartupReport(started_at=STARTED_AT)
+    startup.mark('imports')
+    with startup.phase('canal de liveness'):
+        channel = LivenessChannel.create()
+    # Lo que puede tardar minutos (prueba de proxies, descarga y filtrado de los PBF) se hace aquí, con
+    # latidos, y no en los workers: allí superaría stall_timeout y cada reinicio repetiría la descarga
+    with channel.keep_alive():
+        with startup.phase('proxies'):
+            proxy_manager = ProxyManager(ProxyTester())
+        with startup.phase('índices'):
+            from modules.stop_locator import get_stop_locator
+            from modules.location_matcher import get_location_matcher
+            from modules.reverse_geocoder import get_reverse_geocoder  # Importa geopandas/shapely
+            get_stop_locator()
+            get_location_matcher()
+            get_reverse_geocoder()
+        processes = get_environment_variables().ENRICHMENT_PROCESSES
+        enrichment_pool = None
+        if processes > 0:
+            with startup.phase('pool de enriquecimiento'):
+                from modules.enrichment_pool import EnrichmentPool
+                enrichment_pool = EnrichmentPool(processes=processes)
+    print(startup.report())
+    try:
+        fetch_all_provinces(proxy_manager, max_workers=10, watchdog=WorkerWatchdog(channel=channel), enrichment_pool=enrichment_pool)
+    except WatchdogGiveUp as e:
+        # Los hilos bloqueados no se pueden matar: se sale sin esperarlos y el supervisor reinicia el proceso
+        print(f"⚠️ {e}. Reiniciando proceso.")
+        channel.close()
+        os._exit(RESTART_EXIT_CODE)
+    channel.close()
+    if enrichment_pool:
+        enrichment_pool.close()
@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional
+from database.postgresqldb import PostgreSQLDB
+
+# Punto WGS84 como geography, para que las distancias salgan en metros y se use el índice GiST de location
+POINT_SQL = "ST_SetSRID(ST_MakePoint(%(lon)s, %(lat)s), 4326)::geography"
+
+AD_FIELDS = [
+    'ad_id', 'price', 'surface', 'rooms', 'bathrooms', 'zip_code', 'city_id',
+    'ST_Y(location::geometry) AS latitude', 'ST_X(location::geometry) AS longitude'
+]
+
+STATS_FIELDS = ['ads', 'avg_price', 'median_price', 'min_price', 'max_price', 'median_price_m2', 'refreshed_at']
+
+class AdsQueries:
+    """
+    Consultas de análisis sobre ads_data que el constructor de PostgreSQLDB.select no puede
+    expresar: vecinos más cercanos y búsqueda por radio (índice GiST sobre location) y
+    estadísticas de precio por municipio/provincia (tablas de resumen con refresco incremental).
+    """
+
+    def __init__(self, db: PostgreSQLDB = None):
+        self.db = db or PostgreSQLDB()
+
+    def _fetch(self, query: str, values: dict) -> List[Dict]:
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute(query, values)
+            return cur.fetchall()
+
+    @staticmethod
+    def _filters(values: dict, city_id: Optional[int], max_price: Optional[int]) -> str:
+        clauses = []
+        if city_id is not None:
+            clauses.append("city_id = %(city_id)s")
+            values['city_id'] = city_id
+        if max_price is not None:
+            clauses.append("price <= %(max_price)s")
+            values['max_price'] = max_price
+        return "".join(f" AND {c}" for c in clauses)
+
+    def nearest(self, lat: float, lon: float, k: int = 10, city_id: int = None, max_price: int = None) -> List[Dict]:
+        "Los k anuncios más cercanos al punto, ordenados por distancia (KNN con el operador <-> sobre el índice GiST)."
+        values = {'lat': lat, 'lon': lon, 'k': k}
+        filters = self._filters(values, city_id, max_price)
+        return self._fetch(f"""
+            SELECT {', '.join(AD_FIELDS)}, ST_Distance(location, {POINT_SQL})::INT AS distance_m
+            FROM ads_data
+            WHERE location IS NOT NULL{filters}
+            ORDER BY location <-> {POINT_SQL}
+            LIMIT %(k)s
+        """, values)
+
+    def within_radius(self, lat: float, lon: float, radius_m: float, limit: int = None,
+                      city_id: int = None, max_price: int = None) -> List[Dict]:
+        "Anuncios a menos de radius_m metros del punto, del más cercano al más lejano."
+        values = {'lat': lat, 'lon': lon, 'radius_m': radius_m, 'limit': limit}
+        filters = self._filters(values, city_id, max_price)
+        return self._fetch(f"""
+            SELECT {', '.join(AD_FIELDS)}, ST_Distance(location, {POINT_SQL})::INT AS distance_m
+            FROM ads_data
+            WHERE ST_DWithin(location, {POINT_SQL}, %(radius_m)s){filters}
+            ORDER BY distance_m
+            LIMIT %(limit)s
+        """, values)
+
+    def city_stats(self, city_ids: List[int] = None, province_id: int = None) -> List[Dict]:
+        "Estadísticas de precio por municipio, filtradas por municipios o por provincia."
+        if city_ids is not None and not city_ids:
+            return []
+        filters = []
+        if city_ids is not None:
+            filters.append({'field': 's.city_id', 'operator': 'IN', 'value': list(city_ids)})
+        if province_id is not None:
+            filters.append({'field': 's.province_id', 'operator': '=', 'value': province_id})
+        return self.db.select({
+            'table': 'city_price_stats AS s',
+            'fields': ['s.city_id', 'c.city_name', 's.province_id'] + [f's.{f}' for f in STATS_FIELDS],
+            'joins': [{'type': 'INNER', 'table': 'cities AS c', 'on': 'c.city_id = s.city_id'}],
+            'filters': {'where': filters, 'order_by': [{'field': 's.city_id', 'direction': 'ASC'}]}
+        })
+
+    def province_stats(self, province_ids: List[int] = None) -> List[Dict]:
+        "Estadísticas de precio por provincia."
+        if province_ids is not None and not province_ids:
+            return []
+        filters = [{'field': 's.province_id', 'operator': 'IN', 'value': list(province_ids)}] if province_ids is not None else []
+        return self.db.select({
+            'table': 'province_price_stats AS s',
+            'fields': ['s.province_id', 'p.province_name'] + [f's.{f}' for f in STATS_FIELDS],
+            'joins': [{'type': 'INNER', 'table': 'provinces AS p', 'on': 'p.province_id = s.province_id'}],
+            'filters': {'where': filters, 'order_by': [{'field': 's.province_id', 'direction': 'ASC'}]}
+        })
+
+    def refresh_stats(self) -> int:
+        "Recalcula solo los municipios (y sus provincias) con anuncios modificados; devuelve cuántos municipios se refrescaron."
+        return self._fetch("SELECT refresh_ads_stats() AS refreshed", {})[0]['refreshed']
+
+# # Example usage
+# if __name__ == "__main__":
+#     queries = AdsQueries()
+#     print(queries.within_radius(lat=36.7213, lon=-4.4214, radius_m=1000, limit=20))
+#     print(queries.city_stats(province_id=29)[:5])
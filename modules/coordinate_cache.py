@@ -0,0 +1,211 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+import numpy as np
+from config.env_config import get_environment_variables
+
+CACHE_VERSION = 2
+MISSING = object()  # Distinto de None, que es un resultado válido (punto fuera de todo recinto)
+
+class CoordinateCache:
+    """
+    Memo LRU acotado del enriquecimiento espacial por coordenadas redondeadas a `precision`
+    decimales (5 ≈ 1 m): distancias al POI más cercano de cada capa y municipio del recinto que
+    contiene el punto. Muchos anuncios comparten edificio o punto geocodificado y los re-rastreos
+    vuelven a ver las mismas coordenadas, así que los puntos repetidos no repiten el trabajo espacial.
+    Las distancias se guardan junto con la firma del índice de POI y se descartan si esta cambia.
+    Con `path` se carga al crearse y save() lo persiste para la siguiente ejecución; al cargar se
+    descartan los municipios si cambió el asset de recintos y las distancias si cambió el índice de
+    POI (`sources`: rutas de ambos ficheros, por defecto las de ReverseGeocoder y StopLocator).
+    """
+    def __init__(self, max_entries: int = 200_000, precision: int = 5, path: str = None, sources: dict = None):
+        self.max_entries = max_entries
+        self.precision = precision
+        self.path = path
+        self.sources = sources
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._distances = OrderedDict()  # (lat, lon) -> tuple de distancias en el orden de las capas
+        self._cities = OrderedDict()  # (lat, lon) -> nombre del municipio o None
+        self._distances_signature = None
+        if path and os.path.exists(path):
+            self._load()
+
+    def __getstate__(self):
+        # Se envía a los procesos del pool de enriquecimiento (subset/merge); el lock no es serializable
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def keys(self, lats, lons) -> list:
+        scale = 10 ** self.precision
+        lats = np.round(np.asarray(lats, dtype=float) * scale)
+        lons = np.round(np.asarray(lons, dtype=float) * scale)
+        return [None if np.isnan(a) or np.isnan(o) else (int(a), int(o)) for a, o in zip(lats, lons)]
+
+    def _get_many(self, store: OrderedDict, keys: list) -> list:
+        with self._lock:
+            values = []
+            for key in keys:
+                value = store.get(key, MISSING) if key is not None else MISSING
+                if value is not MISSING:
+                    store.move_to_end(key)
+                values.append(value)
+            hits = sum(v is not MISSING for v in values)
+            self.hits += hits
+            self.misses += len(values) - hits
+            return values
+
+    def _put_many(self, store: OrderedDict, items) -> None:
+        with self._lock:
+            for key, value in items:
+                if key is None:
+                    continue
+                store[key] = value
+                store.move_to_end(key)
+            while len(store) > self.max_entries:
+                store.popitem(last=False)
+
+    def nearest_distances(self, locator, lats, lons) -> dict:
+        """Como StopLocator.nearest_distances, consultando el índice solo para las coordenadas no vistas."""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        signature = (tuple(locator.layers), locator.signature())
+        with self._lock:
+            if self._distances_signature != signature:
+                self._distances.clear()
+                self._distances_signature = signature
+
+        keys = self.keys(lats, lons)
+        cached = self._get_many(self._distances, keys)
+        pending = [i for i, value in enumerate(cached) if value is MISSING]
+        result = {t: np.full(len(keys), np.nan) for t in locator.layers}
+        for i, value in enumerate(cached):
+            if value is not MISSING:
+                for t, distance in zip(locator.layers, value):
+                    result[t][i] = distance
+
+        if pending:
+            computed = locator.nearest_distances(lats[pending], lons[pending])
+            for t in locator.layers:
+                result[t][pending] = computed[t]
+            self._put_many(self._distances, (
+                (keys[i], tuple(float(computed[t][j]) for t in locator.layers)) for j, i in enumerate(pending)
+            ))
+        return result
+
+    def cities(self, lats, lons, lookup) -> list:
+        """Municipio que contiene cada punto; lookup(latitudes, longitudes) solo recibe los no vistos."""
+        keys = self.keys(lats, lons)
+        names = self._get_many(self._cities, keys)
+        pending = [i for i, name in enumerate(names) if name is MISSING]
+        if pending:
+            computed = lookup([lats[i] for i in pending], [lons[i] for i in pending])
+            for i, name in zip(pending, computed):
+                names[i] = name
+            self._put_many(self._cities, ((keys[i], name) for i, name in zip(pending, computed)))
+        return names
+
+    def subset(self, lats, lons) -> "CoordinateCache":
+        """
+        Copia pequeña (sin persistencia) con solo las entradas de estas coordenadas, para enviarla con
+        una página a un proceso del pool en lugar de que cada proceso mantenga su propia caché completa.
+        """
+        keys = {k for k in self.keys(lats, lons) if k is not None}
+        subset = CoordinateCache(max_entries=max(len(keys), 1), precision=self.precision)
+        with self._lock:
+            subset._distances_signature = self._distances_signature
+            subset._distances.update((k, self._distances[k]) for k in keys if k in self._distances)
+            subset._cities.update((k, self._cities[k]) for k in keys if k in self._cities)
+        return subset
+
+    def merge(self, other: "CoordinateCache") -> None:
+        """Incorpora las entradas de un subset() devuelto por un proceso del pool, con sus aciertos y fallos."""
+        with self._lock:
+            self.hits += other.hits
+            self.misses += other.misses
+            if other._distances_signature != self._distances_signature:
+                # El proceso usó el índice de POI vigente: las distancias que había aquí son de otro índice
+                self._distances.clear()
+                self._distances_signature = other._distances_signature
+        self._put_many(self._distances, other._distances.items())
+        self._put_many(self._cities, other._cities.items())
+
+    def _source_signatures(self) -> dict:
+        """Tamaño y mtime de los ficheros de los que salen los resultados memorizados (None si no existen)."""
+        sources = self.sources
+        if sources is None:
+            from modules.stop_locator import STOPS_INDEX_PATH
+            from utils.build_boundaries_asset import BOUNDARIES_ASSET_PATH
+            sources = {'cities': BOUNDARIES_ASSET_PATH, 'distances': STOPS_INDEX_PATH}
+        signatures = {}
+        for name, source_path in sources.items():
+            try:
+                stat = os.stat(source_path)
+                signatures[name] = [stat.st_size, stat.st_mtime_ns]
+            except OSError:
+                signatures[name] = None
+        return signatures
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != CACHE_VERSION or data.get('precision') != self.precision:
+                return
+            sources = data['sources']
+            distances_signature, distances, cities = data['distances_signature'], data['distances'], data['cities']
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, IndexError, KeyError, TypeError, ValueError):
+            return  # Caché ilegible: se empieza de cero y se reescribe en el siguiente save()
+        current = self._source_signatures()
+        if sources.get('distances') == current.get('distances'):
+            self._distances_signature = distances_signature
+            self._put_many(self._distances, distances)
+        if sources.get('cities') == current.get('cities'):
+            self._put_many(self._cities, cities)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        sources = self._source_signatures()
+        with self._lock:
+            data = {
+                'version': CACHE_VERSION,
+                'precision': self.precision,
+                'sources': sources,
+                'distances_signature': self._distances_signature,
+                'distances': list(self._distances.items()),
+                'cities': list(self._cities.items()),
+            }
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_coordinate_cache() -> CoordinateCache:
+    """Instancia compartida por todo el proceso, configurada con COORDINATE_CACHE_SIZE y COORDINATE_CACHE_PATH."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                env = get_environment_variables()
+                _cache = CoordinateCache(max_entries=env.COORDINATE_CACHE_SIZE, path=env.COORDINATE_CACHE_PATH)
+    return _cache
+
+# # Example usage
+# if __name__ == "__main__":
+#     from modules.stop_locator import StopLocator
+#     cache = CoordinateCache(path="assets/cache/coordinates.pkl")
+#     print(cache.nearest_distances(StopLocator(), [36.7213, 36.7213], [-4.4214, -4.4214]))
+#     print(cache.hits, cache.misses)
+#     cache.save()
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from typing import Tuple
+from modules.coordinate_cache import CoordinateCache, get_coordinate_cache
+from modules.location_matcher import get_location_matcher
+from modules.municipality_aliases import get_municipality_aliases
+from modules.reverse_geocoder import get_reverse_geocoder
+from modules.stop_locator import SHARED_INDEX_DIR, StopLocator, get_stop_locator
+from utils.match_cities import match_cities, REQUIRED_FIELDS, CITY_MATCH_FIELDS, CITY_MATCH_COLUMN
+
+# Estado de cada proceso del pool, cargado una sola vez por _init_worker
+_locator = None
+_matcher = None
+
+def _init_worker(shared_index_dir):
+    global _locator, _matcher
+    _locator = StopLocator.from_shared(shared_index_dir)
+    _matcher = get_location_matcher()
+    get_reverse_geocoder()  # Recintos municipales cargados antes de la primera página
+
+def _enrich_page(df: pd.DataFrame, cache: CoordinateCache, pending: np.ndarray) -> Tuple[pd.DataFrame, CoordinateCache]:
+    """
+    Trabajo de CPU de una página: distancias a los POI y municipio de cada anuncio (sin tocar la base de datos).
+    cache trae solo las coordenadas de la página ya conocidas; se devuelve con las calculadas aquí.
+    Solo se resuelve el municipio de las filas marcadas en pending; el resto queda a None.
+    """
+    distances = cache.nearest_distances(_locator, df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float))
+    for layer, values in distances.items():
+        df[f"{layer}_distance"] = values
+
+    matches = match_cities(_matcher, list(df.loc[pending, CITY_MATCH_FIELDS].itertuples(index=False, name=None)), cache)
+    column = [None] * len(df)
+    for position, match in zip(np.flatnonzero(pending), matches):
+        column[position] = match
+    df[CITY_MATCH_COLUMN] = pd.Series(column, index=df.index, dtype=object)
+    return df, cache
+
+class EnrichmentPool:
+    """
+    Etapa opcional de enriquecimiento en procesos: las distancias a los POI, el matching difuso de
+    municipios y el punto en polígono son CPU en Python y, en los hilos de main.py, el GIL los limita
+    a un núcleo. Los procesos abren el índice de POI con memoria mapeada (StopLocator.from_shared),
+    leen los recintos municipales del GeoParquet mapeado en memoria y construyen su propio matcher.
+    """
+
+    def __init__(self, processes: int = None, stop_locator: StopLocator = None, shared_index_dir: str = SHARED_INDEX_DIR):
+        # El índice se vuelca una vez desde el proceso principal; los workers solo lo mapean
+        (stop_locator or get_stop_locator()).export_shared(shared_index_dir)
+        self.processes = processes or max(1, (os.cpu_count() or 2) - 1)
+        # spawn: el proceso principal tiene hilos y conexiones abiertas que no deben heredarse con fork
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(shared_index_dir,)
+        )
+
+    def enrich(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Enriquece una página en un proceso del pool; bloquea solo al hilo que la pide.
+        La caché de coordenadas vive solo en este proceso: a cada página la acompañan sus entradas
+        conocidas y las nuevas se incorporan a la vuelta.
+        """
+        # Solo las filas que build_ads_frame no va a descartar y que la tabla de alias no resuelve ya
+        aliases = get_municipality_aliases()
+        complete = df.reindex(columns=REQUIRED_FIELDS).notna().all(axis=1).to_numpy()
+        names = df.reindex(columns=CITY_MATCH_FIELDS[:3]).itertuples(index=False, name=None)
+        pending = np.array([is_complete and aliases.lookup(*key) is None for is_complete, key in zip(complete, names)], dtype=bool)
+
+        cache = get_coordinate_cache()
+        df, page_cache = self._executor.submit(_enrich_page, df, cache.subset(df['latitude'], df['longitude']), pending).result()
+        cache.merge(page_cache)
+        return df
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -9,13 +9,14 @@ from datetime import datetime
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import requests.exceptions
 import time
-from modules.stop_locator import StopLocator
+from modules.stop_locator import get_stop_locator
+from modules.coordinate_cache import get_coordinate_cache
+from modules.progress_checkpointer import ProgressCheckpointer
+from modules.page_fingerprints import PageFingerprints
 from utils.get_provinces_info import get_provinces_info
 from utils.insert_ads_from_df import insert_ads_from_df
 from utils.get_next_page import get_next_page
-from utils.update_heartbeat import update_heartbeat
 from utils.set_total_pages_on_province import set_total_pages_on_province
-from utils.update_current_page_on_province import update_current_page_on_province
 from utils.set_province_as_fetched import set_province_as_fetched
 
 warnings.filterwarnings('ignore', category=FutureWarning)
@@ -37,7 +38,8 @@ if not any(isinstance(h, logging.StreamHandler) for h in logger.handlers):
     logger.addHandler(console_handler)
 
 class FotocasaDataFetcher:
-    def __init__(self, max_empty_consecutive_dfs: int = 10, max_consecutive_bad_inserts: int = 3, proxy_manager=None):
+    def __init__(self, max_empty_consecutive_dfs: int = 10, max_consecutive_bad_inserts: int = 3, proxy_manager=None, enrichment_pool=None,
+                 stop_when_unchanged: bool = True):
         self.headers = {
             "Content-Type": "application/json",
             "Accept": "application/json, text/plain, */*",
@@ -48,18 +50,23 @@ class FotocasaDataFetcher:
                 "(KHTML, like Gecko) Chrome/133.0.0.0 Safari/537.36"
             ),
         }
-        self.stop_locator = StopLocator()
+        self.enrichment_pool = enrichment_pool
         self.provinces_info = get_provinces_info()
         self.logger = logger
         self.consecutive_empty_dfs = 0
         self.MAX_EMPTY_DFS = max_empty_consecutive_dfs
         self.consecutive_bad_inserts = 0
         self.MAX_CONSECUTIVE_BAD_INSERTS = max_consecutive_bad_inserts
+        # Con re-rastreos recurrentes se recorre el listado entero: el ritmo de cambios que mide
+        # RefreshScheduler no puede salir solo de las primeras páginas
+        self.stop_when_unchanged = stop_when_unchanged
         self.proxy_manager = proxy_manager
+        self.job = None
 
     def _request_with_proxy(self, method, url, **kwargs):
         # Intentamos usar proxies rotativos hasta 5 veces
         for attempt in range(5):
+            self._check_job()
             proxy = self.proxy_manager.get_proxy() if self.proxy_manager else None
             proxies = None
             if proxy:
@@ -199,14 +206,10 @@ class FotocasaDataFetcher:
             return []
 
     def _add_distances(self, df):
-        for idx, row in df.iterrows():
-            if pd.notnull(row.latitude) and pd.notnull(row.longitude):
-                dists = self.stop_locator.find_nearest(row.latitude, row.longitude)
-                for k, v in dists.items():
-                    df.at[idx, f"{k}_distance"] = v['distance_m']
-            else:
-                for k in ['bus', 'metro', 'train']:
-                    df.at[idx, f"{k}_distance"] = None
+        # Una única consulta vectorizada por página para todas las capas de POI, solo para las coordenadas no vistas
+        distances = get_coordinate_cache().nearest_distances(get_stop_locator(), df['latitude'].to_numpy(dtype=float), df['longitude'].to_numpy(dtype=float))
+        for layer, values in distances.items():
+            df[f"{layer}_distance"] = values
         return df
 
     def _write_error_log(self, province_name, next_page, df1, df2):
@@ -221,65 +224,114 @@ class FotocasaDataFetcher:
             f.write("\n\nDataFrame df2 (v2) contenido:\n")
             f.write(df2.to_string())
 
-    def fetch_ads_from_province(self, province_index):
+    def _check_job(self):
+        # Punto de cancelación: si el watchdog ha cancelado el trabajo se sale sin escribir nada más
+        if self.job:
+            self.job.check()
+
+    def _finish_province(self, province_index, checkpointer=None):
+        # Un trabajo cancelado no debe pisar el progreso de la provincia, que ya se ha reprogramado
+        self._check_job()
+        if checkpointer:
+            checkpointer.flush()
+        set_province_as_fetched(province_index)
+
+    def fetch_ads_from_province(self, province_index, job=None):
+        self.job = job
         province = self.provinces_info[province_index-1]
         ids, lat, lon = province['ids'], province['latitude'], province['longitude']
 
         while True:
+            self._check_job()
             first_items, total, size = self._get_v1(ids, lat, lon, next_page=1)
             if first_items is not None:
                 break
 
         total_pages = math.ceil(total / size)
+        self._check_job()
         set_total_pages_on_province(province_index,total_pages)
         
         next_page = get_next_page(province_index)
 
         if next_page >= total_pages:
-            set_province_as_fetched(province_index)
+            self._finish_province(province_index)
             return True
         
+        checkpointer = ProgressCheckpointer(province_index)
+        fingerprints = PageFingerprints()
+
         with tqdm(total=total_pages, desc=f"{province['nombre']} ({province_index})", leave=False, initial=next_page) as pbar:
             while next_page <= total_pages:
+                self._check_job()
                 try:
                     items_v1, _, _ = self._get_v1(ids, lat, lon, next_page)
+                except Exception as e:
+                    self.logger.error(f"Error en petición página {next_page} para provincia {self._parse_v1(first_items[0]).get('province')}: {e}")
+                    continue
+
+                # Página reciclada por el origen: sin v2 ni enriquecimiento, cuenta como página sin anuncios nuevos
+                page_ids = [self._safe(ad, 'propertyId', int) for ad in items_v1 or []]
+                page = fingerprints.check(page_ids)
+                if page['recycled']:
+                    self.logger.info(f"Página {next_page} de {province['nombre']} reciclada ({page['overlap']:.0%} de anuncios ya vistos)")
+                    self.consecutive_bad_inserts += 1
+                    if self.consecutive_bad_inserts >= self.MAX_CONSECUTIVE_BAD_INSERTS:  # Parada temprana por detección de replicación de anuncios
+                        self._finish_province(province_index, checkpointer)
+                        pbar.update(pbar.total - pbar.n)
+                        return True
+                    fingerprints.record(page_ids)
+                    checkpointer.record(next_page)
+                    next_page += 1
+                    pbar.update(1)
+                    if self.job:
+                        self.job.beat()
+                    continue
+
+                try:
                     items_v2 = self._get_v2(ids, lat, lon, next_page)
                 except Exception as e:
                     self.logger.error(f"Error en petición página {next_page} para provincia {self._parse_v1(first_items[0]).get('province')}: {e}")
                     continue
-                
+
                 df1 = pd.DataFrame([self._parse_v1(ad) for ad in items_v1]).set_index('id') if items_v1 else pd.DataFrame()
                 df2 = pd.DataFrame([self._parse_v2(ad) for ad in items_v2]).set_index('id') if items_v2 else pd.DataFrame()
 
                 if not df1.empty and not df2.empty:
                     df = pd.merge(df1, df2, left_index=True, right_index=True, how='inner')
-                    df = self._add_distances(df)
+                    df = self.enrichment_pool.enrich(df) if self.enrichment_pool else self._add_distances(df)
                     df['page_number'] = next_page
 
-                    if insert_ads_from_df(input_df=df) == 0:
+                    self._check_job()
+                    # Los anuncios de la página y, cuando toca, el progreso se confirman en la misma transacción
+                    checkpointer.record(next_page)
+                    progress = checkpointer.due_update()
+                    counts = insert_ads_from_df(input_df=df, progress=progress)
+                    if progress and not counts['failed']:
+                        checkpointer.mark_flushed()
+                    if self.stop_when_unchanged and counts['inserted'] + counts['updated'] == 0:  # Página sin anuncios nuevos ni cambiados
                         self.consecutive_bad_inserts += 1
                     else:
                         self.consecutive_bad_inserts = 0
+                    fingerprints.record(page_ids)
 
                     if self.consecutive_bad_inserts >= self.MAX_CONSECUTIVE_BAD_INSERTS:  # Parada temprana por detección de replicación de anuncios
-                        set_province_as_fetched(province_index)
+                        self._finish_province(province_index, checkpointer)
                         pbar.update(pbar.total - pbar.n)
                         return True
                     
                     self.consecutive_empty_dfs = 0
-                    update_current_page_on_province(province_index,next_page)
                     next_page += 1
                     pbar.update(1)
+                    if self.job:
+                        self.job.beat()
                 else:
                     self.logger.warning(f"DataFrames vacíos en provincia {self._parse_v1(first_items[0]).get('province')} página {next_page}. Generando log...")
                     self._write_error_log(self._parse_v1(first_items[0]).get('province'), next_page, df1, df2)
                     self.consecutive_empty_dfs += 1
                     if self.consecutive_empty_dfs >= self.MAX_EMPTY_DFS:
                         raise RuntimeError(f"Demasiados errores consecutivos en {self._parse_v1(first_items[0]).get('province')} (página {next_page}), abortando ejecución.")
-                
-                update_heartbeat()
 
-        set_province_as_fetched(province_index)
+        self._finish_province(province_index, checkpointer)
         return True
     
 # # Example usage
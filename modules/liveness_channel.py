@@ -0,0 +1,190 @@
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, List
+
+LIVENESS_SHM_NAME = "fotocasa_liveness"
+LIVENESS_SLOTS = 64
+
+# Cabecera: pid del crawler, último paso del bucle de supervisión, número de huecos
+_HEADER = struct.Struct("<qdI")
+_HEADER_SIZE = 32
+# Hueco por worker: secuencia (seqlock), estado, provincia, job, inicio, último progreso, páginas, páginas/min
+_SLOT = struct.Struct("<IBiiddId")
+_SLOT_SIZE = 64
+_SEQ = struct.Struct("<I")
+
+FREE, RUNNING, CANCELLED = 0, 1, 2
+STATES = {FREE: 'free', RUNNING: 'running', CANCELLED: 'cancelled'}
+RATE_SMOOTHING = 0.2  # Peso de la última página en la media móvil de páginas/min
+READ_DEADLINE = 0.05  # Segundos que el lector espera a que un hueco deje de estar a medio escribir
+KEEP_ALIVE_INTERVAL = 5.0  # Segundos entre latidos mientras el bucle de supervisión está en una llamada larga
+
+class LivenessChannel:
+    """
+    Canal de vida y progreso por worker en memoria compartida. El crawler escribe en él sin
+    E/S (cada worker solo toca su propio hueco) y el supervisor, en otro proceso,
+    lo lee para saber si el bucle de supervisión sigue vivo y qué workers van rezagados.
+    Cada hueco usa un seqlock: el escritor incrementa la secuencia antes y después de escribir
+    y el lector repite la lectura si la ve impar o cambiada.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self._shm = shm
+        self._buf = shm.buf
+        self._owner = owner
+        self._lock = threading.Lock()
+        self._free_slots = list(range(self.slots - 1, -1, -1)) if owner else []
+        self._rates: Dict[int, float] = {}
+
+    @classmethod
+    def create(cls, name: str = LIVENESS_SHM_NAME, slots: int = LIVENESS_SLOTS) -> "LivenessChannel":
+        size = _HEADER_SIZE + slots * _SLOT_SIZE
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Restos de un crawler anterior que no llegó a cerrarse
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        _HEADER.pack_into(shm.buf, 0, os.getpid(), time.time(), slots)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str = LIVENESS_SHM_NAME) -> "LivenessChannel":
+        """Abre el canal de otro proceso en modo lectura. FileNotFoundError si aún no existe."""
+        shm = shared_memory.SharedMemory(name=name)
+        # Solo el creador debe borrarlo; sin esto el resource_tracker lo eliminaría al salir el lector
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    @property
+    def slots(self) -> int:
+        return _HEADER.unpack_from(self._buf, 0)[2]
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    # --- Escritura (proceso del crawler) ---
+
+    def mark_alive(self) -> None:
+        """Latido del bucle de supervisión del crawler."""
+        struct.pack_into("<d", self._buf, 8, time.time())
+
+    @contextmanager
+    def keep_alive(self, interval: float = KEEP_ALIVE_INTERVAL):
+        """
+        Latidos desde un hilo auxiliar mientras dura el bloque, para el arranque (proxies, índices) y las
+        llamadas largas del bucle de supervisión (refresco de estadísticas, planificación, guardado de
+        cachés) que no pasan por mark_alive().
+        """
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(interval):
+                self.mark_alive()
+
+        self.mark_alive()
+        thread = threading.Thread(target=beat, name="liveness-keep-alive", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+            self.mark_alive()
+
+    def _write_slot(self, slot: int, state: int, province_index: int, job_id: int,
+                    started: float, last_progress: float, pages: int, rate: float) -> None:
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+        # Impar mientras se escribe y par al terminar, aunque una escritura anterior quedase a medias
+        writing = (_SEQ.unpack_from(self._buf, offset)[0] + 1) | 1
+        _SEQ.pack_into(self._buf, offset, writing)
+        _SLOT.pack_into(self._buf, offset, writing, state, province_index, job_id, started, last_progress, pages, rate)
+        _SEQ.pack_into(self._buf, offset, writing + 1)
+
+    def claim(self, province_index: int, job_id: int) -> int:
+        now = time.time()
+        with self._lock:
+            slot = self._free_slots.pop()
+            self._rates[slot] = 0.0
+            self._write_slot(slot, RUNNING, province_index, job_id, now, now, 0, 0.0)
+        return slot
+
+    def progress(self, slot: int, pages: int) -> None:
+        """Registra el avance del worker del hueco (páginas hechas) y actualiza su media de páginas/min."""
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+        now = time.time()
+        # El lock (sin contención salvo al cancelar) evita que el watchdog y el worker escriban a la vez el hueco
+        with self._lock:
+            _, state, province_index, job_id, started, previous_progress, _, _ = _SLOT.unpack_from(self._buf, offset)
+            instant = 60.0 / max(now - previous_progress, 1e-3)
+            rate = self._rates.get(slot) or instant
+            rate = (1 - RATE_SMOOTHING) * rate + RATE_SMOOTHING * instant
+            self._rates[slot] = rate
+            self._write_slot(slot, state, province_index, job_id, started, now, pages, rate)
+
+    def mark_cancelled(self, slot: int) -> None:
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+        with self._lock:
+            _, _, province_index, job_id, started, last_progress, pages, rate = _SLOT.unpack_from(self._buf, offset)
+            self._write_slot(slot, CANCELLED, province_index, job_id, started, last_progress, pages, rate)
+
+    def release(self, slot: int) -> None:
+        with self._lock:
+            self._write_slot(slot, FREE, 0, 0, 0.0, 0.0, 0, 0.0)
+            self._free_slots.append(slot)
+
+    # --- Lectura (supervisor) ---
+
+    def _read_slot(self, slot: int):
+        """
+        Lectura consistente del hueco, o None si sigue a medio escribir pasado READ_DEADLINE
+        (p. ej. el escritor murió a mitad de una actualización y la secuencia se quedó impar).
+        """
+        offset = _HEADER_SIZE + slot * _SLOT_SIZE
+        deadline = time.monotonic() + READ_DEADLINE
+        while True:
+            values = _SLOT.unpack_from(self._buf, offset)
+            if values[0] % 2 == 0 and _SEQ.unpack_from(self._buf, offset)[0] == values[0]:
+                return values
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.0005)
+
+    def snapshot(self) -> Dict:
+        """
+        Estado del crawler: pid, segundos desde el último latido, datos de cada worker activo y
+        huecos que no se han podido leer (escritos a medias), que se dan por obsoletos.
+        """
+        pid, loop_ts, slots = _HEADER.unpack_from(self._buf, 0)
+        now = time.time()
+        workers: List[Dict] = []
+        stale: List[int] = []
+        for slot in range(slots):
+            values = self._read_slot(slot)
+            if values is None:
+                stale.append(slot)
+                continue
+            _, state, province_index, job_id, started, last_progress, pages, rate = values
+            if state == FREE:
+                continue
+            workers.append({
+                'slot': slot,
+                'state': STATES[state],
+                'province_index': province_index,
+                'job_id': job_id,
+                'running_s': now - started,
+                'idle_s': now - last_progress,
+                'pages': pages,
+                'pages_per_min': rate,
+            })
+        return {'pid': pid, 'alive_age_s': now - loop_ts, 'workers': workers, 'stale_slots': stale}
@@ -1,83 +1,230 @@
 import os
 import re
+import threading
 import unicodedata
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-from thefuzz import process
+from rapidfuzz import fuzz, process
+from thefuzz.utils import full_process
+
+NO_MATCH = {'guess': None, 'guess_id': None, 'score': 0}
+NO_CANDIDATES = {'keys': [], 'names': [], 'exact': {}}
 
 class LocationMatcher:
-    def __init__(self, reference_csv_path: str = None, threshold: int = 60):
+    def __init__(self, reference_csv_path: str = None, threshold: int = 60, cache_size: int = 100_000):
         if reference_csv_path is None:
             reference_csv_path = os.path.join('assets', 'ccaa_province_city.csv')
         self.df_reference = pd.read_csv(reference_csv_path)
         self.threshold = threshold
-        self._cache = {}
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # LRU (ccaa, province, city) -> resultado
+        self._cache_lock = threading.Lock()
+        self._build_lookups()
+
+    def _build_lookups(self):
+        """
+        Precalcula los candidatos normalizados y los ids por (ccaa) y (ccaa, provincia)
+        para no filtrar df_reference ni normalizar candidatos en cada búsqueda.
+        """
+        df = self.df_reference
+        self._ccaa_candidates = self._build_candidates(df['ccaa_name'].dropna().unique())
+        self._province_candidates = {
+            ccaa: self._build_candidates(group['province_name'].dropna().unique())
+            for ccaa, group in df.groupby('ccaa_name', sort=False)
+        }
+        self._city_candidates = {
+            key: self._build_candidates(group['city_name'].dropna().unique())
+            for key, group in df.groupby(['ccaa_name', 'province_name'], sort=False)
+        }
+
+        # Si un nombre aparece con varios ids se queda el primero, como hacía la búsqueda sobre el DataFrame
+        self._ccaa_ids = {
+            r.ccaa_name: int(r.ccaa_id) for r in df.drop_duplicates('ccaa_name').itertuples(index=False)
+        }
+        self._province_ids = {
+            (r.ccaa_name, r.province_name): int(r.province_id)
+            for r in df.drop_duplicates(['ccaa_name', 'province_name']).itertuples(index=False)
+        }
+        self._city_ids = {
+            (r.ccaa_name, r.province_name, r.city_name): int(r.city_id)
+            for r in df.drop_duplicates(['ccaa_name', 'province_name', 'city_name']).itertuples(index=False)
+        }
 
     def _normalize(self, text: str) -> str:
         text = unicodedata.normalize('NFD', str(text).lower())
         text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
         return ''.join(sorted(re.split(r'[\s\-\/]+', text)))
 
-    def _best_match(self, target: str, candidates: list[str]) -> tuple:
-        norm_target = self._normalize(target)
+    def _process(self, text: str) -> str:
+        # Mismo preprocesado que aplicaba thefuzz.process.extractOne antes de puntuar
+        return full_process(self._normalize(text), force_ascii=True)
+
+    def _build_candidates(self, candidates) -> dict:
         norm_candidates = {self._normalize(c): c for c in candidates}
-        
-        if not norm_candidates:
-            return None, 0
-            
-        result = process.extractOne(norm_target, list(norm_candidates.keys()))
-        if not result:
-            return None, 0
-            
-        match, score = result 
-        return (norm_candidates[match], score) if score >= self.threshold else (None, 0)
-
-    def _get_unique_id(self, column: str, value: str, filter_cols: dict = None) -> int:
-        df = self.df_reference
-        if filter_cols:
-            for col, val in filter_cols.items():
-                df = df[df[col] == val]
-        ids = df[df[column] == value][f"{column.split('_')[0]}_id"].unique()
-        return int(ids[0]) if ids.size > 0 else None
+        keys = [full_process(k, force_ascii=True) for k in norm_candidates]
+        names = list(norm_candidates.values())
+        exact = {}
+        for key, name in zip(keys, names):
+            exact.setdefault(key, name)
+        return {'keys': keys, 'names': names, 'exact': exact}
 
-    def match_location(self, ccaa: str = None, province: str = None, city: str = None) -> dict:
+    def _best_match(self, target: str, candidates: dict) -> tuple:
+        return self._best_match_many([target], candidates)[0]
+
+    def _best_match_many(self, targets: list, candidates: dict) -> list[tuple]:
+        """
+        Mejor candidato para cada objetivo. Las coincidencias exactas se resuelven por hash y el resto
+        se puntúa de una vez con rapidfuzz.process.cdist (WRatio, como el extractOne de thefuzz).
+        """
+        if not candidates['keys']:
+            return [(None, 0)] * len(targets)
+
+        keys = [self._process(t) for t in targets]
+        results = [None] * len(keys)
+        pending = []
+        for i, key in enumerate(keys):
+            exact = candidates['exact'].get(key)
+            if exact is not None:
+                results[i] = (exact, 100)
+            else:
+                pending.append(i)
+
+        if pending:
+            scores = process.cdist([keys[i] for i in pending], candidates['keys'], scorer=fuzz.WRatio, dtype=np.float64, workers=-1)
+            best = scores.argmax(axis=1)
+            for row, i in enumerate(pending):
+                score = int(round(float(scores[row, best[row]])))
+                results[i] = (candidates['names'][best[row]], score) if score >= self.threshold else (None, 0)
+        return results
+
+    def _resolve(self, ccaa, province, city, match_ccaa, match_province, match_city) -> dict:
         if not ccaa:
-            return {'guess': None, 'guess_id': None, 'score': 0}
+            return dict(NO_MATCH)
 
         # Match CCAA
-        ccaa_guess, score = self._best_match(ccaa, self.df_reference['ccaa_name'].dropna().unique())
+        ccaa_guess, score = match_ccaa(ccaa)
         if not ccaa_guess:
-            return {'guess': None, 'guess_id': None, 'score': 0}
-        
+            return dict(NO_MATCH)
+
         if not province:
-            ccaa_id = self._get_unique_id('ccaa_name', ccaa_guess)
-            return {'guess': ccaa_guess, 'guess_id': ccaa_id, 'score': score}
+            return {'guess': ccaa_guess, 'guess_id': self._ccaa_ids.get(ccaa_guess), 'score': score}
 
         # Match Province
-        province_candidates = self.df_reference[self.df_reference['ccaa_name'] == ccaa_guess]['province_name'].dropna().unique()
-        province_guess, score = self._best_match(province, province_candidates)
+        province_guess, score = match_province(ccaa_guess, province)
         if not province_guess:
-            return {'guess': None, 'guess_id': None, 'score': 0}
-        
+            return dict(NO_MATCH)
+
         if not city:
-            province_id = self._get_unique_id('province_name', province_guess, {'ccaa_name': ccaa_guess})
+            province_id = self._province_ids.get((ccaa_guess, province_guess))
             return {'guess': province_guess, 'guess_id': province_id, 'score': score}
 
         # Match City
-        city_candidates = self.df_reference[
-            (self.df_reference['ccaa_name'] == ccaa_guess) & 
-            (self.df_reference['province_name'] == province_guess)
-        ]['city_name'].dropna().unique()
-        
-        city_guess, score = self._best_match(city, city_candidates)
+        city_guess, score = match_city(ccaa_guess, province_guess, city)
         if not city_guess:
-            return {'guess': None, 'guess_id': None, 'score': 0}
+            return dict(NO_MATCH)
 
-        city_id = self._get_unique_id('city_name', city_guess, {
-            'ccaa_name': ccaa_guess,
-            'province_name': province_guess
-        })
+        city_id = self._city_ids.get((ccaa_guess, province_guess, city_guess))
         return {'guess': city_guess, 'guess_id': city_id, 'score': score}
 
+    def _cache_get(self, key):
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def _cache_put(self, key, result) -> None:
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def match_location(self, ccaa: str = None, province: str = None, city: str = None) -> dict:
+        key = (ccaa, province, city)
+        result = self._cache_get(key)
+        if result is None:
+            result = self._resolve(
+                ccaa, province, city,
+                lambda c: self._best_match(c, self._ccaa_candidates),
+                lambda c, p: self._best_match(p, self._province_candidates.get(c, NO_CANDIDATES)),
+                lambda c, p, m: self._best_match(m, self._city_candidates.get((c, p), NO_CANDIDATES))
+            )
+            self._cache_put(key, result)
+        return dict(result)
+
+    def match_locations(self, triples) -> list[dict]:
+        """
+        Versión por lotes de match_location para una página de anuncios: cada terna
+        (ccaa, province, city) distinta se resuelve una sola vez y cada nivel se puntúa
+        con una llamada vectorizada por grupo de candidatos.
+        """
+        triples = [tuple(t) for t in triples]
+        results = {}
+        pending = []
+        for key in dict.fromkeys(triples):
+            result = self._cache_get(key)
+            if result is None:
+                pending.append(key)
+            else:
+                results[key] = result
+
+        if pending:
+            ccaa_guesses = self._group_best_matches({None: [c for c, _, _ in pending if c]}, lambda _: self._ccaa_candidates)
+
+            province_targets = {}
+            for c, p, _ in pending:
+                ccaa_guess = ccaa_guesses.get((None, c), (None, 0))[0] if c else None
+                if ccaa_guess and p:
+                    province_targets.setdefault(ccaa_guess, []).append(p)
+            province_guesses = self._group_best_matches(
+                province_targets, lambda c: self._province_candidates.get(c, NO_CANDIDATES)
+            )
+
+            city_targets = {}
+            for c, p, m in pending:
+                ccaa_guess = ccaa_guesses.get((None, c), (None, 0))[0] if c else None
+                province_guess = province_guesses.get((ccaa_guess, p), (None, 0))[0] if ccaa_guess and p else None
+                if province_guess and m:
+                    city_targets.setdefault((ccaa_guess, province_guess), []).append(m)
+            city_guesses = self._group_best_matches(
+                city_targets, lambda key: self._city_candidates.get(key, NO_CANDIDATES)
+            )
+
+            for key in pending:
+                c, p, m = key
+                results[key] = self._resolve(
+                    c, p, m,
+                    lambda c: ccaa_guesses[(None, c)],
+                    lambda cg, p: province_guesses[(cg, p)],
+                    lambda cg, pg, m: city_guesses[((cg, pg), m)]
+                )
+                self._cache_put(key, results[key])
+
+        return [dict(results[key]) for key in triples]
+
+    def _group_best_matches(self, targets_by_group: dict, get_candidates) -> dict:
+        """Puntúa los objetivos únicos de cada grupo contra sus candidatos: {(grupo, objetivo): (guess, score)}."""
+        guesses = {}
+        for group, targets in targets_by_group.items():
+            targets = list(dict.fromkeys(targets))
+            for target, result in zip(targets, self._best_match_many(targets, get_candidates(group))):
+                guesses[(group, target)] = result
+        return guesses
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+def get_location_matcher() -> LocationMatcher:
+    """Instancia compartida por todo el proceso; el CSV de referencia se lee en el primer uso."""
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = LocationMatcher()
+    return _matcher
+
 # if __name__ == "__main__":
 #     matcher = LocationMatcher()
     
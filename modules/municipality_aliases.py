@@ -0,0 +1,116 @@
+import threading
+from database.postgresqldb import PostgreSQLDB
+
+class MunicipalityAliases:
+    """
+    Tabla aprendida (ccaa, province, municipio tal cual lo publica Fotocasa) -> city_id.
+    Guarda las resoluciones caras (fuzzy o punto en polígono) para que cada texto distinto
+    solo se resuelva una vez, también entre ejecuciones.
+    Solo se aprenden resoluciones con confianza >= MIN_CONFIDENCE. Un alias fuzzy depende solo del
+    texto y se usa desde el principio; uno espacial sale de las coordenadas de cada anuncio (un barrio
+    puede repartirse entre varios municipios), así que se usa solo tras MIN_OBSERVATIONS anuncios que
+    coincidan y, si alguno cae en otro municipio, queda marcado como conflictivo y no se usa nunca.
+    """
+    SOURCES = {'fuzzy', 'spatial'}
+    MIN_CONFIDENCE = 90
+    MIN_OBSERVATIONS = 3
+
+    def __init__(self, db: PostgreSQLDB = None):
+        self.db = db or PostgreSQLDB()
+        self._lock = threading.Lock()
+        self._aliases = self._load()
+
+    def _load(self) -> dict:
+        rows = self.db.select_iter({
+            'table': 'municipality_aliases AS a',
+            'fields': ['a.ccaa', 'a.province', 'a.raw_municipality', 'a.city_id', 'a.confidence', 'a.source',
+                       'a.observations', 'a.conflicting', 'c.city_name'],
+            'joins': [{'type': 'INNER', 'table': 'cities AS c', 'on': 'c.city_id = a.city_id'}]
+        })
+        return {
+            (r['ccaa'], r['province'], r['raw_municipality']): {
+                'guess': r['city_name'], 'guess_id': r['city_id'], 'score': r['confidence'],
+                'source': r['source'], 'observations': r['observations'], 'conflicting': r['conflicting']
+            }
+            for r in rows
+        }
+
+    def __len__(self) -> int:
+        return len(self._aliases)
+
+    def _usable(self, alias: dict) -> bool:
+        if alias['conflicting'] or alias['score'] < self.MIN_CONFIDENCE:
+            return False
+        return alias['source'] == 'fuzzy' or alias['observations'] >= self.MIN_OBSERVATIONS
+
+    def lookup(self, ccaa: str, province: str, municipality: str):
+        """city_params del alias, o None si no existe o aún no es fiable (hay que resolverlo de nuevo)."""
+        alias = self._aliases.get((ccaa, province, municipality))
+        if alias is None or not self._usable(alias):
+            return None
+        return {k: alias[k] for k in ('guess', 'guess_id', 'score')}
+
+    def learn(self, ccaa: str, province: str, municipality: str, city_params: dict, source: str) -> None:
+        if source not in self.SOURCES:
+            raise ValueError(f"Origen de alias no permitido: {source}")
+        if city_params['guess_id'] is None or city_params['score'] < self.MIN_CONFIDENCE:
+            return
+
+        key = (ccaa, province, municipality)
+        with self._lock:
+            alias = self._aliases.get(key)
+            if alias is None:
+                self._aliases[key] = {
+                    'guess': city_params['guess'], 'guess_id': city_params['guess_id'], 'score': city_params['score'],
+                    'source': source, 'observations': 1, 'conflicting': False
+                }
+                changes = None
+            elif alias['source'] != 'spatial' or alias['conflicting']:
+                return
+            elif alias['guess_id'] == city_params['guess_id']:
+                alias['observations'] += 1
+                changes = {'observations': alias['observations']}
+            else:
+                # El mismo texto en anuncios de municipios distintos: las coordenadas deciden en cada anuncio
+                alias['conflicting'] = True
+                changes = {'conflicting': True}
+
+        if changes is None:
+            self.db.insert({
+                'table': 'municipality_aliases',
+                'values': {
+                    'ccaa': ccaa,
+                    'province': province,
+                    'raw_municipality': municipality,
+                    'city_id': int(city_params['guess_id']),
+                    'confidence': int(city_params['score']),
+                    'source': source
+                }
+            })
+        else:
+            self.db.update({
+                'table': 'municipality_aliases',
+                'values': changes,
+                'filters': {'where': [
+                    {'field': 'ccaa', 'operator': '=', 'value': ccaa},
+                    {'field': 'province', 'operator': '=', 'value': province},
+                    {'field': 'raw_municipality', 'operator': '=', 'value': municipality}
+                ]}
+            })
+
+_aliases = None
+_aliases_lock = threading.Lock()
+
+def get_municipality_aliases() -> MunicipalityAliases:
+    """Instancia compartida por todo el proceso; los alias se cargan de la base de datos en el primer uso."""
+    global _aliases
+    if _aliases is None:
+        with _aliases_lock:
+            if _aliases is None:
+                _aliases = MunicipalityAliases()
+    return _aliases
+
+# # Example usage
+# if __name__ == "__main__":
+#     aliases = MunicipalityAliases()
+#     print(len(aliases), aliases.lookup('Andalucía', 'Málaga', 'Nueva Andalucía'))
@@ -0,0 +1,37 @@
+import hashlib
+
+class PageFingerprints:
+    """
+    Huellas de las páginas ya vistas de una provincia, calculadas con los propertyId de la
+    respuesta v1 en su orden. Detecta al momento las páginas que el origen está reciclando
+    (idénticas a una anterior o con al menos `overlap_threshold` de sus anuncios ya vistos),
+    antes de pedir la v2 y de enriquecerlas.
+    """
+    def __init__(self, overlap_threshold: float = 0.8):
+        self.overlap_threshold = overlap_threshold
+        self.fingerprints = set()
+        self.seen_ids = set()
+
+    @staticmethod
+    def fingerprint(ids) -> str:
+        return hashlib.blake2b(",".join(map(str, ids)).encode(), digest_size=16).hexdigest()
+
+    def check(self, ids) -> dict:
+        """
+        Clasifica la página sin registrarla: {'recycled', 'repeated', 'overlap'}, es decir, si debe
+        darse por reciclada, si es copia exacta de otra y qué fracción de sus anuncios ya se había visto.
+        """
+        ids = [i for i in ids if i is not None]
+        if not ids:
+            return {'recycled': False, 'repeated': False, 'overlap': 0.0}
+        repeated = self.fingerprint(ids) in self.fingerprints
+        unique = set(ids)
+        overlap = len(unique & self.seen_ids) / len(unique)
+        return {'recycled': repeated or overlap >= self.overlap_threshold, 'repeated': repeated, 'overlap': overlap}
+
+    def record(self, ids) -> None:
+        """Registra la página una vez procesada (una petición fallida se reintenta sin contar como vista)."""
+        ids = [i for i in ids if i is not None]
+        if ids:
+            self.fingerprints.add(self.fingerprint(ids))
+            self.seen_ids.update(ids)
@@ -0,0 +1,73 @@
+import json
+import os
+
+# Capas de puntos de interés definidas por reglas de etiquetas OSM.
+# Cada capa es una lista de reglas (OR); cada regla es un dict etiqueta -> valor(es) (AND).
+# Un valor True indica que basta con que la etiqueta exista. Un nodo puede pertenecer a varias capas.
+DEFAULT_LAYERS = {
+    'bus': [{'highway': 'bus_stop'}, {'public_transport': 'bus'}],
+    'train': [{'railway': ['station', 'halt']}, {'public_transport': 'train'}],
+    'tram': [{'railway': 'tram_stop'}, {'public_transport': 'tram'}],
+    'metro': [{'railway': 'station', 'station': 'subway'}, {'railway': 'subway_entrance'}],
+    'school': [{'amenity': 'school'}],
+    'hospital': [{'amenity': 'hospital'}],
+    'supermarket': [{'shop': 'supermarket'}],
+    'beach': [{'natural': 'beach'}],
+}
+
+# Versión de las reglas de filtrado de los PBF; cambiarla obliga a volver a filtrarlos
+FILTER_VERSION = 2  # 2: vías y multipolígonos de POI con sus nodos (centroides de colegios, playas...)
+
+class LayerMatcher:
+    def __init__(self, layers: dict = None):
+        self.layers = layers or DEFAULT_LAYERS
+        self.names = list(self.layers)
+        self._rules = []
+        for name, rules in self.layers.items():
+            for rule in rules:
+                compiled = []
+                for key, value in rule.items():
+                    if value is True:
+                        compiled.append((key, None))
+                    else:
+                        compiled.append((key, {value} if isinstance(value, str) else set(value)))
+                self._rules.append((name, compiled))
+        self._keys = {key for _, rule in self._rules for key, _ in rule}
+
+    def signature(self) -> str:
+        """Identifica la configuración de capas (para invalidar índices persistidos)."""
+        return json.dumps(self.layers, sort_keys=True)
+
+    def filter_signature(self) -> str:
+        """Identifica las reglas con las que se filtró un PBF: capas y versión del filtrado."""
+        return json.dumps({'version': FILTER_VERSION, 'layers': self.layers}, sort_keys=True)
+
+    @staticmethod
+    def _filter_signature_path(pbf_path: str) -> str:
+        return f"{pbf_path}.layers.json"
+
+    def is_filtered_with(self, pbf_path: str) -> bool:
+        """True si el PBF filtrado existe y se generó con esta configuración de capas."""
+        signature_path = self._filter_signature_path(pbf_path)
+        if not (os.path.exists(pbf_path) and os.path.exists(signature_path)):
+            return False
+        with open(signature_path, encoding="utf-8") as f:
+            return f.read() == self.filter_signature()
+
+    def mark_filtered(self, pbf_path: str) -> None:
+        with open(self._filter_signature_path(pbf_path), "w", encoding="utf-8") as f:
+            f.write(self.filter_signature())
+
+    def match(self, tags) -> list[str]:
+        """Devuelve las capas a las que pertenece un objeto con las etiquetas dadas."""
+        values = {key: tags.get(key) for key in self._keys if key in tags}
+        if not values:
+            return []
+
+        matched = []
+        for name, rule in self._rules:
+            if name in matched:
+                continue
+            if all(key in values and (allowed is None or values[key] in allowed) for key, allowed in rule):
+                matched.append(name)
+        return matched
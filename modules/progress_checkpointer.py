@@ -0,0 +1,39 @@
+import time
+from utils.update_current_page_on_province import current_page_params, update_current_page_on_province
+
+class ProgressCheckpointer:
+    """
+    Acumula el progreso (última página procesada) de una provincia y lo escribe como mucho cada
+    `flush_every` páginas o `flush_interval` segundos, en la misma transacción que los anuncios
+    de la página. Así fetched_pages nunca va por delante de ads_data.
+    """
+    def __init__(self, province_index: int, flush_every: int = 10, flush_interval: float = 30.0):
+        self.province_index = province_index
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.pending_page = None
+        self.pages_since_flush = 0
+        self.last_flush = time.monotonic()
+
+    def record(self, page: int) -> None:
+        self.pending_page = page
+        self.pages_since_flush += 1
+
+    def due_update(self):
+        """Parámetros del UPDATE de progreso si toca volcarlo con esta página, o None."""
+        if self.pending_page is None:
+            return None
+        if self.pages_since_flush >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            return current_page_params(self.province_index, self.pending_page)
+        return None
+
+    def mark_flushed(self) -> None:
+        self.pending_page = None
+        self.pages_since_flush = 0
+        self.last_flush = time.monotonic()
+
+    def flush(self) -> None:
+        """Vuelca el progreso pendiente por separado (fin de provincia o parada temprana)."""
+        if self.pending_page is not None:
+            update_current_page_on_province(self.province_index, self.pending_page)
+            self.mark_flushed()
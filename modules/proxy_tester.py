@@ -1,5 +1,4 @@
 import requests
-from bs4 import BeautifulSoup
 import concurrent.futures
 import time
 import logging
@@ -44,6 +43,7 @@ class ProxyTester:
             logging.error("No se pudo obtener la lista de proxies.")
             return []
 
+        from bs4 import BeautifulSoup  # Solo al descargar la lista de proxies
         soup = BeautifulSoup(response.text, 'html.parser')
         table = soup.find('table', {'class': 'table table-striped table-bordered'})
         if not table:
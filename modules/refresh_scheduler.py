@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from database.postgresqldb import PostgreSQLDB
+
+# Re-rastreo de una provincia cuando se espera que acumule unos TARGET_CHANGES anuncios nuevos o cambiados
+TARGET_CHANGES = 300
+MIN_INTERVAL = timedelta(hours=6)
+MAX_INTERVAL = timedelta(days=14)
+DEFAULT_INTERVAL = timedelta(days=1)  # Provincias sin historial suficiente para estimar su ritmo
+CHURN_SMOOTHING = 0.5  # Peso de la última medida en la media móvil de cambios/día
+
+# Provincias ya rastreadas cuyo re-rastreo toca, las que más cambios pendientes se esperan primero.
+# Se vuelven a poner a cero para que main.py las recorra desde la primera página.
+START_DUE_QUERY = """
+    WITH due AS (
+        SELECT province_id
+        FROM provinces
+        WHERE is_fetched AND (next_crawl_at IS NULL OR next_crawl_at <= %(now)s)
+        ORDER BY COALESCE(churn_per_day, 0) * EXTRACT(EPOCH FROM %(now)s - COALESCE(crawl_started_at, %(now)s)) DESC, province_id
+        LIMIT %(limit)s
+    )
+    UPDATE provinces AS p
+    SET is_fetched = FALSE,
+        fetched_pages = 0,
+        last_crawl_started_at = p.crawl_started_at,
+        crawl_started_at = %(now)s
+    FROM due
+    WHERE p.province_id = due.province_id
+    RETURNING p.province_id
+"""
+
+# Provincias en su primer rastreo: se anota cuándo empezó para poder medir el siguiente intervalo
+START_FIRST_QUERY = """
+    UPDATE provinces SET crawl_started_at = %(now)s
+    WHERE NOT is_fetched AND crawl_started_at IS NULL
+"""
+
+# Anuncios insertados o con contenido cambiado por el rastreo en curso (updated_at solo avanza si cambian)
+CHANGES_QUERY = """
+    SELECT p.crawl_started_at, p.last_crawl_started_at, p.churn_per_day, COUNT(a.ad_id) AS changes
+    FROM provinces AS p
+    LEFT JOIN cities AS c ON c.province_id = p.province_id
+    LEFT JOIN ads_data AS a ON a.city_id = c.city_id AND a.updated_at >= p.crawl_started_at
+    WHERE p.province_id = %(province_id)s
+    GROUP BY p.province_id
+"""
+
+class RefreshScheduler:
+    """
+    Re-rastreo recurrente de cada provincia con una cadencia proporcional a su ritmo de cambios:
+    los anuncios nuevos o cambiados que encuentra cada rastreo divididos por el tiempo desde el
+    anterior. Las provincias con mucho movimiento se refrescan cada pocas horas y las tranquilas
+    cada varios días, de modo que el presupuesto de proxies y peticiones va donde cambian los datos.
+    """
+
+    def __init__(self, db: PostgreSQLDB = None, target_changes: int = TARGET_CHANGES,
+                 min_interval: timedelta = MIN_INTERVAL, max_interval: timedelta = MAX_INTERVAL):
+        self.db = db or PostgreSQLDB()
+        self.target_changes = target_changes
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+    def _fetch(self, query: str, values: dict) -> List[dict]:
+        with self.db.connection() as conn, conn.cursor() as cur:
+            cur.execute(query, values)
+            return cur.fetchall() if cur.description else []
+
+    def interval_for(self, churn_per_day: Optional[float]) -> timedelta:
+        if not churn_per_day:
+            return DEFAULT_INTERVAL if churn_per_day is None else self.max_interval
+        interval = timedelta(days=self.target_changes / churn_per_day)
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def start_due(self, limit: int = None, now: datetime = None) -> List[int]:
+        """Reabre para rastreo las provincias a las que les toca (como mucho limit) y devuelve sus ids."""
+        now = now or datetime.now(timezone.utc)
+        self._fetch(START_FIRST_QUERY, {'now': now})
+        rows = self._fetch(START_DUE_QUERY, {'now': now, 'limit': limit})
+        return [r['province_id'] for r in rows]
+
+    def complete(self, province_id: int, now: datetime = None) -> dict:
+        """
+        Cierra el rastreo de la provincia: mide sus cambios/día frente al rastreo anterior,
+        actualiza la media y programa el siguiente. Devuelve la planificación resultante.
+        """
+        now = now or datetime.now(timezone.utc)
+        row = self._fetch(CHANGES_QUERY, {'province_id': province_id})[0]
+        churn = row['churn_per_day']
+        if row['crawl_started_at'] and row['last_crawl_started_at']:
+            elapsed_days = (row['crawl_started_at'] - row['last_crawl_started_at']).total_seconds() / 86400
+            if elapsed_days > 0:
+                measured = row['changes'] / elapsed_days
+                churn = measured if churn is None else (1 - CHURN_SMOOTHING) * churn + CHURN_SMOOTHING * measured
+
+        next_crawl_at = now + self.interval_for(churn)
+        self.db.update({
+            'table': 'provinces',
+            'values': {'churn_per_day': churn, 'next_crawl_at': next_crawl_at},
+            'filters': {'where': {'field': 'province_id', 'operator': '=', 'value': province_id}}
+        })
+        return {'province_id': province_id, 'changes': row['changes'], 'churn_per_day': churn, 'next_crawl_at': next_crawl_at}
+
+    def next_due_at(self) -> Optional[datetime]:
+        """Próximo momento en que vence el re-rastreo de alguna provincia."""
+        rows = self.db.select({
+            'table': 'provinces',
+            'fields': ['next_crawl_at'],
+            'filters': {
+                'where': {'field': 'next_crawl_at', 'operator': 'IS NOT NULL'},
+                'order_by': [{'field': 'next_crawl_at', 'direction': 'ASC'}],
+                'limit': 1
+            }
+        })
+        return rows[0]['next_crawl_at'] if rows else None
+
+# # Example usage
+# if __name__ == "__main__":
+#     scheduler = RefreshScheduler()
+#     print(scheduler.start_due(limit=5))
+#     print(scheduler.complete(province_id=29))
@@ -0,0 +1,77 @@
+import os
+import threading
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely import STRtree
+from utils.build_boundaries_asset import BOUNDARIES_ASSET_PATH, BOUNDARY_COLUMNS, build_boundaries_asset
+
+class ReverseGeocoder:
+    def __init__(self, asset_path: str = BOUNDARIES_ASSET_PATH):
+        self.asset_path = asset_path
+        self.municipalities = self._load_municipalities()
+        names = self.municipalities['NAMEUNIT']
+        self.names = names.astype(object).where(names.notna(), None).to_numpy()
+        self.ine_codes = self.municipalities['ine_code'].to_numpy(dtype=object)
+        # Recintos preparados una vez: cada punto se evalúa con 'contains' contra los polígonos candidatos del árbol
+        self.polygons = np.asarray(self.municipalities.geometry.values, dtype=object)
+        shapely.prepare(self.polygons)
+        self.tree = STRtree(self.polygons)
+
+    def _load_municipalities(self) -> gpd.GeoDataFrame:
+        # El asset precompilado se genera una vez a partir de los shapefiles si aún no existe
+        if not os.path.exists(self.asset_path):
+            build_boundaries_asset(output_path=self.asset_path)
+        # Con memoria mapeada los procesos del pool de enriquecimiento leen el WKB de la misma caché de páginas
+        return gpd.read_parquet(self.asset_path, columns=BOUNDARY_COLUMNS, memory_map=True)
+
+    def _match_many(self, latitudes, longitudes) -> np.ndarray:
+        """
+        Devuelve, para cada punto, la posición del recinto que lo contiene (-1 si no cae en ninguno),
+        resolviendo todos los puntos con una única consulta al STRtree.
+        """
+        points = shapely.points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+        matches = np.full(len(points), -1)
+        if len(points) == 0:
+            return matches
+
+        # Candidatos por caja envolvente; el predicado con los polígonos (preparados) como primer argumento
+        point_idx, polygon_idx = self.tree.query(points)
+        inside = shapely.contains(self.polygons[polygon_idx], points[point_idx])
+        point_idx, polygon_idx = point_idx[inside], polygon_idx[inside]
+        if point_idx.size:
+            # Si un punto cae en varios recintos (p. ej. sobre una frontera) se queda el primero del asset
+            order = np.lexsort((polygon_idx, point_idx))
+            point_idx, polygon_idx = point_idx[order], polygon_idx[order]
+            first = np.r_[True, point_idx[1:] != point_idx[:-1]]
+            matches[point_idx[first]] = polygon_idx[first]
+        return matches
+
+    def _take(self, values, matches) -> list:
+        result = np.full(len(matches), None, dtype=object)
+        found = matches >= 0
+        result[found] = values[matches[found]]
+        return result.tolist()
+
+    def lookup_many(self, latitudes, longitudes) -> list:
+        """Municipio (NAMEUNIT) que contiene cada punto, o None."""
+        return self._take(self.names, self._match_many(latitudes, longitudes))
+
+    def lookup_many_ine_codes(self, latitudes, longitudes) -> list:
+        """Código INE del municipio que contiene cada punto, o None."""
+        return self._take(self.ine_codes, self._match_many(latitudes, longitudes))
+
+    def lookup(self, latitude, longitude):
+        return self.lookup_many([latitude], [longitude])[0]
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+def get_reverse_geocoder() -> ReverseGeocoder:
+    """Instancia compartida por todo el proceso; los polígonos se cargan una única vez."""
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                _geocoder = ReverseGeocoder()
+    return _geocoder
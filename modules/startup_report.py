@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+class StartupReport:
+    """
+    Tiempos del arranque de un proceso por fases (imports, proxies, índices...). mark() cierra una
+    fase que empieza al final de la anterior; phase() mide solo su bloque y el tiempo entre fases va
+    a "otros", así que la suma de las fases y "otros" es el tiempo total hasta empezar a trabajar.
+    Lo que se carga en el primer uso, después del informe, se mide con first_use().
+    Para el detalle de los imports, `python -X importtime main.py`.
+    """
+    def __init__(self, started_at: float = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self._last = self.started_at
+        self.other = 0.0
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, name: str) -> float:
+        """Cierra la fase `name` en este instante y devuelve su duración en segundos."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+        return self.phases[-1][1]
+
+    @contextmanager
+    def phase(self, name: str):
+        now = time.perf_counter()
+        self.other += now - self._last
+        self._last = now
+        try:
+            yield
+        finally:
+            self.mark(name)
+
+    @property
+    def total(self) -> float:
+        return self._last - self.started_at
+
+    def report(self) -> str:
+        phases = [f"{name} {seconds:.2f} s" for name, seconds in self.phases]
+        if self.other >= 0.005:
+            phases.append(f"otros {self.other:.2f} s")
+        return f"⏱️ Arranque en {self.total:.2f} s ({', '.join(phases)})"
+
+@contextmanager
+def first_use(name: str):
+    """Mide la carga diferida de `name` (índices que se construyen en el primer uso, fuera del informe de arranque)."""
+    start = time.perf_counter()
+    yield
+    print(f"⏱️ {name} cargado en {time.perf_counter() - start:.2f} s (primer uso)")
+
+# # Example usage
+# if __name__ == "__main__":
+#     startup = StartupReport()
+#     with startup.phase('espera'):
+#         time.sleep(0.1)
+#     print(startup.report())
+#     with first_use('índice'):
+#         time.sleep(0.1)
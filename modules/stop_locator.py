@@ -1,87 +1,309 @@
-import osmium as osm
-from geopy.distance import geodesic
-from rtree import index
+import hashlib
+import json
+import threading
+import numpy as np
 import os
-from modules.transport_downloader import TransportDownloader
+from modules.poi_layers import LayerMatcher
+from modules.startup_report import first_use
+
+# osmium, scipy y el descargador se importan en el primer uso: cargar el índice persistido no necesita osmium
 
 BASED_DIR = os.path.join(os.getcwd(), "assets",'public_transport')
+STOPS_INDEX_PATH = os.path.join(BASED_DIR, "stops_index.json")
+SHARED_INDEX_DIR = os.path.join(BASED_DIR, "shared_index")
+REGIONS = ("spain", "canary-islands")
+EARTH_RADIUS_M = 6371008.8
+
+def _to_unit_xyz(lats, lons):
+    """Proyecta (lat, lon) sobre la esfera unidad para poder usar distancias euclídeas en el KD-tree."""
+    lat = np.radians(np.asarray(lats, dtype=float))
+    lon = np.radians(np.asarray(lons, dtype=float))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)))
+
+def _chord_to_meters(chord):
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.clip(chord / 2, 0, 1))
 
 class StopLocator:
-    def __init__(self):
-        self.pbf_files = [
-            os.path.join(BASED_DIR, "spain-transporte-publico.osm.pbf"),
-            os.path.join(BASED_DIR, "canary-islands-transporte-publico.osm.pbf")
-        ]
+    def __init__(self, index_path=None, layers=None, based_dir=BASED_DIR, regions=REGIONS):
+        self.based_dir = based_dir
+        self.pbf_files = {region: os.path.join(based_dir, f"{region}-transporte-publico.osm.pbf") for region in regions}
+        self.index_path = index_path or os.path.join(based_dir, "stops_index.json")
+        self.matcher = LayerMatcher(layers)
+        self.layers = self.matcher.names
+        self._signature = None
         self._ensure_data_available()
-        self.stops = self._build_spatial_index()
+        self.stops = {t: self._build_layer_index(coords) for t, coords in self._load_stop_coords().items()}
 
     def _ensure_data_available(self):
-        if not all(os.path.exists(p) for p in self.pbf_files):
+        # También si los PBF se filtraron con otra configuración de capas (les faltarían las etiquetas nuevas)
+        if not all(self.matcher.is_filtered_with(p) for p in self.pbf_files.values()):
             print("Downloading and filtering transport data...")
-            TransportDownloader().get_transport_data(BASED_DIR)
+            from modules.transport_downloader import TransportDownloader
+            TransportDownloader(matcher=self.matcher).get_transport_data(self.based_dir, regions=list(self.pbf_files))
 
         # Re-verifica después de la descarga
-        for pbf_file in self.pbf_files:
+        for pbf_file in self.pbf_files.values():
             if not os.path.exists(pbf_file):
                 raise FileNotFoundError(f"Required PBF file not found: {pbf_file}")
 
-    def _build_spatial_index(self):
-        idx = {t: index.Index() for t in ['bus', 'train', 'tram']}
-        coords = {t: {} for t in ['bus', 'train', 'tram']}
-        counters = {t: 0 for t in ['bus', 'train', 'tram']}
+    def _scan_pbf_files(self, nodes=True):
+        """
+        Extrae todas las capas en una única pasada por cada PBF: los POI mapeados como nodo con su id
+        y los mapeados como área (vía cerrada o multipolígono) por su centroide, con clave -id de área
+        de osmium para no chocar con los ids de nodo. Con nodes=False solo se extraen las áreas.
+        """
+        import osmium as osm
+        coords = {t: {} for t in self.layers}
+        matcher = self.matcher
 
         class Handler(osm.SimpleHandler):
             def node(self, n):
-                lat, lon = n.location.lat, n.location.lon
-                if n.tags.get('highway') == 'bus_stop' or n.tags.get('public_transport') == 'bus':
-                    t = 'bus'
-                elif n.tags.get('railway') in ['station', 'halt'] or n.tags.get('public_transport') == 'train':
-                    t = 'train'
-                elif n.tags.get('railway') == 'tram_stop' or n.tags.get('public_transport') == 'tram':
-                    t = 'tram'
-                else:
+                if nodes:
+                    for t in matcher.match(n.tags):
+                        coords[t][n.id] = (n.location.lat, n.location.lon)
+
+            def area(self, a):
+                layers = matcher.match(a.tags)
+                if not layers:
                     return
+                vertices = [(p.lat, p.lon) for ring in a.outer_rings() for p in list(ring)[:-1] if p.location.valid()]
+                if not vertices:
+                    return
+                centroid = tuple(np.mean(vertices, axis=0).tolist())
+                for t in layers:
+                    coords[t][-a.id] = centroid
+
+        handler = Handler()
+        for pbf_file in self.pbf_files.values():
+            handler.apply_file(pbf_file, locations=True)
+        return coords
+
+    def _pbf_stats(self):
+        """Tamaño y fecha de modificación de cada PBF filtrado, para saber si el índice se generó a partir de ellos."""
+        stats = {}
+        for region, pbf_file in self.pbf_files.items():
+            st = os.stat(pbf_file)
+            stats[region] = [st.st_size, st.st_mtime_ns]
+        return stats
+
+    def _load_stop_coords(self):
+        """
+        Carga los POI (id de nodo OSM -> (lat, lon)) de cada capa del índice persistido,
+        regenerándolo a partir de los PBF filtrados si no existe, si la configuración de capas ha cambiado
+        o si los PBF ya no son los que se usaron para generarlo (p. ej. tras una descarga completa).
+        """
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get('layers') == self.matcher.signature() and data.get('pbf') == self._pbf_stats():
+                return {t: {int(i): tuple(c) for i, c in data['nodes'].get(t, {}).items()} for t in self.layers}
+
+        coords = self._scan_pbf_files()
+        self._save_stop_coords(coords)
+        return coords
+
+    def _save_stop_coords(self, coords):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                'layers': self.matcher.signature(),
+                'pbf': self._pbf_stats(),
+                'nodes': {t: {str(i): list(c) for i, c in coords[t].items()} for t in self.layers}
+            }, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _build_layer_index(self, coords):
+        from scipy.spatial import cKDTree
+        if not coords:
+            return {'tree': None, 'points': np.empty((0, 2)), 'coords': coords}
+        points = np.array(list(coords.values()), dtype=float)
+        return {'tree': cKDTree(_to_unit_xyz(points[:, 0], points[:, 1])), 'points': points, 'coords': coords}
+
+    def signature(self):
+        """Huella de la configuración de capas y de sus POI; cambia con cualquier alta, baja o movimiento."""
+        if self._signature is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for t in self.layers:
+                digest.update(t.encode())
+                digest.update(np.ascontiguousarray(self.stops[t]['points'], dtype=float).tobytes())
+            self._signature = json.dumps({'layers': self.matcher.signature(), 'points': digest.hexdigest()}, sort_keys=True)
+        return self._signature
+
+    def export_shared(self, directory=SHARED_INDEX_DIR):
+        """
+        Vuelca los puntos de cada capa a ficheros .npy para que otros procesos los abran con
+        memoria mapeada (from_shared) en lugar de cargar y copiar el índice cada uno.
+        Solo se reescriben si ha cambiado la configuración de capas o los POI.
+        """
+        os.makedirs(directory, exist_ok=True)
+        signature = self.signature()
+        signature_path = os.path.join(directory, "signature.json")
+        if os.path.exists(signature_path):
+            with open(signature_path, encoding="utf-8") as f:
+                if f.read() == signature:
+                    return directory
 
-                i = counters[t]
-                idx[t].insert(i, (lon, lat, lon, lat))
-                coords[t][i] = (lat, lon)
-                counters[t] += 1
+        for t in self.layers:
+            points = np.ascontiguousarray(self.stops[t]['points'], dtype=float).reshape(-1, 2)
+            np.save(os.path.join(directory, f"{t}.points.npy"), points)
+            np.save(os.path.join(directory, f"{t}.xyz.npy"), np.ascontiguousarray(_to_unit_xyz(points[:, 0], points[:, 1])))
+        with open(signature_path, "w", encoding="utf-8") as f:
+            f.write(signature)
+        return directory
+
+    @classmethod
+    def from_shared(cls, directory=SHARED_INDEX_DIR, layers=None):
+        """
+        Índice de solo lectura sobre los ficheros de export_shared, abiertos con memoria mapeada:
+        todos los procesos comparten las mismas páginas y el KD-tree se construye sin copiar los puntos.
+        No admite apply_changes ni update.
+        """
+        from scipy.spatial import cKDTree
+        locator = cls.__new__(cls)
+        locator.index_path = None
+        locator.matcher = LayerMatcher(layers)
+        locator.layers = locator.matcher.names
+        locator.stops = {}
+        with open(os.path.join(directory, "signature.json"), encoding="utf-8") as f:
+            locator._signature = f.read()
+        for t in locator.layers:
+            points = np.load(os.path.join(directory, f"{t}.points.npy"), mmap_mode='r')
+            xyz = np.load(os.path.join(directory, f"{t}.xyz.npy"), mmap_mode='r')
+            tree = cKDTree(xyz, copy_data=False) if len(xyz) else None
+            locator.stops[t] = {'tree': tree, 'points': points, 'coords': None}
+        return locator
+
+    def apply_changes(self, change_files, rescan_areas=False):
+        """
+        Aplica ficheros de cambios OSM (.osc) sobre el índice de POI en memoria y persistido.
+        Solo se tocan los nodos añadidos, movidos o eliminados y solo se reconstruyen las capas afectadas.
+        Un .osc no trae la posición de los vértices que no cambian, así que los centroides de las áreas
+        solo se recalculan (rescan_areas) a partir de los PBF filtrados ya actualizados.
+        Devuelve el recuento de cada caso.
+        """
+        import osmium as osm
+        layers = self.layers
+        coords = {t: self.stops[t]['coords'] for t in layers}
+        matcher = self.matcher
+        summary = {'added': 0, 'moved': 0, 'removed': 0}
+        touched = set()
+
+        class Handler(osm.SimpleHandler):
+            def node(self, n):
+                new_layers = [] if n.deleted else matcher.match(n.tags)
+
+                # POI eliminado o que ha dejado de pertenecer a alguna capa
+                for t in layers:
+                    if t not in new_layers and coords[t].pop(n.id, None) is not None:
+                        summary['removed'] += 1
+                        touched.add(t)
+
+                for t in new_layers:
+                    new = (n.location.lat, n.location.lon)
+                    old = coords[t].get(n.id)
+                    if old == new:
+                        continue
+                    summary['moved' if old is not None else 'added'] += 1
+                    coords[t][n.id] = new
+                    touched.add(t)
 
         handler = Handler()
-        for pbf_file in self.pbf_files:
-            handler.apply_file(pbf_file)
+        for change_file in change_files:
+            handler.apply_file(change_file)
 
-        return {t: {'index': idx[t], 'coords': coords[t]} for t in ['bus', 'train', 'tram']}
+        if rescan_areas:
+            areas = self._scan_pbf_files(nodes=False)
+            for t in layers:
+                old = {k: c for k, c in coords[t].items() if k < 0}
+                new = areas[t]
+                for k in old.keys() - new.keys():
+                    del coords[t][k]
+                    summary['removed'] += 1
+                    touched.add(t)
+                for k, c in new.items():
+                    if old.get(k) != c:
+                        summary['moved' if k in old else 'added'] += 1
+                        coords[t][k] = c
+                        touched.add(t)
+
+        for t in touched:
+            self.stops[t] = self._build_layer_index(coords[t])
+        if touched:
+            self._signature = None
+        self._save_stop_coords(coords)
+        return summary
+
+    def update(self, change_files):
+        """
+        Actualización incremental: recibe {región: [ficheros .osc]} ordenados cronológicamente,
+        los aplica a los PBF filtrados y después al índice de POI, sin descarga ni filtrado completo.
+        """
+        from modules.transport_downloader import TransportDownloader
+        TransportDownloader(matcher=self.matcher).update_transport_data(self.based_dir, change_files)
+        return self.apply_changes([f for region in self.pbf_files if region in change_files for f in change_files[region]], rescan_areas=True)
+
+    def nearest_many(self, lats, lons, radius_km=None):
+        """
+        Consulta vectorizada: para cada punto devuelve la distancia (m) y la posición del POI más cercano
+        de cada capa. Los puntos sin coordenadas o sin POI dentro de radius_km quedan a NaN.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        valid = ~(np.isnan(lats) | np.isnan(lons))
+        xyz = _to_unit_xyz(lats[valid], lons[valid])
+        upper_bound = 2 * np.sin(radius_km * 1000 / (2 * EARTH_RADIUS_M)) if radius_km else np.inf
 
-    def find_nearest(self, lat, lon, radius_km=5):
         results = {}
-        point = (lat, lon)
-        deg_radius = radius_km / 111.32
+        for t in self.layers:
+            distances = np.full(len(lats), np.nan)
+            positions = np.full((len(lats), 2), np.nan)
+            layer = self.stops[t]
+            if layer['tree'] is not None and valid.any():
+                chord, nearest = layer['tree'].query(xyz, distance_upper_bound=upper_bound)
+                found = np.isfinite(chord)
+                rows = np.flatnonzero(valid)[found]
+                distances[rows] = np.round(_chord_to_meters(chord[found]))
+                positions[rows] = layer['points'][nearest[found]]
+            results[t] = {'distance_m': distances, 'coordinates': positions}
+        return results
 
-        for t in ['bus', 'train', 'tram']:
-            idx = self.stops[t]['index']
-            coords = self.stops[t]['coords']
-            candidates = list(idx.nearest((lon - deg_radius, lat - deg_radius, lon + deg_radius, lat + deg_radius), 5))
+    def nearest_distances(self, lats, lons, radius_km=None):
+        """Distancia (m) al POI más cercano de cada capa para todos los puntos de una página."""
+        return {t: r['distance_m'] for t, r in self.nearest_many(lats, lons, radius_km).items()}
 
-            if not candidates:
+    def find_nearest(self, lat, lon, radius_km=None):
+        results = {}
+        for t, r in self.nearest_many([lat], [lon], radius_km).items():
+            if np.isnan(r['distance_m'][0]):
                 results[t] = None
-                continue
+            else:
+                results[t] = {'distance_m': int(r['distance_m'][0]), 'coordinates': tuple(float(c) for c in r['coordinates'][0])}
+        return results
 
-            closest = min(
-                ((geodesic(point, coords[i]).meters, coords[i]) for i in candidates),
-                key=lambda x: x[0]
-            )
-            results[t] = {'distance_m': round(closest[0]), 'coordinates': closest[1]}
+_locator = None
+_locator_lock = threading.Lock()
 
-        return results
+def get_stop_locator() -> StopLocator:
+    """Instancia compartida por todo el proceso; el índice de POI se carga una sola vez, en el primer uso."""
+    global _locator
+    if _locator is None:
+        with _locator_lock:
+            if _locator is None:
+                with first_use('Índice de POI'):
+                    _locator = StopLocator()
+    return _locator
 
 # # Ejemplo de uso
 # if __name__ == "__main__":
 #     locator = StopLocator()
 #     nearest_stops = locator.find_nearest(27.940335643166776, -15.56964137086057)  # Coordenadas en Canarias
 #     print("Nearest Stops:")
-#     for transport_type, data in nearest_stops.items():
+#     for layer, data in nearest_stops.items():
 #         if data:
-#             print(f"{transport_type.capitalize()}: {data['distance_m']:.1f} m - Coord: {data['coordinates']}")
+#             print(f"{layer.capitalize()}: {data['distance_m']:.1f} m - Coord: {data['coordinates']}")
 #         else:
-#             print(f"{transport_type.capitalize()}: Not found within radius")
+#             print(f"{layer.capitalize()}: Not found within radius")
+#
+#     # Actualización semanal con ficheros de cambios locales
+#     print(locator.update({"canary-islands": ["assets/osm/canary-islands-000123.osc.gz"]}))
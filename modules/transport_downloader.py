@@ -1,51 +1,94 @@
 import osmium as osm
 import requests
 import os
+from modules.poi_layers import LayerMatcher
 
 class TransportDownloader(osm.SimpleHandler):
-    def __init__(self, writer=None):
+    def __init__(self, writer=None, matcher=None, areas=None):
         super().__init__()
         self.writer = writer
+        self.matcher = matcher or LayerMatcher()
+        self.areas = areas  # IdTracker con las vías y nodos que forman las áreas de POI
+
+    def is_poi_area(self, obj) -> bool:
+        """Vía cerrada o multipolígono con etiquetas de alguna capa (colegio, hospital, playa, estación...)."""
+        if not self.matcher.match(obj.tags):
+            return False
+        if isinstance(obj, osm.osm.Way):
+            return len(obj.nodes) > 3 and obj.nodes[0].ref == obj.nodes[-1].ref
+        return obj.tags.get('type') == 'multipolygon'
 
     def node(self, n):
         tags = n.tags
         if 'public_transport' in tags or 'railway' in tags or tags.get('highway') == 'bus_stop' or tags.get('amenity') == 'bus_station':
             self.writer.add_node(n)
+        elif self.matcher.match(tags):  # Resto de capas de POI (colegios, hospitales, playas...)
+            self.writer.add_node(n)
+        elif self.areas is not None and n.id in self.areas.node_ids():  # Vértice de un área de POI
+            self.writer.add_node(n)
 
     def way(self, w):
         if any(k in w.tags for k in ['railway', 'route', 'public_transport']):
             self.writer.add_way(w)
+        elif self.areas is not None and w.id in self.areas.way_ids():
+            self.writer.add_way(w)
 
     def relation(self, r):
         if r.tags.get('route') in ['bus', 'tram', 'train', 'subway']:
             self.writer.add_relation(r)
+        elif self.is_poi_area(r):
+            self.writer.add_relation(r)
+
+    def track_poi_areas(self, input_path):
+        """
+        Primera pasada del filtrado: vías y multipolígonos de POI y, después, todos los nodos que los forman,
+        para que el PBF filtrado permita calcular sus centroides (la mayoría de colegios, hospitales y playas
+        están mapeados como áreas y no como nodos).
+        """
+        areas = osm.IdTracker()
+        for obj in osm.FileProcessor(input_path, osm.osm.WAY | osm.osm.RELATION):
+            if self.is_poi_area(obj):
+                if isinstance(obj, osm.osm.Way):
+                    areas.add_way(obj.id)
+                areas.add_references(obj)
+        areas.complete_backward_references(input_path)
+        return areas
 
     def download_file(self, url, path):
         if not os.path.exists(path):
             print(f"Downloading: {url}")
             r = requests.get(url)
             if r.ok:
-                with open(path, 'wb') as f:
+                # Un proceso interrumpido a medias deja solo el .tmp; el PBF truncado nunca llega a la ruta final
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'wb') as f:
                     f.write(r.content)
+                os.replace(tmp_path, path)
                 print(f"Downloaded: {os.path.basename(path)}")
             else:
                 print(f"Failed to download {url} ({r.status_code})")
 
     def filter_transport(self, input_path, output_path):
-        if not os.path.exists(output_path):
-            writer = osm.SimpleWriter(output_path)
-            handler = TransportDownloader(writer)
-            handler.apply_file(input_path)
-            writer.close()
-            print(f"Filtered: {os.path.basename(output_path)}")
+        """Filtra el PBF si aún no existe o si se filtró con otra configuración de capas."""
+        if self.matcher.is_filtered_with(output_path):
+            return
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        writer = osm.SimpleWriter(output_path)
+        handler = TransportDownloader(writer, self.matcher, areas=self.track_poi_areas(input_path))
+        handler.apply_file(input_path)
+        writer.close()
+        self.matcher.mark_filtered(output_path)
+        print(f"Filtered: {os.path.basename(output_path)}")
 
-    def get_transport_data(self, assets_dir):
+    def get_transport_data(self, assets_dir, regions=None):
         os.makedirs(assets_dir, exist_ok=True)
 
-        regions = {
+        urls = {
             "canary-islands": "https://download.geofabrik.de/africa/canary-islands-latest.osm.pbf",
             "spain": "https://download.geofabrik.de/europe/spain-latest.osm.pbf"
         }
+        regions = {region: urls[region] for region in (regions or urls)}
 
         osm_dir = os.path.join(os.path.dirname(assets_dir), 'osm')
         os.makedirs(osm_dir, exist_ok=True)
@@ -53,9 +96,52 @@ class TransportDownloader(osm.SimpleHandler):
         for region, url in regions.items():
             raw = os.path.join(osm_dir, f"{region}-latest.osm.pbf")
             filtered = os.path.join(assets_dir, f"{region}-transporte-publico.osm.pbf")
+            if self.matcher.is_filtered_with(filtered):
+                continue
             self.download_file(url, raw)
             self.filter_transport(raw, filtered)
 
+    def apply_change_files(self, filtered_path, change_files):
+        """
+        Aplica ficheros de cambios OSM (.osc) sobre un PBF ya filtrado y lo vuelve a filtrar,
+        de forma que solo se procesa el extracto de transporte y no el PBF completo de la región.
+        """
+        base = filtered_path[:-len(".osm.pbf")]
+        merged_path = f"{base}.merged.osm.pbf"
+        updated_path = f"{base}.updated.osm.pbf"
+        for path in (merged_path, updated_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        reader = osm.MergeInputReader()
+        for change_file in change_files:
+            reader.add_file(change_file)
+        base_reader = osm.io.Reader(filtered_path)
+        writer = osm.io.Writer(merged_path)
+        try:
+            reader.apply_to_reader(base_reader, writer)
+        finally:
+            base_reader.close()
+            writer.close()
+
+        # Los objetos modificados llegan completos en el .osc, así que basta con volver a filtrar
+        self.filter_transport(merged_path, updated_path)
+        os.replace(updated_path, filtered_path)
+        os.replace(f"{updated_path}.layers.json", f"{filtered_path}.layers.json")
+        os.remove(merged_path)
+
+    def update_transport_data(self, assets_dir, change_files):
+        """
+        Actualiza los PBF filtrados con los ficheros de cambios de cada región ({región: [ficheros .osc]}).
+        """
+        for region, files in change_files.items():
+            filtered = os.path.join(assets_dir, f"{region}-transporte-publico.osm.pbf")
+            if not os.path.exists(filtered):
+                raise FileNotFoundError(f"Required PBF file not found: {filtered}")
+            if files:
+                self.apply_change_files(filtered, files)
+                print(f"Updated: {os.path.basename(filtered)} ({len(files)} change files)")
+
 
 # if __name__ == "__main__":
 #     assets_dir = os.path.join(os.getcwd(), "assets")
@@ -0,0 +1,126 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+from modules.liveness_channel import LivenessChannel
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(BaseException):
+    """
+    El watchdog ha cancelado el trabajo. Hereda de BaseException (como asyncio.CancelledError)
+    para que los `except Exception` de reintento del fetcher no la absorban.
+    """
+
+class WatchdogGiveUp(RuntimeError):
+    """El pool de workers ha quedado bloqueado y solo queda reiniciar el proceso."""
+
+class Job:
+    """
+    Trabajo de un worker (una provincia). El worker llama a beat() cada vez que avanza y a
+    check() en sus puntos de espera; el watchdog lo cancela si deja de avanzar.
+    """
+    def __init__(self, job_id: int, province_index: int, channel: Optional[LivenessChannel] = None):
+        self.job_id = job_id
+        self.province_index = province_index
+        self.started_at = time.monotonic()
+        self.last_progress = self.started_at
+        self.cancelled_at = None
+        self.pages = 0
+        self._cancel = threading.Event()
+        self._channel = channel
+        self.slot = channel.claim(province_index, job_id) if channel else None
+
+    def beat(self) -> None:
+        self.check()
+        self.last_progress = time.monotonic()
+        self.pages += 1
+        if self._channel:
+            self._channel.progress(self.slot, self.pages)
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise JobCancelled(f"Provincia {self.province_index} (job {self.job_id}) cancelada por el watchdog")
+
+    def cancel(self) -> None:
+        self.cancelled_at = time.monotonic()
+        self._cancel.set()
+        if self._channel:
+            self._channel.mark_cancelled(self.slot)
+
+    def release(self) -> None:
+        if self._channel and self.slot is not None:
+            self._channel.release(self.slot)
+            self.slot = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+class WorkerWatchdog:
+    """
+    Supervisión dentro del proceso del crawler: detecta los trabajos que llevan `stall_timeout`
+    segundos sin avanzar para cancelarlos y reprogramar solo esa provincia, manteniendo vivo
+    el estado compartido (índices, proxies, pool de conexiones).
+    Los hilos no se pueden matar: un trabajo cancelado termina en su siguiente check(). Si
+    `max_zombies` trabajos cancelados siguen vivos pasado `zombie_grace`, el pool está
+    bloqueado y se lanza WatchdogGiveUp para reiniciar el proceso como último recurso.
+    """
+    def __init__(self, stall_timeout: float = 180.0, check_interval: float = 5.0, max_reschedules: int = 3,
+                 zombie_grace: float = 120.0, max_zombies: int = 3, channel: Optional[LivenessChannel] = None):
+        self.stall_timeout = stall_timeout
+        self.check_interval = check_interval
+        self.max_reschedules = max_reschedules
+        self.zombie_grace = zombie_grace
+        self.max_zombies = max_zombies
+        self.channel = channel  # Si se da, el progreso de cada trabajo se publica para el supervisor
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._active: Dict[int, Job] = {}
+        self._cancelled: Dict[int, Job] = {}
+        self.reschedules: Dict[int, int] = {}
+
+    def start_job(self, province_index: int) -> Job:
+        job = Job(next(self._ids), province_index, self.channel)
+        with self._lock:
+            self._active[job.job_id] = job
+        return job
+
+    def finish_job(self, job: Job) -> None:
+        with self._lock:
+            self._active.pop(job.job_id, None)
+            self._cancelled.pop(job.job_id, None)
+        job.release()
+
+    def active_jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._active.values())
+
+    def cancel_stalled(self) -> List[Job]:
+        """Cancela y devuelve los trabajos sin progreso reciente; comprueba además si el pool está bloqueado."""
+        now = time.monotonic()
+        stalled = []
+        with self._lock:
+            for job in list(self._active.values()):
+                if now - job.last_progress >= self.stall_timeout:
+                    job.cancel()
+                    del self._active[job.job_id]
+                    self._cancelled[job.job_id] = job
+                    stalled.append(job)
+            zombies = [j for j in self._cancelled.values() if now - j.cancelled_at >= self.zombie_grace]
+
+        for job in stalled:
+            logger.warning(f"Provincia {job.province_index} (job {job.job_id}) sin progreso en {now - job.last_progress:.0f} s: cancelada")
+        if len(zombies) >= self.max_zombies:
+            raise WatchdogGiveUp(f"{len(zombies)} workers cancelados no terminan: {[j.province_index for j in zombies]}")
+        return stalled
+
+    def should_reschedule(self, province_index: int) -> bool:
+        """Cuenta una reprogramación de la provincia; False si ya agotó las de esta ronda."""
+        count = self.reschedules.get(province_index, 0) + 1
+        self.reschedules[province_index] = count
+        return count <= self.max_reschedules
+
+    def reset_round(self) -> None:
+        self.reschedules.clear()
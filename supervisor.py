@@ -1,31 +1,93 @@
-import os
 import time
 import subprocess
+from datetime import datetime, timezone
+from config.env_config import get_environment_variables
+from modules.liveness_channel import LivenessChannel
+from modules.refresh_scheduler import RefreshScheduler
 from utils.check_global_status import check_global_status
 from utils.ensure_base_db_structure import ensure_base_db_structure
 
+CHECK_INTERVAL = 10     # segundos entre comprobaciones
+ALIVE_TIMEOUT = 30      # segundos sin latido del bucle de supervisión de main.py
+STARTUP_GRACE = 300     # segundos para que main.py publique su canal (lo abre antes de cargar proxies e índices)
+STRAGGLER_IDLE = 120    # segundos sin página para señalar un worker como rezagado
+REFRESH_POLL = 900      # segundos máximos de espera entre comprobaciones de re-rastreos pendientes
+
+def read_liveness(process):
+    """Estado publicado por el main.py en ejecución, o None si aún no ha abierto su canal."""
+    try:
+        channel = LivenessChannel.attach()
+    except FileNotFoundError:
+        return None
+    try:
+        snapshot = channel.snapshot()
+    finally:
+        channel.close()
+    # Un canal con otro pid es de un main.py anterior que no llegó a cerrarlo
+    return snapshot if snapshot['pid'] == process.pid else None
+
+def report_stragglers(snapshot):
+    if snapshot['stale_slots']:
+        print(f"⚠️ Huecos del canal de vida escritos a medias (obsoletos): {snapshot['stale_slots']}")
+    for w in snapshot['workers']:
+        if w['state'] == 'running' and w['idle_s'] > STRAGGLER_IDLE:
+            print(f"🐢 Provincia {w['province_index']} (job {w['job_id']}): {w['idle_s']:.0f} s sin página, "
+                  f"{w['pages']} páginas a {w['pages_per_min']:.1f} páginas/min")
+
+def wait_for_due_refresh(scheduler):
+    """Duerme hasta que venza el siguiente re-rastreo (como mucho REFRESH_POLL) y reabre las provincias que toquen."""
+    while True:
+        due = scheduler.start_due()
+        if due:
+            print(f"🔁 Re-rastreo de las provincias {due}")
+            return
+        next_due = scheduler.next_due_at()
+        wait = (next_due - datetime.now(timezone.utc)).total_seconds() if next_due else REFRESH_POLL
+        time.sleep(min(max(wait, 1), REFRESH_POLL))
+
 ensure_base_db_structure()
+recurring = get_environment_variables().RECURRING_CRAWL
+scheduler = RefreshScheduler() if recurring else None
+if scheduler:
+    scheduler.start_due()
 
 start_time = time.time() 
 
 while True:
 
+    if scheduler and check_global_status():
+        wait_for_due_refresh(scheduler)
+        start_time = time.time()
+
     process = subprocess.Popen(["python", "main.py"])
-    
+    launched_at = time.time()
+    ready = False
+
     while True:
-        time.sleep(60)
+        time.sleep(CHECK_INTERVAL)
         try:
             if process.poll() is not None:
-                print("✅ main.py terminó por sí solo.")
+                print(f"✅ main.py terminó (código {process.returncode}).")
                 break
-            last_heartbeat = os.path.getmtime(os.path.join(os.getcwd(), 'status', "heartbeat.txt"))
-            if time.time() - last_heartbeat > 30:  # 30 segundos sin señal
-                print("⚠️ No hay heartbeat. Matando proceso.")
+            snapshot = read_liveness(process)
+            if snapshot is None:
+                if time.time() - launched_at > STARTUP_GRACE:
+                    print("⚠️ main.py no ha publicado su estado. Matando proceso.")
+                    process.kill()
+                    process.wait()
+                    break
+                continue
+            if not ready:
+                ready = True
+                print(f"🚀 main.py operativo {time.time() - launched_at:.1f} s después de lanzarlo.")
+            if snapshot['alive_age_s'] > ALIVE_TIMEOUT:
+                print("⚠️ El bucle de supervisión de main.py no responde. Matando proceso.")
                 process.kill()
                 process.wait()
                 break
+            report_stragglers(snapshot)
         except Exception as e:
-            print(f"⚠️ Error leyendo heartbeat: {e}")
+            print(f"⚠️ Error leyendo el estado de main.py: {e}")
             process.kill()
             process.wait()
             break
@@ -35,4 +97,5 @@ while True:
         elapsed_time = end_time - start_time
         minutes, seconds = divmod(int(elapsed_time), 60)
         print(f"✅ Proceso global completo. Duración total: {minutes} minutos y {seconds} segundos.")
-        break
\ No newline at end of file
+        if not scheduler:
+            break
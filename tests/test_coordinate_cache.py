@@ -0,0 +1,54 @@
+import os
+import numpy as np
+from modules.coordinate_cache import CoordinateCache
+
+LAT, LON = 36.7213, -4.4214
+
+class FakeLocator:
+    layers = ['bus']
+
+    def signature(self):
+        return 'points'
+
+    def nearest_distances(self, lats, lons):
+        return {'bus': np.full(len(lats), 100.0)}
+
+def _sources(tmp_path):
+    sources = {'cities': str(tmp_path / "municipalities.parquet"), 'distances': str(tmp_path / "stops_index.json")}
+    for source_path in sources.values():
+        with open(source_path, "w") as f:
+            f.write("v1")
+    return sources
+
+def _saved_cache(tmp_path, sources):
+    cache = CoordinateCache(path=str(tmp_path / "coordinates.pkl"), sources=sources)
+    cache.nearest_distances(FakeLocator(), [LAT], [LON])
+    cache.cities([LAT], [LON], lambda lats, lons: ["Málaga"] * len(lats))
+    cache.save()
+    return cache.path
+
+def test_reload_keeps_entries_while_sources_are_unchanged(tmp_path):
+    sources = _sources(tmp_path)
+    cache = CoordinateCache(path=_saved_cache(tmp_path, sources), sources=sources)
+    assert len(cache._distances) == 1 and len(cache._cities) == 1
+
+def test_changed_sources_discard_their_entries(tmp_path):
+    sources = _sources(tmp_path)
+    path = _saved_cache(tmp_path, sources)
+    with open(sources['cities'], "w") as f:
+        f.write("boundaries v2")
+    cache = CoordinateCache(path=path, sources=sources)
+    assert len(cache._distances) == 1 and len(cache._cities) == 0
+
+    os.remove(sources['distances'])
+    cache = CoordinateCache(path=path, sources=sources)
+    assert len(cache._distances) == 0
+
+def test_corrupt_cache_starts_empty(tmp_path):
+    sources = _sources(tmp_path)
+    path = _saved_cache(tmp_path, sources)
+    for content in (b"", b"\x80\x05garbage", b"\x80\x04\x95\x05\x00\x00\x00\x00\x00\x00\x00]\x94."):
+        with open(path, "wb") as f:
+            f.write(content)
+        cache = CoordinateCache(path=path, sources=sources)
+        assert len(cache._distances) == 0 and len(cache._cities) == 0
@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+import utils.insert_ads_from_df as insert_ads
+
+@pytest.fixture
+def city_ids(monkeypatch):
+    """Municipio resuelto sin base de datos: el id es el número de letras del municipio ('Nowhere' no resuelve)."""
+    def resolve(df):
+        return pd.Series([pd.NA if m == 'Nowhere' else len(m) for m in df['municipality']], index=df.index, dtype='Int64')
+    monkeypatch.setattr(insert_ads, 'resolve_city_ids', resolve)
+
+def _ads(**columns):
+    base = {
+        'price': [1000, 2000, 3000, 4000, None, 6000],
+        'ccaa': ['Andalucía'] * 6,
+        'province': ['Málaga'] * 6,
+        'municipality': ['Marbella', 'Málaga', 'Nowhere', 'Ronda', 'Ronda', 'Mijas'],
+        'latitude': [36.51, 36.72, 36.0, 36.74, 36.74, 36.6],
+        'longitude': [-4.88, -4.42, -4.0, -5.16, -5.16, -4.64],
+    }
+    base.update(columns)
+    return pd.DataFrame(base, index=[101, 102, 103, 104, 105, 106])
+
+def test_drops_rows_that_cannot_be_stored(city_ids):
+    df = _ads(propertySubtype=[1, np.nan, 1, 9, 1, '9'])
+    ads = insert_ads.build_ads_frame(df)
+    # 103 sin municipio resuelto, 104 y 106 parcelas (propertySubtype 9), 105 sin precio
+    assert ads['ad_id'].tolist() == [101, 102]
+    assert ads['city_id'].tolist() == [8, 6]
+    assert ads['location'].tolist() == ["SRID=4326;POINT(-4.88 36.51)", "SRID=4326;POINT(-4.42 36.72)"]
+
+def test_coerces_invalid_numbers_to_null(city_ids):
+    df = _ads(surface=['85', 'n/a', None, 1, 1, 1], rooms=[2.7, 'x', 1, 1, 1, 1], bathrooms=[1, 2, 3, 4, 5, 6],
+              elevator=[1, 'x', 0, 0, 0, 0], floorType=['TOP_FLOOR', 'BASEMENT', None, None, None, None],
+              **{'bus_distance': [123.6, 'lejos', 1, 1, 1, 1]})
+    ads = insert_ads.build_ads_frame(df).set_index('ad_id')
+    assert ads.loc[101, 'surface'] == 85 and pd.isna(ads.loc[102, 'surface'])
+    assert ads.loc[101, 'rooms'] == 2 and pd.isna(ads.loc[102, 'rooms'])  # Se trunca, como int()
+    assert ads.loc[101, 'bus_distance'] == 124 and pd.isna(ads.loc[102, 'bus_distance'])  # Las distancias se redondean
+    assert ads.loc[[101, 102], 'elevator'].tolist() == [True, False]
+    assert ads.loc[101, 'floor_type'] == 3 and pd.isna(ads.loc[102, 'floor_type'])
+    # Columnas que la página no trae quedan a nulo en lugar de fallar
+    assert ads['antiquity'].isna().all() and not ads['garden'].any()
+
+def test_repeated_ad_keeps_last_occurrence(city_ids):
+    df = pd.concat([_ads().iloc[:1], _ads(price=[1500] * 6).iloc[:1]])
+    ads = insert_ads.build_ads_frame(df)
+    assert ads['ad_id'].tolist() == [101] and ads['price'].tolist() == [1500]
@@ -0,0 +1,39 @@
+import os
+import pytest
+import modules.liveness_channel as liveness
+from modules.liveness_channel import LivenessChannel, _HEADER_SIZE, _SEQ, _SLOT_SIZE
+
+@pytest.fixture
+def channel():
+    channel = LivenessChannel.create(name=f"test_liveness_{os.getpid()}", slots=4)
+    yield channel
+    channel.close()
+
+def _tear(channel, slot):
+    """Deja el hueco como un escritor que murió a mitad de actualizarlo: secuencia impar."""
+    offset = _HEADER_SIZE + slot * _SLOT_SIZE
+    _SEQ.pack_into(channel._buf, offset, _SEQ.unpack_from(channel._buf, offset)[0] + 1)
+
+def test_snapshot_reports_workers(channel):
+    slot = channel.claim(province_index=29, job_id=1)
+    channel.progress(slot, pages=3)
+    snapshot = channel.snapshot()
+    assert snapshot['pid'] == os.getpid() and snapshot['stale_slots'] == []
+    [worker] = snapshot['workers']
+    assert (worker['slot'], worker['state'], worker['province_index'], worker['pages']) == (slot, 'running', 29, 3)
+
+def test_torn_write_is_reported_stale_and_recovers(channel, monkeypatch):
+    monkeypatch.setattr(liveness, 'READ_DEADLINE', 0.01)
+    slot = channel.claim(province_index=29, job_id=1)
+    other = channel.claim(province_index=8, job_id=2)
+    _tear(channel, slot)
+
+    snapshot = channel.snapshot()  # No se queda esperando a que la secuencia vuelva a ser par
+    assert snapshot['stale_slots'] == [slot]
+    assert [w['slot'] for w in snapshot['workers']] == [other]
+
+    # La siguiente escritura del hueco lo deja de nuevo legible
+    channel.progress(slot, pages=1)
+    snapshot = channel.snapshot()
+    assert snapshot['stale_slots'] == []
+    assert sorted(w['slot'] for w in snapshot['workers']) == sorted([slot, other])
@@ -0,0 +1,32 @@
+import pytest
+from modules.location_matcher import LocationMatcher, NO_MATCH
+
+TRIPLES = [
+    ('Andalucía', 'Málaga', 'Marbella'),                # exacto
+    ('andalucia', 'malaga', 'Marbela'),                 # con errores: puntuación fuzzy
+    ('Andalucía', 'Málaga', 'Marbella'),                # repetido en la página
+    ('Andalucía', 'Almería', None),                     # sin municipio: se queda en la provincia
+    ('Comunidad inventada', 'Málaga', 'Marbella'),      # CCAA sin candidato por encima del umbral
+    (None, None, None),
+]
+
+@pytest.fixture(scope="module")
+def matcher():
+    return LocationMatcher()
+
+def test_batch_matches_single_lookups(matcher):
+    expected = [LocationMatcher().match_location(*triple) for triple in TRIPLES]
+    assert matcher.match_locations(TRIPLES) == expected
+
+def test_batch_results(matcher):
+    exact, fuzzy, repeated, province, unknown, empty = matcher.match_locations(TRIPLES)
+    assert exact == {'guess': 'Marbella', 'guess_id': exact['guess_id'], 'score': 100}
+    assert fuzzy['guess'] == 'Marbella' and fuzzy['guess_id'] == exact['guess_id'] and fuzzy['score'] < 100
+    assert repeated == exact
+    assert province['guess'] == 'Almería'
+    assert unknown == NO_MATCH and empty == NO_MATCH
+
+def test_batch_results_are_independent_copies(matcher):
+    first = matcher.match_locations(TRIPLES[:1])[0]
+    first['guess'] = 'otro'
+    assert matcher.match_locations(TRIPLES[:1])[0]['guess'] == 'Marbella'
@@ -0,0 +1,48 @@
+from modules.municipality_aliases import MunicipalityAliases
+
+KEY = ('Andalucía', 'Málaga', 'Nueva Andalucía')
+MARBELLA = {'guess': 'Marbella', 'guess_id': 1, 'score': 100}
+BENAHAVIS = {'guess': 'Benahavís', 'guess_id': 2, 'score': 100}
+
+class FakeDB:
+    def __init__(self):
+        self.inserts = []
+        self.updates = []
+
+    def select_iter(self, params):
+        return iter([])
+
+    def insert(self, params):
+        self.inserts.append(params['values'])
+
+    def update(self, params):
+        self.updates.append(params['values'])
+
+def test_spatial_alias_needs_agreeing_observations():
+    aliases = MunicipalityAliases(db=FakeDB())
+    for _ in range(MunicipalityAliases.MIN_OBSERVATIONS - 1):
+        aliases.learn(*KEY, MARBELLA, source='spatial')
+        assert aliases.lookup(*KEY) is None
+    aliases.learn(*KEY, MARBELLA, source='spatial')
+    assert aliases.lookup(*KEY) == MARBELLA
+    assert len(aliases.db.inserts) == 1
+    assert aliases.db.updates[-1] == {'observations': MunicipalityAliases.MIN_OBSERVATIONS}
+
+def test_conflicting_spatial_observation_disables_alias():
+    aliases = MunicipalityAliases(db=FakeDB())
+    for _ in range(MunicipalityAliases.MIN_OBSERVATIONS):
+        aliases.learn(*KEY, MARBELLA, source='spatial')
+    aliases.learn(*KEY, BENAHAVIS, source='spatial')
+    assert aliases.lookup(*KEY) is None
+    assert aliases.db.updates[-1] == {'conflicting': True}
+
+    aliases.learn(*KEY, MARBELLA, source='spatial')
+    assert aliases.lookup(*KEY) is None
+
+def test_low_confidence_fuzzy_match_is_not_learned():
+    aliases = MunicipalityAliases(db=FakeDB())
+    aliases.learn(*KEY, dict(MARBELLA, score=MunicipalityAliases.MIN_CONFIDENCE - 1), source='fuzzy')
+    assert aliases.lookup(*KEY) is None and not aliases.db.inserts
+
+    aliases.learn(*KEY, dict(MARBELLA, score=95), source='fuzzy')
+    assert aliases.lookup(*KEY) == dict(MARBELLA, score=95)
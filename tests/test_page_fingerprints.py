@@ -0,0 +1,28 @@
+from modules.page_fingerprints import PageFingerprints
+
+def test_exact_repeat_is_recycled():
+    fingerprints = PageFingerprints()
+    fingerprints.record([1, 2, 3, 4, 5])
+    page = fingerprints.check([1, 2, 3, 4, 5])
+    assert page == {'recycled': True, 'repeated': True, 'overlap': 1.0}
+
+def test_mostly_seen_page_is_recycled():
+    fingerprints = PageFingerprints(overlap_threshold=0.8)
+    fingerprints.record([1, 2, 3, 4, 5])
+    fingerprints.record([6, 7, 8, 9, 10])
+    # Mismos anuncios en otro orden y mezclados: no es copia exacta pero casi todo ya se ha visto
+    page = fingerprints.check([10, 2, 7, 4, 11])
+    assert page == {'recycled': True, 'repeated': False, 'overlap': 0.8}
+    assert not fingerprints.check([10, 2, 7, 11, 12])['recycled']
+
+def test_check_does_not_record():
+    fingerprints = PageFingerprints()
+    assert not fingerprints.check([1, 2, 3])['recycled']
+    # Una petición reintentada no cuenta como página ya vista
+    assert not fingerprints.check([1, 2, 3])['recycled']
+
+def test_missing_ids_are_ignored():
+    fingerprints = PageFingerprints()
+    assert fingerprints.check([None, None]) == {'recycled': False, 'repeated': False, 'overlap': 0.0}
+    fingerprints.record([1, None, 2])
+    assert fingerprints.check([1, 2])['repeated']
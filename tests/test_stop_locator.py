@@ -0,0 +1,167 @@
+import os
+import shutil
+import pytest
+from modules.poi_layers import LayerMatcher
+from modules.stop_locator import StopLocator
+from modules.transport_downloader import TransportDownloader
+
+osm = pytest.importorskip("osmium")
+
+CANARY_PBF = os.path.join("assets", "public_transport", "canary-islands-transporte-publico.osm.pbf")
+REGION = "canary-islands"
+NEW_NODE_ID = 999_999_999_001
+BUS_LAYERS = {'bus': [{'highway': 'bus_stop'}]}
+
+def _bus_stops(pbf_file, count):
+    stops = []
+
+    class Handler(osm.SimpleHandler):
+        def node(self, n):
+            if len(stops) < count and n.tags.get('highway') == 'bus_stop':
+                stops.append((n.id, n.location.lat, n.location.lon))
+
+    Handler().apply_file(pbf_file)
+    return stops
+
+def _write_change_file(path, moved, deleted):
+    node_id, lat, lon = moved
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"""<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6" generator="test">
+  <modify>
+    <node id="{node_id}" version="999" timestamp="2030-01-01T00:00:00Z" lat="{lat + 0.01:.7f}" lon="{lon:.7f}">
+      <tag k="highway" v="bus_stop"/>
+    </node>
+  </modify>
+  <create>
+    <node id="{NEW_NODE_ID}" version="1" timestamp="2030-01-01T00:00:00Z" lat="28.1000000" lon="-15.4000000">
+      <tag k="highway" v="bus_stop"/>
+    </node>
+  </create>
+  <delete>
+    <node id="{deleted[0]}" version="999" timestamp="2030-01-01T00:00:00Z" lat="{deleted[1]:.7f}" lon="{deleted[2]:.7f}"/>
+  </delete>
+</osmChange>
+""")
+
+@pytest.fixture
+def based_dir(tmp_path):
+    if not os.path.exists(CANARY_PBF):
+        pytest.skip("canary PBF not available")
+    raw = tmp_path / "canary-raw.osm.pbf"
+    shutil.copy(CANARY_PBF, raw)
+    TransportDownloader(matcher=LayerMatcher(BUS_LAYERS)).filter_transport(str(raw), str(tmp_path / f"{REGION}-transporte-publico.osm.pbf"))
+    return tmp_path
+
+def test_change_file_moves_adds_and_deletes_nodes(based_dir):
+    locator = StopLocator(based_dir=str(based_dir), regions=(REGION,), layers=BUS_LAYERS)
+    (moved_id, lat, lon), deleted = _bus_stops(locator.pbf_files[REGION], 2)
+    assert moved_id in locator.stops['bus']['coords'] and deleted[0] in locator.stops['bus']['coords']
+
+    change_file = based_dir / "change.osc"
+    _write_change_file(change_file, (moved_id, lat, lon), deleted)
+    summary = locator.update({REGION: [str(change_file)]})
+
+    assert summary == {'added': 1, 'moved': 1, 'removed': 1}
+    coords = locator.stops['bus']['coords']
+    assert coords[moved_id] == pytest.approx((lat + 0.01, lon), abs=1e-6)
+    assert coords[NEW_NODE_ID] == pytest.approx((28.1, -15.4))
+    assert deleted[0] not in coords
+
+    # El índice persistido coincide con el PBF actualizado y se reutiliza tal cual
+    reloaded = StopLocator(based_dir=str(based_dir), regions=(REGION,), layers=BUS_LAYERS)
+    assert reloaded.stops['bus']['coords'] == coords
+    assert {n for n, _, _ in _bus_stops(locator.pbf_files[REGION], 10**9)} == set(coords)
+
+def test_replaced_pbf_rebuilds_index(based_dir):
+    layers = BUS_LAYERS
+    locator = StopLocator(based_dir=str(based_dir), regions=(REGION,), layers=layers)
+    (moved_id, lat, lon), deleted = _bus_stops(locator.pbf_files[REGION], 2)
+    change_file = based_dir / "change.osc"
+    _write_change_file(change_file, (moved_id, lat, lon), deleted)
+    locator.update({REGION: [str(change_file)]})
+
+    # Refresco completo: se vuelve a filtrar el PBF original y el índice no debe seguir sirviendo los cambios
+    os.remove(locator.pbf_files[REGION])
+    TransportDownloader(matcher=LayerMatcher(BUS_LAYERS)).filter_transport(str(based_dir / "canary-raw.osm.pbf"), locator.pbf_files[REGION])
+    refreshed = StopLocator(based_dir=str(based_dir), regions=(REGION,), layers=layers)
+    coords = refreshed.stops['bus']['coords']
+    assert coords[moved_id] == pytest.approx((lat, lon))
+    assert NEW_NODE_ID not in coords
+    assert deleted[0] in coords
+
+POI_AREAS_OSM = """<?xml version="1.0" encoding="UTF-8"?>
+<osm version="0.6" generator="test">
+  <node id="1" version="1" lat="28.00" lon="-15.00"/>
+  <node id="2" version="1" lat="28.00" lon="-15.02"/>
+  <node id="3" version="1" lat="28.02" lon="-15.02"/>
+  <node id="4" version="1" lat="28.02" lon="-15.00"/>
+  <node id="5" version="1" lat="28.10" lon="-15.40"/>
+  <node id="6" version="1" lat="28.10" lon="-15.44"/>
+  <node id="7" version="1" lat="28.14" lon="-15.44"/>
+  <node id="8" version="1" lat="28.14" lon="-15.40"/>
+  <node id="9" version="1" lat="28.20" lon="-15.50"><tag k="shop" v="supermarket"/></node>
+  <node id="50" version="1" lat="28.30" lon="-15.60"/>
+  <way id="10" version="1">
+    <nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="1"/>
+    <tag k="amenity" v="school"/>
+  </way>
+  <way id="11" version="1">
+    <nd ref="5"/><nd ref="6"/><nd ref="7"/><nd ref="8"/><nd ref="5"/>
+  </way>
+  <relation id="20" version="1">
+    <member type="way" ref="11" role="outer"/>
+    <tag k="type" v="multipolygon"/>
+    <tag k="natural" v="beach"/>
+  </relation>
+</osm>
+"""
+
+def _write_raw_pbf(tmp_path, path):
+    xml = tmp_path / "areas.osm"
+    xml.write_text(POI_AREAS_OSM, encoding="utf-8")
+    writer = osm.SimpleWriter(str(path))
+
+    class Copy(osm.SimpleHandler):
+        def node(self, n):
+            writer.add_node(n)
+
+        def way(self, w):
+            writer.add_way(w)
+
+        def relation(self, r):
+            writer.add_relation(r)
+
+    Copy().apply_file(str(xml))
+    writer.close()
+
+def test_poi_areas_are_indexed_by_centroid(tmp_path):
+    based_dir = tmp_path / "public_transport"
+    based_dir.mkdir()
+    (tmp_path / "osm").mkdir()
+    raw = tmp_path / "osm" / f"{REGION}-latest.osm.pbf"
+    _write_raw_pbf(tmp_path, raw)
+
+    # PBF filtrado con una configuración de capas anterior: se vuelve a filtrar desde el PBF de la región
+    filtered = based_dir / f"{REGION}-transporte-publico.osm.pbf"
+    TransportDownloader(matcher=LayerMatcher(BUS_LAYERS)).filter_transport(str(raw), str(filtered))
+    locator = StopLocator(based_dir=str(based_dir), regions=(REGION,))
+    assert locator.matcher.is_filtered_with(str(filtered))
+
+    school = locator.stops['school']['coords']
+    beach = locator.stops['beach']['coords']
+    assert list(school.values()) == [pytest.approx((28.01, -15.01))] and all(k < 0 for k in school)
+    assert list(beach.values()) == [pytest.approx((28.12, -15.42))] and all(k < 0 for k in beach)
+    assert locator.stops['supermarket']['coords'] == {9: pytest.approx((28.20, -15.50))}
+    assert locator.find_nearest(28.01, -15.01)['school']['distance_m'] == 0
+
+    # Un vértice movido en un .osc (sin etiquetas) desplaza el centroide del área al actualizar
+    change_file = tmp_path / "area-change.osc"
+    change_file.write_text("""<?xml version="1.0" encoding="UTF-8"?>
+<osmChange version="0.6" generator="test">
+  <modify><node id="3" version="2" timestamp="2030-01-01T00:00:00Z" lat="28.06" lon="-15.02"/></modify>
+</osmChange>
+""", encoding="utf-8")
+    summary = locator.update({REGION: [str(change_file)]})
+    assert summary == {'added': 0, 'moved': 1, 'removed': 0}
+    assert list(locator.stops['school']['coords'].values()) == [pytest.approx((28.02, -15.01))]
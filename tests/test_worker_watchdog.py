@@ -0,0 +1,33 @@
+import time
+import pytest
+from modules.worker_watchdog import JobCancelled, WatchdogGiveUp, WorkerWatchdog
+
+ZOMBIE_GRACE = 0.05
+
+def _watchdog(**kwargs):
+    return WorkerWatchdog(stall_timeout=0.0, zombie_grace=ZOMBIE_GRACE, **kwargs)
+
+def test_stalled_jobs_are_cancelled_and_rescheduled():
+    watchdog = _watchdog(max_zombies=3, max_reschedules=1)
+    job = watchdog.start_job(7)
+    assert watchdog.cancel_stalled() == [job]
+    assert job.cancelled and watchdog.active_jobs() == []
+    with pytest.raises(JobCancelled):
+        job.check()
+    assert watchdog.should_reschedule(7) and not watchdog.should_reschedule(7)
+
+def test_gives_up_once_max_zombies_cancelled_jobs_are_still_running():
+    watchdog = _watchdog(max_zombies=2)
+    first, second = watchdog.start_job(1), watchdog.start_job(2)
+    assert watchdog.cancel_stalled() == [first, second]  # Recién cancelados: aún dentro de zombie_grace
+    time.sleep(ZOMBIE_GRACE)
+    with pytest.raises(WatchdogGiveUp):
+        watchdog.cancel_stalled()
+
+def test_finished_cancelled_jobs_are_not_zombies():
+    watchdog = _watchdog(max_zombies=2)
+    first, second = watchdog.start_job(1), watchdog.start_job(2)
+    watchdog.cancel_stalled()
+    watchdog.finish_job(first)  # El worker llegó a su check() y terminó
+    time.sleep(ZOMBIE_GRACE)
+    assert watchdog.cancel_stalled() == []
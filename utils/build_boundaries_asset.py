@@ -0,0 +1,43 @@
+import os
+import pandas as pd
+import geopandas as gpd
+
+# Archivos sacados de https://centrodedescargas.cnig.es/CentroDescargas/resultados-busqueda
+SHP_DIR = os.path.join(os.getcwd(), 'assets', 'shp')
+BOUNDARY_FILES = [
+    "recintos_municipales_inspire_peninbal_etrs89.shp",
+    "recintos_municipales_inspire_canarias_regcan95.shp",
+    "zonaneutral Marruecos-Ceuta.shp",
+    "Zona Neutral Marruecos-Melilla.shp",
+]
+BOUNDARIES_ASSET_PATH = os.path.join(os.getcwd(), 'assets', 'municipalities.parquet')
+BOUNDARY_COLUMNS = ['NAMEUNIT', 'ine_code', 'geometry']
+TARGET_CRS = "EPSG:4258"
+
+def read_boundary_shapefiles(shp_dir: str = SHP_DIR) -> gpd.GeoDataFrame:
+    layers = []
+    for filename in BOUNDARY_FILES:
+        gdf = gpd.read_file(os.path.join(shp_dir, filename))
+        if gdf.crs is not None and gdf.crs != TARGET_CRS:
+            gdf = gdf.to_crs(TARGET_CRS)  # Canarias viene en REGCAN95
+        # NATCODE = país (2) + CCAA (2) + provincia (2) + código INE del municipio (5)
+        gdf['ine_code'] = gdf['NATCODE'].astype(str).str[-5:] if 'NATCODE' in gdf else None
+        layers.append(gdf.reindex(columns=BOUNDARY_COLUMNS))  # Ceuta/Melilla no traen NAMEUNIT
+    return gpd.GeoDataFrame(pd.concat(layers, ignore_index=True), crs=TARGET_CRS)
+
+def build_boundaries_asset(shp_dir: str = SHP_DIR, output_path: str = BOUNDARIES_ASSET_PATH) -> str:
+    """
+    Convierte los recintos municipales del CNIG en un único GeoParquet ya proyectado a ETRS89,
+    ordenado por curva de Hilbert y con columna bbox para poder filtrar espacialmente al leerlo.
+    """
+    gdf = read_boundary_shapefiles(shp_dir)
+    gdf = gdf.iloc[gdf.geometry.hilbert_distance().argsort()].reset_index(drop=True)
+    tmp_path = f"{output_path}.tmp"
+    gdf.to_parquet(tmp_path, index=False, write_covering_bbox=True)
+    os.replace(tmp_path, output_path)
+    print(f"Boundaries asset built: {os.path.basename(output_path)} ({len(gdf)} recintos)")
+    return output_path
+
+# # Example usage
+# if __name__ == "__main__":
+#     build_boundaries_asset()
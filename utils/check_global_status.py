@@ -3,24 +3,15 @@ from database.postgresqldb import PostgreSQLDB, RawSQL
 db = PostgreSQLDB()
 
 def check_global_status() -> bool:
-    fetched_count = db.select(params={
+    counts = db.select(params={
         'table': 'provinces',
-        'fields': [RawSQL("COUNT(is_fetched) AS count")],
-        'filters': {
-            'where': {
-                'field': 'is_fetched',
-                'operator': '=',
-                'value': True
-            }
-        }
-    })[0]['count']
+        'fields': [
+            RawSQL("COUNT(*) FILTER (WHERE is_fetched) AS fetched_count"),
+            RawSQL("COUNT(*) AS total_count")
+        ]
+    })[0]
 
-    total_count = db.select(params={
-        'table': 'provinces',
-        'fields': [RawSQL("COUNT(province_id) AS count")]
-    })[0]['count']
-
-    return fetched_count == total_count
+    return counts['fetched_count'] == counts['total_count']
 
 # # Example usage
-# print(check_global_status())
\ No newline at end of file
+# print(check_global_status())
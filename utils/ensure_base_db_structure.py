@@ -1,38 +1,61 @@
+import csv
 from pathlib import Path
-import pandas as pd
-from tqdm import tqdm
-from database.postgresqldb import PostgreSQLDB, RawSQL
+from database.postgresqldb import PostgreSQLDB
+
+BASE_CSV_PATH = Path('assets/ccaa_province_city.csv')
+ID_COLUMNS = ('ccaa_id', 'province_id', 'city_id')
+
+# Tablas en orden de dependencia (claves foráneas) con su clave primaria y columnas de referencia
+BASE_TABLES = {
+    'ccaas': {'key': 'ccaa_id', 'columns': ['ccaa_id', 'ccaa_name']},
+    'provinces': {'key': 'province_id', 'columns': ['province_id', 'province_name', 'ccaa_id']},
+    'cities': {'key': 'city_id', 'columns': ['city_id', 'city_name', 'province_id']},
+}
 
-base_df = pd.read_csv(Path('assets/ccaa_province_city.csv'))
 db = PostgreSQLDB()
 
-def insert_rows(df, table_name):
-    """Insert rows into the given table displaying a progress bar."""
-    for row in tqdm(df.itertuples(index=False), total=len(df), desc=f"Inserting {table_name}"):
-        db.insert({'table': table_name, 'values': row._asdict()})
+def read_base_rows():
+    """Rows of the CSV with the ids cast to int (csv module: the supervisor does not need to import pandas)."""
+    with open(BASE_CSV_PATH, newline='', encoding='utf-8') as f:
+        return [{k: int(v) if k in ID_COLUMNS else v for k, v in row.items()} for row in csv.DictReader(f)]
+
+def missing_rows(base_rows, table_name):
+    """Rows of the CSV that are missing from the table or differ from what is stored."""
+    spec = BASE_TABLES[table_name]
+    expected = {}  # One row per key, the last one in the CSV wins
+    for row in base_rows:
+        expected[row[spec['key']]] = tuple(row[c] for c in spec['columns'])
+    stored = {
+        tuple(row[c] for c in spec['columns'])
+        for row in db.select_iter({'table': table_name, 'fields': spec['columns']}, itersize=10_000)
+    }
+    return [row for row in expected.values() if row not in stored]
 
 def ensure_base_db_structure():
     """
-    Checks that the CCAA, provinces, and cities tables are complete
-    according to the CSV. Inserts missing data if necessary.
+    Syncs the CCAA, provinces, and cities tables with the CSV. Only the missing or
+    changed rows are written, with one bulk upsert per table in a single transaction,
+    so running it on an already seeded database is a no-op.
     """
-    tables = ['ccaas', 'provinces', 'cities']
-    db_counts = {
-        table: db.select({"table": table, "fields": [RawSQL("COUNT(*) AS total")]} )[0]['total']
-        for table in tables
-    }
-    csv_counts = {
-        'ccaas': base_df['ccaa_id'].nunique(),
-        'provinces': base_df['province_id'].nunique(),
-        'cities': base_df['city_id'].nunique()
-    }
-    if any(csv_counts[t] != db_counts[t] for t in tables):
-        print("Ingesting autonomous communities, provinces, and cities into the database...")
-        insert_rows(base_df[['ccaa_id', 'ccaa_name']].drop_duplicates(), 'ccaas')
-        insert_rows(base_df[['province_id', 'province_name', 'ccaa_id']].drop_duplicates(), 'provinces')
-        insert_rows(base_df[['city_id', 'city_name', 'province_id']], 'cities')
-        print("Base structure ingested!")
+    base_rows = read_base_rows()
+    pending = {table: missing_rows(base_rows, table) for table in BASE_TABLES}
+    if not any(pending.values()):
+        return
+
+    print("Syncing autonomous communities, provinces, and cities into the database...")
+    counts = db.bulk_upsert_many([
+        {
+            'table': table,
+            'columns': BASE_TABLES[table]['columns'],
+            'rows': rows,
+            'conflict': [BASE_TABLES[table]['key']]
+        }
+        for table, rows in pending.items() if rows
+    ])
+    if any(c['failed'] for c in counts.values()):
+        raise RuntimeError(f"Base structure sync failed: {counts}")
+    print(f"Base structure synced! {counts}")
 
 # # Example usage
 # if __name__ == "__main__":
-#     ensure_base_db_structure()
\ No newline at end of file
+#     ensure_base_db_structure()
@@ -0,0 +1,141 @@
+import argparse
+import glob
+import json
+import os
+from datetime import datetime, timedelta, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+from database.postgresqldb import PostgreSQLDB
+
+EXPORT_DIR = os.path.join(os.getcwd(), 'exports', 'ads_data')
+EXPORT_STATE_FILE = '_export_state.json'
+EXPORT_BATCH_SIZE = 50_000
+# Las transacciones que seguían abiertas al empezar la exportación anterior pueden confirmar
+# filas con un updated_at algo anterior a la marca guardada; se vuelve a cubrir ese margen.
+EXPORT_OVERLAP = timedelta(minutes=5)
+
+# Tipos de PostgreSQL (OID) -> tipos de Arrow, para que todos los lotes compartan esquema
+ARROW_TYPES = {
+    16: pa.bool_(),
+    20: pa.int64(),
+    21: pa.int16(),
+    23: pa.int32(),
+    25: pa.string(),
+    700: pa.float32(),
+    701: pa.float64(),
+    1043: pa.string(),
+    1082: pa.date32(),
+    1114: pa.timestamp('us'),
+    1184: pa.timestamp('us', tz='UTC'),
+}
+
+EXPORT_QUERY = """
+    SELECT c.province_id, a.*, ST_Y(a.location::geometry) AS latitude, ST_X(a.location::geometry) AS longitude
+    FROM ads_data AS a
+    JOIN cities AS c ON c.city_id = a.city_id
+    WHERE a.updated_at >= %(since)s
+    ORDER BY c.province_id, a.ad_id
+"""
+
+db = PostgreSQLDB()
+
+def _read_state(output_dir: str) -> dict:
+    try:
+        with open(os.path.join(output_dir, EXPORT_STATE_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_state(output_dir: str, state: dict) -> None:
+    path = os.path.join(output_dir, EXPORT_STATE_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(path + '.tmp', path)
+
+def _arrow_schema(description) -> pa.Schema:
+    # province_id va en la ruta de la partición (province_id=N/), no dentro del fichero
+    return pa.schema([
+        (col.name, ARROW_TYPES.get(col.type_code, pa.string()))
+        for col in description
+        if col.name not in ('province_id', 'location')
+    ])
+
+def export_ads_to_parquet(output_dir: str = EXPORT_DIR, full: bool = False, batch_size: int = EXPORT_BATCH_SIZE) -> dict:
+    """
+    Exporta ads_data a Parquet particionado por provincia (output_dir/province_id=N/*.parquet).
+    Las filas se leen con un cursor de servidor en lotes de batch_size, y cada lote se escribe
+    como un row group, así que la memoria no depende del tamaño de la tabla.
+    Sin full, solo se exportan las filas modificadas desde la exportación anterior, en ficheros
+    nuevos: un anuncio puede aparecer en varios, y su versión vigente es la de mayor updated_at.
+    Los ficheros se escriben con un nombre temporal oculto (los lectores de Parquet ignoran los que
+    empiezan por '.') y solo se publican, y con full se borran los anteriores, si la exportación termina bien.
+    Devuelve las filas exportadas por provincia.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = {} if full else _read_state(output_dir)
+    since = datetime.fromisoformat(state['exported_until']) - EXPORT_OVERLAP if 'exported_until' in state else datetime.min.replace(tzinfo=timezone.utc)
+    run_id = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+
+    counts = {}
+    written = []  # (ruta temporal, ruta definitiva)
+    writer, province_id = None, None
+    success = False
+    try:
+        with db.connection() as conn, conn.transaction():
+            # Marca de la siguiente exportación incremental, tomada antes de leer
+            started_at = conn.execute("SELECT NOW() AS now").fetchone()['now']
+            with conn.cursor(name=f'export_ads_{run_id}') as cur:
+                cur.itersize = batch_size
+                cur.execute(EXPORT_QUERY, {'since': since})
+                schema = None
+                while rows := cur.fetchmany(batch_size):
+                    schema = schema or _arrow_schema(cur.description)
+                    start = 0
+                    # El lote viene ordenado por provincia: se corta en cada cambio de provincia
+                    while start < len(rows):
+                        if rows[start]['province_id'] != province_id:
+                            if writer:
+                                writer.close()
+                            province_id = rows[start]['province_id']
+                            partition_dir = os.path.join(output_dir, f'province_id={province_id}')
+                            os.makedirs(partition_dir, exist_ok=True)
+                            path = os.path.join(partition_dir, f'ads-{run_id}.parquet')
+                            written.append((os.path.join(partition_dir, f'.ads-{run_id}.parquet.tmp'), path))
+                            writer = pq.ParquetWriter(written[-1][0], schema)
+                        end = start
+                        while end < len(rows) and rows[end]['province_id'] == province_id:
+                            end += 1
+                        writer.write_table(pa.Table.from_pylist(rows[start:end], schema=schema))
+                        counts[province_id] = counts.get(province_id, 0) + end - start
+                        start = end
+        if writer:
+            writer.close()
+            writer = None
+        success = True
+    finally:
+        if writer:
+            writer.close()
+        if not success:
+            for tmp_path, _ in written:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    if full:
+        new_paths = {path for _, path in written}
+        for path in glob.glob(os.path.join(output_dir, 'province_id=*', '*.parquet')):
+            if path not in new_paths:
+                os.remove(path)
+    for tmp_path, path in written:
+        os.replace(tmp_path, path)
+
+    _write_state(output_dir, {'exported_until': started_at.isoformat(), 'last_run': run_id, 'rows': sum(counts.values())})
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta ads_data a Parquet particionado por provincia.")
+    parser.add_argument('--output-dir', default=EXPORT_DIR)
+    parser.add_argument('--full', action='store_true', help="Reexporta toda la tabla en lugar de solo lo modificado")
+    parser.add_argument('--batch-size', type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    counts = export_ads_to_parquet(args.output_dir, full=args.full, batch_size=args.batch_size)
+    print(f"Exported {sum(counts.values())} rows across {len(counts)} provinces to {args.output_dir}")
@@ -0,0 +1,14 @@
+from database.postgresqldb import PostgreSQLDB
+
+db = PostgreSQLDB()
+
+def get_crawl_state() -> dict:
+    "Returns the crawl state of every province ({province_id: {...}}) in a single query."
+    rows = db.select({
+        'table': 'provinces',
+        'fields': ['province_id', 'fetched_pages', 'total_pages', 'is_fetched']
+    })
+    return {row['province_id']: row for row in rows}
+
+# # Example usage
+# print(get_crawl_state()[29])
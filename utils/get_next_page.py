@@ -1,11 +1,12 @@
-from database.postgresqldb import PostgreSQLDB, RawSQL
+from database.postgresqldb import PostgreSQLDB
 
 db = PostgreSQLDB()
 
 def get_next_page(province_id: int = -1):
-    cities = db.select({
-        'table': 'cities',
-        'fields': ['city_id'],
+    # fetched_pages se confirma junto con los anuncios de cada página, así que basta con leer la provincia
+    result = db.select({
+        'table': 'provinces',
+        'fields': ['fetched_pages'],
         'filters': {
             'where': {
                 'field': 'province_id',
@@ -14,24 +15,10 @@ def get_next_page(province_id: int = -1):
             }
         }
     })
-    city_ids = [city['city_id'] for city in cities]
+    last_page = result[0]['fetched_pages'] if result else None
 
-    ads_query = {
-        'table': 'ads_data',
-        'fields': [RawSQL("MAX(page_number)")],
-        'filters': {
-            'where': [{
-                'field': 'city_id',
-                'operator': 'IN',
-                'value': city_ids
-            }]
-        }
-    }
-    result = db.select(ads_query)
-    last_page = result[0]['max']
-
-    return last_page + 1 if last_page is not None else 1
+    return last_page + 1 if last_page else 1
 
 # # Example usage
 # if __name__=='__main__':
-#     print(get_last_inserted_page(province_id = 1)
\ No newline at end of file
+#     print(get_next_page(province_id = 1))
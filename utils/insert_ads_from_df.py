@@ -1,10 +1,13 @@
-from database.postgresqldb import PostgreSQLDB, RawSQL
-from modules.location_matcher import LocationMatcher
-from utils.get_city_from_coordinates import get_city_from_coordinates
+from database.postgresqldb import PostgreSQLDB
+from modules.coordinate_cache import get_coordinate_cache
+from modules.location_matcher import get_location_matcher
+from modules.municipality_aliases import get_municipality_aliases
+from modules.poi_layers import DEFAULT_LAYERS
+from utils.match_cities import match_cities, REQUIRED_FIELDS, CITY_MATCH_FIELDS, CITY_MATCH_COLUMN
+import numpy as np
 import pandas as pd
 
-db = PostgreSQLDB()
-lm = LocationMatcher()
+db = PostgreSQLDB()  # El pool de conexiones se abre en la primera consulta
 
 FLOOR_TYPE_MAP = {
     'FIRST_FLOOR': 1,
@@ -12,82 +15,113 @@ FLOOR_TYPE_MAP = {
     'TOP_FLOOR': 3
 }
 
-def safe_int(value):
-    return int(value) if pd.notna(value) else None
-
-def safe_float(value):
-    return float(value) if pd.notna(value) else None
-
-def safe_bool(value) -> bool:
-    return bool(int(value)) if pd.notna(value) else False
-
-def insert_ads_from_df(input_df: pd.DataFrame):
-    "Inserts the rows from input_df and returns the correct inserted rows."
-
-    required_fields = ['price', 'ccaa', 'province', 'municipality', 'longitude', 'latitude']
-
-    status_list = []
-
-    for idx, row in input_df.iterrows():
-        missing_fields = [field for field in required_fields if pd.isna(row.get(field))]
-        
-        if missing_fields:
-            continue
-
-        if safe_int(row.get('propertySubtype',1)) == 9: # Anuncio de parcela/terreno, no aplica
-            continue
-
-        city_params = lm.match_location(row['ccaa'], row['province'], row['municipality'])
-
+INT_COLUMNS = {
+    'page_number': 'page_number',
+    'price': 'price',
+    'surface': 'surface',
+    'rooms': 'rooms',
+    'bathrooms': 'bathrooms',
+    'zip_code': 'zipCode',
+    'conservation_status': 'conservationStatus',
+    'antiquity': 'antiquity',
+    'orientation': 'orientation',
+}
+BOOL_COLUMNS = ['terrace', 'parking', 'elevator', 'swimming_pool', 'garden', 'air_conditioner', 'heater', 'balcony']
+DISTANCE_COLUMNS = [f'{layer}_distance' for layer in DEFAULT_LAYERS]
+
+def _column(df: pd.DataFrame, column: str) -> pd.Series:
+    return df[column] if column in df else pd.Series(np.nan, index=df.index)
+
+def to_int(values: pd.Series, round_values: bool = False) -> pd.Series:
+    numbers = pd.to_numeric(values, errors='coerce')
+    return (numbers.round() if round_values else np.trunc(numbers)).astype('Int64')
+
+def to_bool(values: pd.Series) -> pd.Series:
+    return pd.to_numeric(values, errors='coerce').fillna(0) != 0
+
+def resolve_city_ids(df: pd.DataFrame) -> pd.Series:
+    """
+    Devuelve el city_id de cada anuncio (NA si no se ha podido resolver).
+    Si df trae la columna CITY_MATCH_COLUMN (calculada en el pool de enriquecimiento) se usa en lugar de resolver aquí;
+    las filas que el pool no resolvió (tenían alias al enviarse la página) y ya no lo tienen se resuelven aquí.
+    """
+    rows = list(df[CITY_MATCH_FIELDS].itertuples(index=False, name=None))
+    aliases = get_municipality_aliases()
+
+    # Primero los alias ya aprendidos; el resto de ternas (ccaa, provincia, municipio) se resuelven en un único lote
+    results = [aliases.lookup(ccaa, province, municipality) for ccaa, province, municipality, _, _ in rows]
+    pending = [i for i, city_params in enumerate(results) if city_params is None]
+    matches = [None] * len(pending)
+    if CITY_MATCH_COLUMN in df:
+        precomputed = df[CITY_MATCH_COLUMN].tolist()
+        matches = [precomputed[i] for i in pending]
+    missing = [j for j, match in enumerate(matches) if match is None]
+    if missing:
+        computed = match_cities(get_location_matcher(), [rows[pending[j]] for j in missing], get_coordinate_cache())
+        for j, match in zip(missing, computed):
+            matches[j] = match
+
+    for i, (city_params, source) in zip(pending, matches):
+        results[i] = city_params
         if city_params['guess'] is None:
-            # Posiblemente en municipality esté un nombre no oficial (urbanización, barrio...) en lugar del nombre de a ciudad
-            city_name = get_city_from_coordinates(latitude=row['latitude'], longitude=row['longitude']) 
-
-            if city_name:
-                city_params = lm.match_location(row['ccaa'], row['province'], city_name)
-
-            if city_params['guess'] is None:
-                print(f"No city guess available for ad_id {idx}")
-                continue
-
-        floor_type_raw = row.get('floorType')
-        floor_type = FLOOR_TYPE_MAP.get(floor_type_raw, None)
-
-        input_params = {
-            'table': 'ads_data',
-            'values': {
-                'ad_id': safe_int(idx),  # 'id' comes from index
-                'page_number': safe_int(row.get('page_number')),
-                'price': safe_int(row.get('price')),
-                'surface': safe_int(row.get('surface')),
-                'rooms': safe_int(row.get('rooms')),
-                'bathrooms': safe_int(row.get('bathrooms')),
-                'zip_code': safe_int(row.get('zipCode')),
-                'location': RawSQL(f"ST_SetSRID(ST_MakePoint({row['longitude']}, {row['latitude']}), 4326)"),
-                'conservation_status': safe_int(row.get('conservationStatus')),
-                'antiquity': safe_int(row.get('antiquity')),
-                'floor_type': floor_type,
-                'orientation': safe_int(row.get('orientation')),
-                'terrace': safe_bool(row.get('terrace')),
-                'parking': safe_bool(row.get('parking')),
-                'elevator': safe_bool(row.get('elevator')),
-                'swimming_pool': safe_bool(row.get('swimming_pool')),
-                'garden': safe_bool(row.get('garden')),
-                'air_conditioner': safe_bool(row.get('air_conditioner')),
-                'heater': safe_bool(row.get('heater')),
-                'balcony': safe_bool(row.get('balcony')),
-                'bus_distance': safe_float(row.get('bus_distance')),
-                'train_distance': safe_float(row.get('train_distance')),
-                'tram_distance': safe_float(row.get('tram_distance')),
-                'city_id': int(city_params['guess_id'])
-            }
-        }
-        status, _ = db.insert(params=input_params)
-        status_list.append(status)
-
-    return sum(status_list)
+            continue
+        if source == 'spatial' or city_params['score'] < 100:
+            aliases.learn(*rows[i][:3], city_params, source=source)
+
+    return pd.Series([r['guess_id'] for r in results], index=df.index, dtype='Int64')
+
+def build_ads_frame(input_df: pd.DataFrame) -> pd.DataFrame:
+    "Validates and transforms input_df into the ads_data columns, dropping rows that cannot be stored."
+
+    df = input_df[input_df.reindex(columns=REQUIRED_FIELDS).notna().all(axis=1)]
+    df = df[to_int(_column(df, 'propertySubtype')).fillna(1) != 9]  # Anuncio de parcela/terreno, no aplica
+
+    city_ids = resolve_city_ids(df)
+    for idx in city_ids[city_ids.isna()].index:
+        print(f"No city guess available for ad_id {idx}")
+    df = df[city_ids.notna()]
+
+    ads = pd.DataFrame({'ad_id': to_int(pd.Series(df.index, index=df.index))})  # 'id' comes from index
+    for column, source in INT_COLUMNS.items():
+        ads[column] = to_int(_column(df, source))
+    ads['location'] = (
+        "SRID=4326;POINT(" + df['longitude'].astype(float).astype(str) + " " + df['latitude'].astype(float).astype(str) + ")"
+    )
+    ads['floor_type'] = _column(df, 'floorType').map(FLOOR_TYPE_MAP).astype('Int64')
+    for column in BOOL_COLUMNS:
+        ads[column] = to_bool(_column(df, column))
+    for column in DISTANCE_COLUMNS:
+        ads[column] = to_int(_column(df, column), round_values=True)
+    ads['city_id'] = city_ids[city_ids.notna()]
+
+    # Un anuncio repetido en la misma página se queda con su última aparición
+    return ads.drop_duplicates(subset='ad_id', keep='last')
+
+def insert_ads_from_df(input_df: pd.DataFrame, progress: dict = None) -> dict:
+    """
+    Upserts the rows from input_df in one transaction and returns the inserted/updated/unchanged counts.
+    If given, the progress update params are committed in that same transaction.
+    """
+
+    ads = build_ads_frame(input_df)
+    if ads.empty:
+        if progress:
+            db.update(progress)
+        return {'inserted': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+
+    # Tipos nativos de Python (None en lugar de NA) para el COPY
+    columns = [ads[c].astype(object).where(ads[c].notna(), None).tolist() for c in ads.columns]
+    return db.bulk_upsert({
+        'table': 'ads_data',
+        'columns': list(ads.columns),
+        'rows': zip(*columns),
+        'conflict': ['ad_id'],
+        # page_number solo indica dónde apareció el anuncio; no cuenta como cambio de contenido
+        'update': [c for c in ads.columns if c not in ('ad_id', 'page_number')],
+        'then': [progress] if progress else []
+    })
 
 # # Example usage
 # if __name__ == "__main__":
 #     df_alava = pd.read_csv(os.path.join(os.getcwd(), 'old', 'fotocasa_data_Araba_Álava.csv'))
-#     insert_ads_from_df(input_df=df_alava)
+#     print(insert_ads_from_df(input_df=df_alava))
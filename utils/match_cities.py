@@ -0,0 +1,36 @@
+from utils.get_city_from_coordinates import get_cities_from_coordinates
+
+REQUIRED_FIELDS = ['price', 'ccaa', 'province', 'municipality', 'longitude', 'latitude']
+CITY_MATCH_FIELDS = ['ccaa', 'province', 'municipality', 'latitude', 'longitude']
+CITY_MATCH_COLUMN = 'city_match'  # (city_params, source) ya resuelto fuera, p. ej. en el pool de enriquecimiento
+
+def match_cities(matcher, rows, cache=None) -> list:
+    """
+    Resuelve el municipio de cada fila (ccaa, province, municipality, latitude, longitude) sin tocar
+    la base de datos: primero todas por nombre en un único lote y, las que no casan, por el recinto
+    municipal que contiene sus coordenadas (memorizado en cache, un CoordinateCache, si se da).
+    Devuelve [(city_params, source)] con source 'fuzzy' o 'spatial'.
+    """
+    results = [(city_params, 'fuzzy') for city_params in matcher.match_locations([row[:3] for row in rows])]
+
+    # Posiblemente en municipality esté un nombre no oficial (urbanización, barrio...) en lugar del nombre de a ciudad.
+    # Se resuelven por coordenadas todos los anuncios de la página a la vez.
+    unmatched = [i for i, (city_params, _) in enumerate(results) if city_params['guess'] is None]
+    if unmatched:
+        latitudes = [rows[i][3] for i in unmatched]
+        longitudes = [rows[i][4] for i in unmatched]
+        if cache is None:
+            city_names = get_cities_from_coordinates(latitudes=latitudes, longitudes=longitudes)
+        else:
+            city_names = cache.cities(latitudes, longitudes, get_cities_from_coordinates)
+        resolved = [(i, city_name) for i, city_name in zip(unmatched, city_names) if city_name]
+        retries = matcher.match_locations([(rows[i][0], rows[i][1], city_name) for i, city_name in resolved])
+        for (i, _), city_params in zip(resolved, retries):
+            results[i] = (city_params, 'spatial')
+
+    return results
+
+# # Example usage
+# if __name__ == '__main__':
+#     from modules.location_matcher import LocationMatcher
+#     print(match_cities(LocationMatcher(), [('Andalucía', 'Málaga', 'Nueva Andalucía', 36.4977, -4.9551)]))
@@ -2,8 +2,8 @@ from database.postgresqldb import PostgreSQLDB
 
 db = PostgreSQLDB()
 
-def update_current_page_on_province(province_index: int = -1, current_page: int = -1):
-    params = {
+def current_page_params(province_index: int = -1, current_page: int = -1) -> dict:
+    return {
         'table': 'provinces',
         'values': {
             'fetched_pages': current_page
@@ -16,7 +16,9 @@ def update_current_page_on_province(province_index: int = -1, current_page: int
             }
         }
     }
-    db.update(params)
+
+def update_current_page_on_province(province_index: int = -1, current_page: int = -1):
+    db.update(current_page_params(province_index, current_page))
 
 # # # Example usage
 # update_current_page_on_province(province_index=1, current_page=100)
\ No newline at end of file